@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compare reading and writing gettext catalogs with polib and with omnigraffle.po
+on a synthetic catalog:
+
+    $ python benchmarks/po_benchmark.py --entries 150000
+"""
+
+from __future__ import print_function
+
+import argparse
+import gc
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import polib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from omnigraffle.po import POTWriter, iter_translations  # noqa: E402
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+
+def messages(count):
+    """Yield (locations, text) like the messages extracted from a large project."""
+    for i in range(count):
+        text = u'Text number %d on a canvas' % i
+        if i % 10 == 0:
+            text += u'\nwith a "second" line – ümlaut'
+        yield ['diagram-%d.graffle/canvas-%d' % (i // 50, i % 7)], text
+
+
+def write_catalog(path, count):
+    """Write a PO file with count entries, some of them fuzzy, untranslated or obsolete."""
+    with io.open(path, 'w', encoding='utf-8') as fp:
+        writer = POTWriter(fp)
+        for i, (locations, text) in enumerate(messages(count)):
+            if i % 100 == 1:
+                writer.write(text, msgstr=u'', occurrences=locations)
+            elif i % 100 == 2:
+                writer.write(text, msgstr=text.upper(), occurrences=locations, flags=['fuzzy'])
+            else:
+                writer.write(text, msgstr=text.upper(), occurrences=locations)
+        fp.write(u'#~ msgid "obsolete"\n#~ msgstr "veraltet"\n')
+
+
+def measure(function):
+    """Return the result of function, the time it took and its peak memory in MB (None on Python 2)."""
+    gc.collect()
+    if tracemalloc:
+        tracemalloc.start()
+    start = time.time()
+    result = function()
+    elapsed = time.time() - start
+    peak = None
+    if tracemalloc:
+        peak = tracemalloc.get_traced_memory()[1] / 1024.0 / 1024.0
+        tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def read_polib(path):
+    return dict((e.msgid, e.msgstr) for e in polib.pofile(path).translated_entries() if not e.obsolete)
+
+
+def read_streaming(path):
+    return dict((msgid, msgstr) for msgid, msgstr, dummy in iter_translations(path))
+
+
+def write_polib(path, count):
+    pot = polib.POFile()
+    for locations, text in messages(count):
+        pot.append(polib.POEntry(msgid=text, msgstr=text,
+                                 occurrences=[(location, '0') for location in locations]))
+    pot.save(path)
+
+
+def write_streaming(path, count):
+    with io.open(path, 'w', encoding='utf-8') as fp:
+        writer = POTWriter(fp)
+        for locations, text in messages(count):
+            writer.write(text, occurrences=locations)
+
+
+def report(name, elapsed, peak):
+    memory = ' %8.1f MB' % peak if peak is not None else ''
+    print('%-24s %8.2f s%s' % (name, elapsed, memory))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark reading and writing PO files.')
+    parser.add_argument('--entries', type=int, default=150000,
+                        help='number of entries of the synthetic catalog (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        po_file = os.path.join(tmpdir, 'all.po')
+        write_catalog(po_file, args.entries)
+        print('%d entries, %.1f MB' % (args.entries, os.path.getsize(po_file) / 1024.0 / 1024.0))
+
+        expected, elapsed, peak = measure(lambda: read_polib(po_file))
+        report('read: polib', elapsed, peak)
+        result, elapsed, peak = measure(lambda: read_streaming(po_file))
+        report('read: iter_translations', elapsed, peak)
+        if result != expected:
+            print('ERROR: translations differ')
+            sys.exit(1)
+
+        dummy, elapsed, peak = measure(lambda: write_polib(os.path.join(tmpdir, 'polib.pot'), args.entries))
+        report('write: polib', elapsed, peak)
+        dummy, elapsed, peak = measure(lambda: write_streaming(os.path.join(tmpdir, 'streaming.pot'), args.entries))
+        report('write: POTWriter', elapsed, peak)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
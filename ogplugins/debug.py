@@ -25,4 +25,4 @@ def main(document, config, canvas=None):
             pdb.set_trace()
 
     d = Document(document)
-    d.walk(debug)
+    d.walk(debug, scope=canvas)
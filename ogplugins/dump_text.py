@@ -27,15 +27,13 @@ def main(document, config, canvas=None):
                 fp.write(element.name)
                 fp.write('\n')
 
-        def dump_canvas(c):
-            cv = Canvas(c)
+        def dump_canvas(cv):
             fp.write("\n\n-------------------------------\n")
             fp.write(cv.name)
             fp.write("\n-------------------------------\n\n")
-            cv.walk(dump_text)
+            cv.walk(dump_text, scope=canvas)
 
-        if canvas:
-            dump_canvas(canvas)
-        else:
-            for c in document.canvases():
-                dump_canvas(c)
+        for c in document.canvases():
+            cv = Canvas(c)
+            if not canvas or canvas.includes_canvas(cv):
+                dump_canvas(cv)
@@ -12,9 +12,7 @@ $ ogtool run-plugin list_nodes ./tests/color-test.graffle  --noconfig --canvas m
 from functools import partial
 from collections import defaultdict
 
-import appscript
-
-from omnigraffle.data_model import Document
+from omnigraffle.data_model import Document, CommandError
 
 
 def main(document, config, canvas=None):
@@ -24,7 +22,7 @@ def main(document, config, canvas=None):
             print element.text
         try:
             element.item.id()
-        except appscript.reference.CommandError:
+        except CommandError:
             return  # some elements (e.g. Document) have no id
         print element.info, element.__class__
         nodes['%s (%s)' % (element.item.id(), element.__class__)] += 1
@@ -33,7 +31,7 @@ def main(document, config, canvas=None):
     nodes = defaultdict(int)
     ids = defaultdict(int)
     d = Document(document)
-    d.walk(partial(list_nodes, nodes))
+    d.walk(partial(list_nodes, nodes), scope=canvas)
 
     for i in sorted(ids.keys()):
         print i, ids[i]
@@ -36,4 +36,4 @@ def main(document, config, canvas=None):
                     element.text.font.set(new_font)
 
     d = Document(document)
-    d.walk(partial(replace, config))
+    d.walk(partial(replace, config), scope=canvas)
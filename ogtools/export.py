@@ -1,16 +1,40 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+from __future__ import print_function
+
 import argparse
+from collections import OrderedDict
+from fnmatch import fnmatchcase
+import itertools
+import json
+import logging
+import multiprocessing
 import os
 import shutil
+import socket
 import sys
+import tempfile
 
 from textwrap import dedent
 
-import appscript
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
 
+from omnigraffle import data_model
+from omnigraffle import fingerprint
+from omnigraffle.backend import ExportSettings
+from omnigraffle import pdf
+from omnigraffle import svg
 from omnigraffle.command import OmniGraffleSandboxedCommand
+from omnigraffle import output_cache
+from omnigraffle.pipeline import Pipeline
+from ogtools.export_manifest import ExportManifest
+
+# errors of an export that are reported to the user (and end it), instead of a traceback
+EXPORT_ERRORS = (RuntimeError, EnvironmentError, data_model.CommandError)
 
 """
 Planned extensions:
@@ -18,7 +42,7 @@ Planned extensions:
 
 * add defaults for scale (1.0) and resolution (1.94444441795)
 * add option for html image type: jpg, png, tiff
-* find out why HTML and SVG export is not working
+* find out why HTML export is not working
 * export all files in a folder
 
 File naming:
@@ -27,6 +51,8 @@ File naming:
 1. Single Canvas Export:
     * target filename has proper format extension: export to that filename (create dirs along the way)
     * target filename has no extension: create folder if necessary, and export to "Canvas Name" in that folder
+    * several formats (e.g. png,pdf) and target filename for one of them (e.g. foo.png): export to that
+      filename with the extension of each format (foo.png, foo.pdf)
 
 2. Multipage File:
     * target filename has proper format extension: export to that filename (create dirs along the way)
@@ -34,6 +60,41 @@ File naming:
 
 3. Multi Canvas Export:
     * treat target as folder, create one file per canvas inside
+
+With --resolutions (e.g. 1,2,3), raster formats are exported once per canvas at the highest
+resolution, the other resolutions are downsampled from that file (requires Pillow, otherwise
+each resolution is exported by OmniGraffle). Files get a suffix for resolutions other than 1,
+e.g. 'canvas@2x.png'. GIFs are resampled in full color and get a new palette.
+
+Exports are done one at a time, moving exported files out of OmniGraffle's sandbox is done
+in background threads (see omnigraffle.pipeline) while the next file is exported.
+
+With --split-pdf, pdf is exported like single page formats (one file per canvas): the
+document is exported once as multipage PDF, which is then split into one PDF per canvas.
+
+SVG is not exported by OmniGraffle but rendered from the .graffle file (see omnigraffle.svg),
+canvas by canvas in parallel. The document is not opened if only SVG is exported.
+
+Incremental export (--incremental):
+-----------------------------------
+
+Each exported file is recorded in a manifest in the target folder, together with
+a fingerprint of the canvas (computed from the .graffle file, see omnigraffle.fingerprint)
+and the export settings. Only files whose fingerprint changed are exported again (multi
+canvas exports are done canvas by canvas), the document is not even opened if all files
+are up to date. Files exported from canvases that no longer exist are removed.
+
+Output cache (--cache):
+-----------------------
+
+Exported files are also stored in a cache shared by all exports (see omnigraffle.output_cache),
+keyed by the same fingerprint and the version of OmniGraffle. Files found in the cache are
+linked (or copied) instead of exported, multi canvas exports are done canvas by canvas. The
+cache is managed with 'ogexport cache stats|prune'.
+
+To find out if all files are in the cache without connecting to (and launching) OmniGraffle,
+the version and export settings of OmniGraffle recorded in the cache by the last export that
+used OmniGraffle are assumed. As soon as a file has to be exported, OmniGraffle is asked.
 """
 
 
@@ -49,94 +110,509 @@ class OmniGraffleSandboxedExporter(OmniGraffleSandboxedCommand):
         'png',
         'pdf',
         'psd',  # Photoshop
-        # 'svg' TODO: NOT WORKING (OSERROR -50 "The document cannot be exported to the "scalable vector graphics (SVG)" format.")
+        # OmniGraffle fails with OSERROR -50 "The document cannot be exported to the "scalable vector graphics (SVG)"
+        # format.", so SVG is rendered from the .graffle file (see omnigraffle.svg)
+        'svg',
         'tiff',
         'vdx',  # Visio XML
     ]
     MULTIPAGE_FORMATS = ('pdf', 'vdx')
-
-    def __init__(self, args=None):
-        super(OmniGraffleSandboxedExporter, self).__init__(args)
-        self.settings_backup = {}
+    RASTER_FORMATS = ('bmp', 'gif', 'jpg', 'png', 'tiff')
+    OFFLINE_FORMATS = ('svg',)  # rendered without OmniGraffle
+
+    def __init__(self, args=None, backend=None):
+        super(OmniGraffleSandboxedExporter, self).__init__(args, backend)
+        self._export_settings = None
+        self._app_state = None
+        self._assume_recorded_state = False  # see application_state()
+        self._canvas_index = None
+        self._canvas_index_doc = None
+        self._fingerprints = None
+        self._sandbox_names = itertools.count(1)
+        self.pipeline = None
+        self.manifest = None
+        if self.args.incremental:
+            self.manifest = ExportManifest(self.target_directory())
+        self.cache = None
+        self._cache_outputs = []  # (path, key) of exported files to add to the cache
+        if self.args.cache:
+            self.cache = output_cache.OutputCache(self.args.cache_dir, self.args.cache_size)
+
+    @property
+    def export_settings(self):
+        """The ExportSettings of OmniGraffle, connects to OmniGraffle on first use."""
+        if self._export_settings is None:
+            self._export_settings = ExportSettings(self.backend)
+        return self._export_settings
+
+    @export_settings.setter
+    def export_settings(self, settings):
+        self._export_settings = settings
 
     def _check_args(self):
-        self.args.format = self.args.format.lower()
-
-        if self.args.format not in self.EXPORT_FORMATS:
-            argparse.ArgumentParser.error(
-                "format '%s' not supported." % self.args.format)
-            sys.exit(1)
+        self.formats = [f.strip().lower() for f in self.args.format.split(',') if f.strip()]
+        self.args.format = self.formats[0] if self.formats else ''
+
+        for export_format in self.formats or ['']:
+            if export_format not in self.EXPORT_FORMATS:
+                print("ERROR: format '%s' not supported." % export_format)
+                sys.exit(1)
+
+        self.resolutions = None
+        if self.args.resolutions:
+            try:
+                self.resolutions = sorted(set(float(r) for r in self.args.resolutions.split(',') if r.strip()))
+            except ValueError:
+                self.resolutions = []
+            if not self.resolutions or min(self.resolutions) <= 0:
+                print("ERROR: invalid resolutions '%s'." % self.args.resolutions)
+                sys.exit(1)
+            if self.args.resolution:
+                print("ERROR: use either --resolution or --resolutions.")
+                sys.exit(1)
+            # export at the highest resolution, the others are downsampled
+            self.args.resolution = self.resolutions[-1]
 
     def export(self):
 
+        self._assume_recorded_state = self.cache is not None
+        try:
+            up_to_date = not self.needs_application()
+        except EXPORT_ERRORS as e:
+            print("ERROR: %s" % e)
+            sys.exit(1)
+        if up_to_date:
+            # nothing to export by OmniGraffle, don't open the document (but render offline
+            # formats, get files from the cache, remove files of deleted canvases)
+            try:
+                self.export_document()
+            except EXPORT_ERRORS as e:
+                print("ERROR: %s" % e)
+                sys.exit(1)
+            return
+        # OmniGraffle is needed anyway: ask it for its version and settings
+        self._assume_recorded_state = False
+        self._app_state = None
         self.backup_current_export_settings()
         self.open_document()
         self.set_export_settings()
 
+        try:
+            self.export_document()
+        except EXPORT_ERRORS as e:
+            print("ERROR: %s" % e)
+            self.restore_saved_export_settings()
+            sys.exit(1)
+
+        # close window and restore settings
+        self.og.windows.first().close()
+        self.restore_saved_export_settings()
+
+    def export_document(self):
+        """Export the open document (self.doc) to all formats requested by the arguments."""
+        if self.args.verbose:
+            print(self.args.source)
+        self.pipeline = Pipeline()
+        try:
+            for export_format in self.formats:
+                self.export_format(export_format)
+        finally:
+            errors = self.pipeline.close()
+            self.pipeline = None
+            for output, error in errors:
+                print("ERROR: %s: %s" % (output, error))
+                if self.manifest is not None:
+                    self.manifest.forget(output)
+            if self.manifest is not None:
+                self.manifest.save()
+        self.store_in_cache(errors)
+        if errors:
+            raise RuntimeError('%d exported files failed' % len(errors))
+
+    def post_process(self, output, func, *args):
+        """Run func(*args) after output was exported, in the background if possible."""
+        if self.pipeline is None:
+            func(*args)
+        else:
+            self.pipeline.submit(output, func, *args)
+
+    def wait_for_post_processing(self):
+        if self.pipeline is not None:
+            self.pipeline.wait()
+
+    def export_format(self, export_format):
+        """Export the open document (self.doc) to export_format."""
+        if self.args.incremental:
+            jobs = self.stale_jobs(export_format)
+            if self.args.verbose:
+                print('%s: %d files up to date' % (export_format, len(self.jobs(export_format)) - len(jobs)))
+        else:
+            jobs = self.jobs(export_format)
+        if self.cache is not None:
+            jobs = [job for job in jobs if not self.restore_from_cache(job)]
+        if export_format in self.OFFLINE_FORMATS:
+            self.export_offline(jobs)
+        elif self.split_pdf(export_format) and len(jobs) > 1:
+            self.export_split(jobs)
+        elif self.multiple_resolutions(export_format):
+            self.export_resolutions(jobs)
+        else:
+            for job in jobs:
+                self.run_job(job)
+        if self.args.incremental:
+            outputs = dict((path, job[3]) for job in self.jobs(export_format)
+                           for path, resolution in self.outputs(job))
+            for path in self.manifest.prune(self.args.source, export_format, self.fingerprints(), outputs):
+                print('removed', path)
+
+    def run_job(self, job):
+        """Export one file (or folder) planned by jobs()."""
+        self.export_job(job)
+        self.record(job)
+
+    def export_job(self, job):
+        export_format, directory, fname, canvas = job
+        if canvas is not None:
+            self.export_canvas(export_format, directory, fname, canvas)
+        elif fname is None:
+            self.set_area_type('entire_document')
+            self.export_dir(export_format, directory)
+        else:
+            self.set_area_type('entire_document')
+            self.export_file(export_format, directory, fname)
+
+    def record(self, job, from_cache=False):
+        """Record the exported files in the manifest (for incremental exports) and for the cache."""
+        export_format, directory, fname, canvas = job
+        if self.args.incremental:
+            for path, resolution in self.outputs(job):
+                self.manifest.record(path, self.args.source, canvas, export_format,
+                                     self.job_fingerprint(job, resolution))
+        if self.cache is not None and fname is not None and not from_cache:
+            self._cache_outputs.extend((path, self.cache_key(job, resolution))
+                                       for path, resolution in self.outputs(job))
+
+    def cache_key(self, job, resolution=None):
+        if job[0] in self.OFFLINE_FORMATS:
+            version = 'svg-%s' % svg.VERSION
+        else:
+            version = self.application_state()['version']
+        return self.cache.key('ogexport', version, self.job_fingerprint(job, resolution))
+
+    # export settings of OmniGraffle that affect the exported files
+    APPLICATION_SETTINGS = ('border_amount', 'include_border', 'export_scale', 'resolution')
+
+    def application_state(self):
+        """
+        The version and the export settings (APPLICATION_SETTINGS) of OmniGraffle, read once. While
+        export() plans an export that may be served from the cache, the state recorded in the
+        cache is assumed instead (if there is one), so OmniGraffle is not connected to.
+        """
+        if self._app_state is None and self._assume_recorded_state:
+            try:
+                with open(self.application_state_file()) as fp:
+                    self._app_state = json.load(fp)
+            except (IOError, OSError, ValueError):
+                pass
+        if self._app_state is None:
+            for name in self.APPLICATION_SETTINGS:
+                self.export_settings.get(name)
+            # the settings before this export changed them, the version is only used by the cache
+            state = dict(version=self.backend.version() if self.cache is not None else None,
+                         settings=dict((name, self.export_settings.original[name])
+                                       for name in self.APPLICATION_SETTINGS))
+            # with the types of a recorded state (e.g. unicode on Python 2), for the same fingerprints
+            self._app_state = json.loads(json.dumps(state))
+            if self.cache is not None:
+                try:
+                    if not os.path.exists(self.cache.directory):
+                        os.makedirs(self.cache.directory)
+                    with open(self.application_state_file(), 'w') as fp:
+                        json.dump(self._app_state, fp)
+                except (IOError, OSError) as e:
+                    logging.debug('cannot record the state of OmniGraffle: %s', e)
+        return self._app_state
+
+    def application_state_file(self):
+        return os.path.join(self.cache.directory, 'omnigraffle.json')
+
+    def cached(self, job):
+        """True if all files of job are in the cache (folders of whole documents are not cached)."""
+        return (self.cache is not None and job[2] is not None and
+                all(self.cache_key(job, resolution) in self.cache for path, resolution in self.outputs(job)))
+
+    def restore_from_cache(self, job):
+        """Get the files of job from the cache, return False if they are not all cached."""
+        if not self.cached(job):
+            return False
+        for path, resolution in self.outputs(job):
+            if not self.cache.get(self.cache_key(job, resolution), path):
+                return False  # evicted meanwhile
+            if self.args.verbose:
+                print('%s: from cache' % path)
+        self.record(job, from_cache=True)
+        return True
+
+    def store_in_cache(self, errors=()):
+        """Add the files exported without errors (output, error) to the cache, after post-processing is done."""
+        failed = set(output for output, error in errors)
+        for path, key in self._cache_outputs:
+            if path not in failed and os.path.isfile(path):
+                self.cache.put(key, path)
+        self._cache_outputs = []
+
+    def multiple_resolutions(self, export_format):
+        """True if export_format is exported in several resolutions."""
+        return self.resolutions is not None and export_format in self.RASTER_FORMATS
+
+    def outputs(self, job):
+        """The files exported for job as list of (path, resolution), resolution is None if not --resolutions."""
+        export_format, directory, fname, canvas = job
+        if not self.multiple_resolutions(export_format):
+            return [(os.path.join(directory, fname), None)]
+        root, ext = os.path.splitext(fname)
+        return [(os.path.join(directory, fname if r == 1 else '%s@%gx%s' % (root, r, ext)), r)
+                for r in self.resolutions]
+
+    def export_resolutions(self, jobs):
+        """Export each job in the highest resolution, and downsample the other resolutions."""
+        highest = self.resolutions[-1]
+        tasks = []
+        for job in jobs:
+            export_format, directory, fname, canvas = job
+            outputs = self.outputs(job)
+            if Image is None:
+                logging.info('Pillow is not installed, exporting each resolution')
+                for path, resolution in outputs:
+                    self.export_settings.set('resolution', resolution)
+                    self.export_job((export_format, directory, os.path.basename(path), canvas))
+                self.export_settings.set('resolution', highest)
+            else:
+                master = outputs[-1][0]
+                self.export_job((export_format, directory, os.path.basename(master), canvas))
+                tasks.extend((master, path, resolution / highest) for path, resolution in outputs[:-1])
+            self.record(job)
+        self.wait_for_post_processing()
+        downsample_all(tasks)
+
+    def export_offline(self, jobs):
+        """Render the canvases of jobs from the .graffle file (in parallel), without OmniGraffle."""
+        if not jobs:
+            return
+        outputs = OrderedDict()
+        for job in jobs:
+            export_format, directory, fname, canvas = job
+            path = os.path.join(directory, fname)
+            output_cache.detach(path)
+            outputs[canvas] = path
+        try:
+            svg.render_canvases(self.args.source, outputs, scale=self.args.scale or 1.0,
+                                background=not self.args.transparent)
+        except (KeyError, IOError, OSError, ValueError) as e:
+            raise RuntimeError('cannot render %s: %s' % (self.args.source, e))
+        for job in jobs:
+            self.record(job)
+
+    def split_pdf(self, export_format):
+        """True if PDFs of single canvases are split from a PDF of the whole document."""
+        return export_format == 'pdf' and self.args.split_pdf
+
+    def export_split(self, jobs):
+        """Export the document once as multipage PDF and split it into the PDFs of the canvases in jobs."""
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            self.set_area_type('entire_document')
+            self.export_file('pdf', tmp_dir, 'document.pdf')
+            self.wait_for_post_processing()
+            try:
+                with open(os.path.join(tmp_dir, 'document.pdf'), 'rb') as fp:
+                    data = fp.read()
+            except IOError as e:
+                raise RuntimeError('cannot read exported PDF: %s' % e)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+        names = self.canvas_names()
+        try:
+            reader = pdf.PDFReader(data)
+            pages = reader.pages()
+            if len(pages) != len(names):
+                raise pdf.PDFError('%d pages for %d canvases' % (len(pages), len(names)))
+        except pdf.PDFError as e:
+            logging.warning('cannot split PDF of %s (%s), exporting canvas by canvas', self.args.source, e)
+            for job in jobs:
+                self.run_job(job)
+            return
+
+        for job in jobs:
+            export_format, directory, fname, canvas = job
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+            output_cache.detach(os.path.join(directory, fname))
+            with open(os.path.join(directory, fname), 'wb') as fp:
+                fp.write(pdf.extract_page(reader, pages, names.index(canvas)))
+            self.record(job)
+
+    def target_directory(self):
+        """The folder to export to (target, or the folder of target if it is a file name)."""
+        target = os.path.abspath(self.args.target)
+        if os.path.splitext(target)[1][1:].lower() in self.formats:
+            return os.path.dirname(target)
+        return target
+
+    def fingerprints(self):
+        """Fingerprints of the canvases of the source document by canvas name."""
+        if self._fingerprints is None:
+            self._fingerprints = fingerprint.canvas_fingerprints(self.args.source)
+        return self._fingerprints
+
+    def reads_file(self):
+        """True if the export is planned from the .graffle file instead of the open document."""
+        return (self.args.incremental or self.cache is not None or
+                all(f in self.OFFLINE_FORMATS for f in self.formats))
+
+    def needs_application(self):
+        """True if files need to be exported by OmniGraffle, i.e. the document must be opened."""
+        formats = [f for f in self.formats if f not in self.OFFLINE_FORMATS]
+        if not formats:
+            return False
+        if not self.reads_file():
+            return True
+        return any(self.pending_jobs(f) for f in formats)
+
+    def canvas_names(self):
+        """Names of all canvases in the document (read from the file if reads_file())."""
+        if self.reads_file():
+            return list(self.fingerprints())
+        return list(self.canvas_index())
+
+    def effective_settings(self, export_format=None):
+        """The export settings that affect the exported files."""
+        if export_format in self.OFFLINE_FORMATS:
+            return dict(renderer=svg.VERSION, export_scale=self.args.scale or 1.0,
+                        draws_background=not self.args.transparent)
+        settings = dict(self.application_state()['settings'])
+        settings['draws_background'] = not self.args.transparent
+        if self.args.resolution:
+            settings['resolution'] = self.args.resolution
+        if self.args.scale:
+            settings['export_scale'] = self.args.scale
+        return settings
+
+    def job_fingerprint(self, job, resolution=None):
+        export_format, directory, fname, canvas = job
+        if canvas is None:
+            canvases = list(self.fingerprints().values())
+        else:
+            canvases = [self.fingerprints()[canvas]]
+        return fingerprint.combine(export_format, self.effective_settings(export_format), resolution, *canvases)
+
+    def pending_jobs(self, export_format):
+        """The jobs for export_format that need OmniGraffle (i.e. are neither up to date nor cached)."""
+        jobs = self.stale_jobs(export_format) if self.args.incremental else self.jobs(export_format)
+        return [job for job in jobs if not self.cached(job)]
+
+    def stale_jobs(self, export_format):
+        """The jobs for export_format whose files are missing or outdated."""
+        return [job for job in self.jobs(export_format)
+                if not all(self.manifest.is_fresh(path, self.job_fingerprint(job, resolution))
+                           for path, resolution in self.outputs(job))]
+
+    def jobs(self, export_format):
+        """
+        Plan the export to export_format: return a list of (export_format, directory, fname, canvas),
+        canvas is None for exports of the whole document, fname is None for exports of all
+        canvases to the folder directory.
+        """
+
         # removes trailing slash, if present!
         target = os.path.abspath(self.args.target)
-        if self.args.verbose:
-            print self.args.source
 
         def _split_filename(fn, frmt):
-            """Return (directory, filenname) if extension matches frmt, (directory, '') otherwise."""
-            ext = os.path.splitext(target)[1]
-            if not ext or ext[1:].lower() != frmt:
-                return fn, ''
-            else:
+            """
+            Return (directory, filenname) if extension matches frmt (or one of the other formats
+            exported, then filename gets the extension of frmt), (directory, '') otherwise.
+            """
+            root, ext = os.path.splitext(fn)
+            if ext[1:].lower() == frmt:
                 return os.path.split(fn)
+            if ext[1:].lower() in self.formats:
+                # e.g. 'png,pdf ... out/x.png' exports out/x.png and out/x.pdf
+                return os.path.split('%s.%s' % (root, frmt))
+            return fn, ''
 
         if self.args.canvas:
-            # 2. Single Canvas: export to '<target> if filename, else to
-            # <target>/<canvas-name>.<format>'
-            directory, fname = _split_filename(target, self.args.format)
-            if not fname:
-                fname = "%s.%s" % (self.args.canvas, self.args.format)
-            self.export_canvas(
-                self.args.format, directory, fname, self.args.canvas)
-
-        elif self.args.format in self.MULTIPAGE_FORMATS:
+            # 2. Selected Canvases: export a single canvas to '<target> if filename, else
+            # each canvas to <target>/<canvas-name>.<format>'
+            canvases = self.select_canvases(self.args.canvas)
+            directory, fname = _split_filename(target, export_format)
+            if fname and len(canvases) == 1:
+                return [(export_format, directory, fname, canvases[0])]
+            return [(export_format, target, "%s.%s" % (canvas_name, export_format), canvas_name)
+                    for canvas_name in canvases]
+
+        elif export_format in self.MULTIPAGE_FORMATS and not self.split_pdf(export_format):
             # 1. Multipart Format: export to '<target> if filename, else to
             # <target>/<source-filename>.<format>'
 
-            directory, fname = _split_filename(target, self.args.format)
+            directory, fname = _split_filename(target, export_format)
             if not fname:
 
                 dummy, fname = os.path.split(self.args.source)
                 fname = "%s.%s" % (
-                    os.path.splitext(fname)[0], self.args.format)
-            self.export_file(self.args.format, directory, fname)
+                    os.path.splitext(fname)[0], export_format)
+            return [(export_format, directory, fname, None)]
 
-        elif len(self.doc.canvases()) == 1:
+        canvas_names = self.canvas_names()
+        if len(canvas_names) == 1:
             # 3. Only one canvas in file: xport to
             # '<target>/<canvas-name>.<format>'
-            c = self.doc.canvases()[0]
-            canvas_name = c.name()
-            fname = "%s.%s" % (canvas_name, self.args.format)
-            self.export_canvas(self.args.format, target, fname, canvas_name)
-
-        else:
-            # 4. File with multiple canvases: export to '<target>/<source-filename>/'
-            target_path = os.path.join(target, os.path.splitext(os.path.split(self.args.source)[1])[0])
-            self.export_dir(self.args.format, target_path)
-
-        # close window and restore settings
-        self.og.windows.first().close()
-        self.restore_saved_export_settings()
+            fname = "%s.%s" % (canvas_names[0], export_format)
+            return [(export_format, target, fname, canvas_names[0])]
+
+        # 4. File with multiple canvases: export to '<target>/<source-filename>/'
+        target_path = os.path.join(target, os.path.splitext(os.path.split(self.args.source)[1])[0])
+        if (self.args.incremental or self.cache is not None or self.split_pdf(export_format) or
+                self.multiple_resolutions(export_format) or export_format in self.OFFLINE_FORMATS):
+            # canvas by canvas, so that only changed (or not cached) canvases are exported
+            return [(export_format, target_path, "%s.%s" % (canvas_name, export_format), canvas_name)
+                    for canvas_name in canvas_names]
+        return [(export_format, target_path, None, None)]
+
+    def canvas_index(self):
+        """Canvases of the document by name (in document order), fetched once per document."""
+        if self._canvas_index_doc is not self.doc:
+            canvases = self.doc.canvases()
+            names = self.doc.canvases.name()  # one request for all names
+            self._canvas_index = OrderedDict()
+            for name, canvas in zip(names, canvases):
+                self._canvas_index.setdefault(name, canvas)
+            self._canvas_index_doc = self.doc
+        return self._canvas_index
+
+    def select_canvases(self, patterns):
+        """Names of all canvases that have one of the names or match one of the glob patterns."""
+        selected = [name for name in self.canvas_names()
+                    if any(name == p or fnmatchcase(name, p) for p in patterns)]
+        if not selected:
+            raise RuntimeError("canvas '%s' not found in document. List of existing canvases: \n%s" %
+                               ("', '".join(patterns), '\n'.join(self.canvas_names())))
+        return selected
+
+    def set_area_type(self, area_type):
+        """Set the export area (e.g. 'current_canvas'), unless it is already set."""
+        self.export_settings.set('area_type', self.backend.keyword(area_type))
 
     def export_canvas(self, export_format, directory, fname, canvas):
         """Export a single canvas."""
-        self.og.current_export_settings.area_type.set(
-            appscript.k.current_canvas)
-        for c in self.doc.canvases():
-            if c.name() == canvas:
-                self.og.windows.first().canvas.set(c)
-                self.export_file(export_format, directory, fname)
-                return
-        else:
-            print "ERROR: canvas '%s' not found in document. List of existing canvases: \n%s" % (canvas, '\n'.join(self.get_canvas_list()))
-            self.restore_saved_export_settings()
-            sys.exit(1)
+        self.set_area_type('current_canvas')
+        try:
+            c = self.canvas_index()[canvas]
+        except KeyError:
+            raise RuntimeError("canvas '%s' not found in document. List of existing canvases: \n%s" %
+                               (canvas, '\n'.join(self.canvas_index())))
+        self.og.windows.first().canvas.set(c)
+        self.export_file(export_format, directory, fname)
 
     @staticmethod
     def _clear(path):
@@ -150,22 +626,33 @@ class OmniGraffleSandboxedExporter(OmniGraffleSandboxedCommand):
     def _og_export(self, export_format, export_path):
         self.doc.save(as_=export_format, in_=export_path)
 
-    def export_file(self, export_format, directory, fname):
-        """Export to a single file."""
-        export_path = os.path.join(directory, fname)
+    def sandbox_export_path(self, fname):
+        """A unique path in the sandbox, so that files are not overwritten before they are moved out."""
+        return os.path.join(self.get_sandbox_path(), 'ogexport-%d-%s' % (next(self._sandbox_names), fname))
 
-        if self.sandboxed():
-            # export to sandbox
-            export_path = os.path.join(self.get_sandbox_path(), fname)
-            # self._clear(export_path) TODO: is this even necessary?
+    @staticmethod
+    def _move(export_path, target):
+        """Move a file out of the sandbox."""
+        directory = os.path.dirname(target)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        os.rename(export_path, target)
 
-        self._og_export(export_format, export_path)
+    def export_file(self, export_format, directory, fname):
+        """Export to a single file."""
+        target = os.path.join(directory, fname)
 
-        if self.sandboxed():
-            # move back out of sandbox
+        if not self.sandboxed():
             if not os.path.exists(directory):
                 os.makedirs(directory)
-            os.rename(export_path, os.path.join(directory, fname))
+            output_cache.detach(target)  # never write to a file linked to the cache
+            self._og_export(export_format, target)
+            return
+
+        # export to sandbox, and move back out of sandbox in the background
+        export_path = self.sandbox_export_path(fname)
+        self._og_export(export_format, export_path)
+        self.post_process(target, self._move, export_path, target)
 
     def export_dir(self, export_format, directory):
         """
@@ -175,26 +662,23 @@ class OmniGraffleSandboxedExporter(OmniGraffleSandboxedCommand):
         TODO: test when exactly this happens and simplify code
         """
 
-        export_path = directory
-
-        if self.sandboxed():
-            # export to sandbox
-            export_path = os.path.join(self.get_sandbox_path(), os.path.basename(directory))
-            export_path_with_extension = "%s.%s" % (export_path, export_format)
+        if not self.sandboxed():
+            self._og_export(export_format, directory)
+            return
 
+        # export to sandbox
+        export_path = self.sandbox_export_path(os.path.basename(directory))
         self._og_export(export_format, export_path)
 
-        if self.sandboxed():
-            # make dirs if necessary
-            root = os.path.split(directory)[0]
-            if not os.path.exists(root):
-                os.makedirs(root)
-            # move back out o tssandbox
+        def move_dir():
+            # move back out of sandbox
             self._clear(directory)
+            export_path_with_extension = "%s.%s" % (export_path, export_format)
             if os.path.exists(export_path_with_extension):
-                os.rename(export_path_with_extension, directory)
+                self._move(export_path_with_extension, directory)
             else:
-                os.rename(export_path, directory)
+                self._move(export_path, directory)
+        self.post_process(directory, move_dir)
 
     SETTINGS_TO_BACKUP = (
         'area_type',
@@ -209,35 +693,30 @@ class OmniGraffleSandboxedExporter(OmniGraffleSandboxedCommand):
     )
 
     def backup_current_export_settings(self):
-        """Save current export settings so we can restore afterwards."""
-        for setting in self.SETTINGS_TO_BACKUP:
-            # value = self.og.current_export_settings.area_type()
-            self.settings_backup[setting] = getattr(self.og.current_export_settings, setting)()
-
+        """
+        Settings are read when they are changed the first time (see ExportSettings), so
+        they can be restored afterwards. Only display current settings if verbose.
+        """
         if self.args.verbose:
-            # display current export settings
-            for k, v in self.settings_backup.items():
-                print k, v
+            for setting in self.SETTINGS_TO_BACKUP:
+                print(setting, self.export_settings.get(setting))
 
     def restore_saved_export_settings(self):
-        for setting in self.SETTINGS_TO_BACKUP:
-            # self.og.current_export_settings.area_type.set(value)
-            getattr(self.og.current_export_settings, setting).set(self.settings_backup[setting])
+        """Restore the settings changed by the export."""
+        self.export_settings.restore()
 
     def set_export_settings(self):
-        if self.args.transparent:
-            self.og.current_export_settings.draws_background.set(False)
-        else:
-            self.og.current_export_settings.draws_background.set(True)
+        """
+        Set the export settings requested by the arguments, other settings keep (or get back)
+        their original values. Only settings that differ are sent to OmniGraffle.
+        """
+        settings = dict(draws_background=not self.args.transparent)
         if self.args.resolution:
-            self.og.current_export_settings.resolution.set(
-                self.args.resolution)
+            settings['resolution'] = self.args.resolution
         if self.args.scale:
-            self.og.current_export_settings.export_scale.set(self.args.scale)
-
-        # will be overridden in export_canvas() for canvas export
-        self.og.current_export_settings.area_type.set(
-            appscript.k.entire_document)
+            settings['export_scale'] = self.args.scale
+        # the area type is set for each export (see set_area_type)
+        self.export_settings.apply(settings, keep=('area_type',))
 
     def parse_commandline(self):
         """Parse commandline, do some checks and return args."""
@@ -262,27 +741,123 @@ class OmniGraffleSandboxedExporter(OmniGraffleSandboxedCommand):
             """))
 
         parser.add_argument('format', type=str,
-                            help="Export formats: bmp, eps, gif, jpg, png, pdf, psd (Photoshop), tiff, vdx (Visio XML) (not supported: html, svg)")
+                            help="Export formats: bmp, eps, gif, jpg, png, pdf, psd (Photoshop), svg (rendered without "
+                                 "OmniGraffle), tiff, vdx (Visio XML) (not supported: html), several formats can be "
+                                 "separated by commas, e.g. png,pdf")
 
         parser.add_argument('source', type=str,
                             help='an OmniGraffle file')
         parser.add_argument('target', type=str,
                             help='folder to export to')
 
-        parser.add_argument('--canvas', type=str,
-                            help='export canvas with given name')
+        parser.add_argument('--canvas', action='append',
+                            help='export canvas with given name or glob pattern (can be repeated)')
         parser.add_argument('--scale', type=float,
                             help=' The scale to use during export (1.0 is 100%%)')
         parser.add_argument('--resolution', type=float,
                             help='The number of pixels per point in the resulting exported image (1.0 for 72 DPI)')
+        parser.add_argument('--resolutions', metavar='LIST',
+                            help='export raster formats in several resolutions (e.g. 1,2,3), rendered once at the '
+                                 'highest resolution and downsampled (files are named e.g. canvas@2x.png)')
         parser.add_argument('--transparent', dest='transparent', action='store_true',
                             help='export with transparent background')
 
+        parser.add_argument('--split-pdf', action='store_true',
+                            help='export pdf as one file per canvas, split from a single export of the whole document')
+        parser.add_argument('--incremental', action='store_true',
+                            help='only export canvases that changed since the last incremental export, '
+                                 'remove files of deleted canvases')
+        parser.add_argument('--cache', action='store_true',
+                            help="get files exported before from the output cache, add new files to it "
+                                 "(see 'ogexport cache -h')")
+        parser.add_argument('--cache-dir', metavar='DIR', default=output_cache.DEFAULT_DIRECTORY,
+                            help='the output cache directory (default: %(default)s)')
+        parser.add_argument('--cache-size', metavar='MB', type=float,
+                            help='maximum size of the output cache, least recently used files are '
+                                 'removed, kept for later exports (default: the size given last, '
+                                 'initially %d)' % output_cache.DEFAULT_MAX_SIZE)
         parser.add_argument('--verbose', '-v', action='count')
+        parser.add_argument('--server', nargs='?', const=True, metavar='ADDRESS',
+                            help="send the job to a running export server (see 'ogexport serve -h')")
+        OmniGraffleSandboxedExporter.add_backend(parser)
 
         return parser
 
 
+def downsample(task):
+    """Resize the image source by factor and save it as target."""
+    source, target, factor = task
+    try:
+        image = Image.open(source)
+        size = (max(1, int(round(image.size[0] * factor))), max(1, int(round(image.size[1] * factor))))
+        options = {}
+        output_cache.detach(target)
+        if 'dpi' in image.info:
+            options['dpi'] = tuple(d * factor for d in image.info['dpi'])
+        resized = _resize(image, size)
+        if 'transparency' in resized.info:
+            options['transparency'] = resized.info['transparency']
+        resized.save(target, format=image.format, **options)
+    except (IOError, OSError, ValueError) as e:
+        # a RuntimeError with a message, also when raised in a worker process of downsample_all
+        raise RuntimeError('cannot downsample %s: %s' % (source, e))
+
+
+def _resize(image, size):
+    """
+    Resize image with LANCZOS. Palette images (e.g. GIF) are resampled in RGBA and quantized
+    again, a transparent color stays transparent where the resized image is mostly transparent.
+    """
+    if image.mode != 'P':
+        return image.resize(size, Image.LANCZOS)
+    transparent = 'transparency' in image.info
+    rgba = image.convert('RGBA').resize(size, Image.LANCZOS)
+    colors = 255 if transparent else 256
+    resized = rgba.convert('RGB').quantize(colors)
+    if transparent:
+        # the last palette entry is the transparent color
+        resized.paste(colors, mask=rgba.split()[3].point(lambda alpha: 255 if alpha < 128 else 0))
+        resized.info['transparency'] = colors
+    return resized
+
+
+def downsample_all(tasks):
+    """Run the downsample tasks, in a pool of processes if there are several."""
+    if len(tasks) < 2:
+        for task in tasks:
+            downsample(task)
+        return
+    pool = multiprocessing.Pool(min(len(tasks), multiprocessing.cpu_count()))
+    try:
+        pool.map(downsample, tasks)
+    finally:
+        pool.close()
+        pool.join()
+
+
 def main():
-    exporter = OmniGraffleSandboxedExporter()
+    from ogtools import export_server
+
+    if sys.argv[1:2] == ['serve']:
+        export_server.main(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ['cache']:
+        output_cache.main(sys.argv[2:])
+        return
+
+    args = OmniGraffleSandboxedExporter.get_parser().parse_args()
+    if args.server:
+        address = export_server.DEFAULT_ADDRESS if args.server is True else args.server
+        try:
+            response = export_server.request(address, dict(command='export', argv=sys.argv[1:],
+                                                           cwd=os.getcwd()))
+        except socket.error as e:
+            logging.warning("no export server at %s (%s), exporting directly", address, e)
+        else:
+            if response['status'] != 'ok':
+                print("ERROR: %s" % response.get('message'))
+                sys.exit(1)
+            return
+
+    exporter = OmniGraffleSandboxedExporter(args)
     exporter.export()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import os
+
+"""
+Manifest of exported files for 'ogexport --incremental'.
+
+The manifest is stored as MANIFEST_NAME in the target folder and records for
+each exported file the source document, the canvas (None for files that contain
+the whole document), the format and the fingerprint of canvas and export
+settings the file was exported with:
+
+    {"version": 1,
+     "outputs": {"png/canvas-1.png": {"source": "/docs/foo.graffle", "canvas": "canvas-1",
+                                      "format": "png", "fingerprint": "3c1f..."}}}
+
+Paths of outputs are relative to the folder of the manifest.
+"""
+
+MANIFEST_NAME = '.ogexport-manifest.json'
+VERSION = 1
+
+
+class ExportManifest(object):
+
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+        self.path = os.path.join(self.directory, MANIFEST_NAME)
+        self.outputs = {}
+        self.modified = False
+        if os.path.exists(self.path):
+            try:
+                with open(self.path) as fp:
+                    data = json.load(fp)
+            except ValueError as e:
+                logging.warning('ignoring broken manifest %s: %s', self.path, e)
+            else:
+                if data.get('version') == VERSION:
+                    self.outputs = data.get('outputs', {})
+
+    def _key(self, output):
+        return os.path.relpath(os.path.abspath(output), self.directory)
+
+    def is_fresh(self, output, fingerprint):
+        """True if output exists and was exported with fingerprint."""
+        entry = self.outputs.get(self._key(output))
+        return entry is not None and entry['fingerprint'] == fingerprint and os.path.exists(output)
+
+    def record(self, output, source, canvas, export_format, fingerprint):
+        self.outputs[self._key(output)] = dict(source=os.path.abspath(source), canvas=canvas,
+                                               format=export_format, fingerprint=fingerprint)
+        self.modified = True
+
+    def forget(self, output):
+        """Remove output (e.g. because its export failed)."""
+        if self.outputs.pop(self._key(output), None) is not None:
+            self.modified = True
+
+    def prune(self, source, export_format, canvases, outputs):
+        """
+        Remove the outputs of canvases of source that are not in canvases any more (i.e.
+        were deleted or renamed), and of canvases that are now exported to other files than
+        the files in outputs (e.g. because a second canvas was added). Return the paths of
+        the removed files.
+        """
+        source = os.path.abspath(source)
+        keep = set(self._key(output) for output in outputs)
+        exported = set(outputs.values())
+        removed = []
+        for key, entry in list(self.outputs.items()):
+            if entry['source'] != source or entry['format'] != export_format or key in keep:
+                continue
+            canvas = entry['canvas']
+            if canvas not in exported and (canvas is None or canvas in canvases):
+                continue  # not part of this export
+            output = os.path.join(self.directory, key)
+            if os.path.isfile(output):
+                os.unlink(output)
+            del self.outputs[key]
+            self.modified = True
+            removed.append(output)
+        return removed
+
+    def save(self):
+        if not self.modified:
+            return
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        with open(self.path, 'w') as fp:
+            json.dump(dict(version=VERSION, outputs=self.outputs), fp, indent=1, sort_keys=True)
+        self.modified = False
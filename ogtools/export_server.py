@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+
+import argparse
+from collections import OrderedDict
+import json
+import logging
+import os
+import socket
+
+from omnigraffle import backend as app_backend
+from omnigraffle.backend import ExportSettings
+from omnigraffle.command import OmniGraffleSandboxedCommand
+from ogtools.export import OmniGraffleSandboxedExporter
+
+"""
+Export server: a long-lived process that keeps OmniGraffle and the exported documents open.
+
+    $ ogexport serve &
+    $ ogexport --server png foobar.graffle png/
+
+The server listens on a local (unix domain) socket. Each request is one line of JSON
+and gets one line of JSON as response:
+
+    {"command": "export", "argv": ["png", "foobar.graffle", "png/"], "cwd": "/some/dir"}
+    {"command": "stats"}
+    {"command": "shutdown"}
+
+Documents stay open in a pool (least recently used documents are closed first, changed
+files are reopened), export settings are only changed when a job needs other values than
+the job before, and are restored when the server shuts down.
+"""
+
+DEFAULT_ADDRESS = os.path.expanduser('~/.ogtool/export.sock')
+DEFAULT_POOL_SIZE = 8
+
+
+class DocumentPool(object):
+    """The documents open in OmniGraffle, closed in least recently used order."""
+
+    def __init__(self, backend, size=DEFAULT_POOL_SIZE):
+        self.backend = backend
+        self.size = size
+        self.documents = OrderedDict()  # path -> (document, modification time)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path):
+        """Return the open document path in the front window, open it if necessary."""
+        path = os.path.abspath(path)
+        if os.path.isdir(path):
+            mtime = os.path.getmtime(os.path.join(path, 'data.plist'))  # package document
+        else:
+            mtime = os.path.getmtime(path)
+        if path in self.documents:
+            doc, opened_mtime = self.documents.pop(path)
+            if opened_mtime == mtime:
+                try:
+                    self.backend.raise_window(doc)
+                except Exception as e:
+                    # the window was closed in OmniGraffle
+                    logging.info('document window is gone, reopening: %s (%s)', path, e)
+                else:
+                    self.documents[path] = (doc, mtime)
+                    self.hits += 1
+                    return doc
+            else:
+                logging.info('document changed, reopening: %s', path)
+                self.backend.close(doc)
+
+        self.misses += 1
+        while len(self.documents) >= self.size:
+            old_path, (old_doc, dummy) = self.documents.popitem(last=False)
+            logging.info('closing %s', old_path)
+            self.backend.close(old_doc)
+        doc = self.backend.open(path)
+        self.documents[path] = (doc, mtime)
+        return doc
+
+    def close_all(self):
+        while self.documents:
+            dummy, (doc, dummy) = self.documents.popitem(last=False)
+            self.backend.close(doc)
+
+
+class ExportServer(object):
+    """Run export jobs with one connection to OmniGraffle and a pool of open documents."""
+
+    def __init__(self, backend, address=DEFAULT_ADDRESS, pool_size=DEFAULT_POOL_SIZE):
+        self.backend = backend
+        self.address = address
+        self.pool = DocumentPool(backend, pool_size)
+        self.export_settings = ExportSettings(backend)  # shared by all jobs
+        self.jobs = 0
+        self.errors = 0
+        self.running = False
+
+    def handle(self, request):
+        """Handle one request, return the response."""
+        command = request.get('command', 'export')
+        if command == 'export':
+            try:
+                self.export(request['argv'], request.get('cwd'))
+            except (Exception, SystemExit) as e:
+                self.errors += 1
+                logging.exception('export failed')
+                return dict(status='error', message=str(e) or e.__class__.__name__)
+            return dict(status='ok')
+        elif command == 'stats':
+            return dict(status='ok', jobs=self.jobs, errors=self.errors, hits=self.pool.hits,
+                        misses=self.pool.misses, documents=list(self.pool.documents))
+        elif command == 'shutdown':
+            self.running = False
+            return dict(status='ok')
+        return dict(status='error', message="unknown command '%s'" % command)
+
+    def export(self, argv, cwd=None):
+        """Run ogexport with the commandline arguments argv."""
+        args = OmniGraffleSandboxedExporter.get_parser().parse_args(argv)
+        if cwd:
+            args.source = os.path.join(cwd, args.source)
+            args.target = os.path.join(cwd, args.target)
+        exporter = OmniGraffleSandboxedExporter(args, backend=self.backend)
+        exporter.export_settings = self.export_settings
+
+        exporter.doc = self.pool.get(args.source)
+        exporter.set_export_settings()
+        self.jobs += 1
+        exporter.export_document()
+
+    def shutdown(self):
+        """Close all documents and restore the export settings."""
+        self.pool.close_all()
+        self.export_settings.restore()
+
+    def serve(self, connection):
+        """Read one request from connection and write the response."""
+        fp = connection.makefile('rwb')
+        line = fp.readline()
+        try:
+            response = self.handle(json.loads(line.decode('utf-8')))
+        except ValueError as e:
+            response = dict(status='error', message='invalid request: %s' % e)
+        fp.write((json.dumps(response) + '\n').encode('utf-8'))
+        fp.close()
+
+    def serve_forever(self):
+        directory = os.path.dirname(self.address)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.address)
+        server.listen(5)
+        logging.info('export server listening on %s', self.address)
+        self.running = True
+        try:
+            while self.running:
+                connection, dummy = server.accept()
+                try:
+                    self.serve(connection)
+                except (socket.error, IOError) as e:
+                    # a client that went away must not stop the server
+                    logging.warning('connection failed: %s', e)
+                finally:
+                    connection.close()
+        finally:
+            server.close()
+            os.unlink(self.address)
+            self.shutdown()
+
+
+def request(address, message):
+    """Send message to the export server at address and return its response."""
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.connect(address)
+    try:
+        fp = client.makefile('rwb')
+        fp.write((json.dumps(message) + '\n').encode('utf-8'))
+        fp.flush()
+        response = json.loads(fp.readline().decode('utf-8'))
+        fp.close()
+    finally:
+        client.close()
+    return response
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(prog='ogexport serve',
+                                     description="Run an export server for 'ogexport --server'.")
+    parser.add_argument('--address', default=DEFAULT_ADDRESS,
+                        help='the socket to listen on (default: %(default)s)')
+    parser.add_argument('--pool-size', type=int, default=DEFAULT_POOL_SIZE,
+                        help='number of documents to keep open (default: %(default)s)')
+    parser.add_argument('--stop', action='store_true',
+                        help='stop the server running on address')
+    OmniGraffleSandboxedCommand.add_backend(parser)
+    OmniGraffleSandboxedCommand.add_verbose(parser)
+    return parser
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+    logging.basicConfig(level=args.loglevel)
+    if args.stop:
+        request(args.address, dict(command='shutdown'))
+        return
+    backend = app_backend.connect(args.backend, latency=args.latency or 0.0)
+    ExportServer(backend, args.address, args.pool_size).serve_forever()
@@ -79,12 +79,13 @@ class OmniGraffleSandboxedTools(OmniGraffleSandboxedCommand):
                                                                  repr(element.text_size),
                                                                  hexcolors(element.text_color))))
                     colors.add(element.text_color)
-                    fonts[element.canvas_name].add(element.text_font)
+                    for canvas in element.context.canvases:
+                        fonts[canvas.name].add(element.text_font)
 
         d = Document(self.doc)
-        d.walk(partial(extract, colors, fonts))
+        d.walk(partial(extract, colors, fonts), scope=self.scope())
 
-        self.og.windows.first().close()
+        self.close_document()
         dump_colors_and_fonts_to_yaml_and_html(self.args.source, colors, fonts)
 
     def cmd_replace(self):
@@ -118,8 +119,8 @@ class OmniGraffleSandboxedTools(OmniGraffleSandboxedCommand):
                         element.text.font.set(new_font)
 
         d = Document(self.doc)
-        d.walk(partial(replace, replacements))
-        self.og.windows.first().close()
+        d.walk(partial(replace, replacements), scope=self.scope())
+        self.close_document()
 
     def cmd_run_plugin(self):
         """Run a plugin on a copy of a document."""
@@ -140,10 +141,9 @@ class OmniGraffleSandboxedTools(OmniGraffleSandboxedCommand):
             raise e
             sys.exit(1)
 
-        plugin.main(self.doc, config, self.args.canvas)
-    
-        self.og.windows.first().save()
-        self.og.windows.first().close()
+        plugin.main(self.doc, config, self.scope())
+
+        self.close_document(save=True)
 
     def cmd_list_plugins(self):
         """List all installed plugins."""
@@ -175,9 +175,11 @@ class OmniGraffleSandboxedTools(OmniGraffleSandboxedCommand):
                                    help="Dump a list of all colors and fonts in an Omnigraffle document.")
         sp.add_argument('source', type=str,
                         help='an OmniGraffle file')
-        sp.add_argument('--canvas', type=str,
-                        help='select a canvas with given name')
         sp.set_defaults(func=OmniGraffleSandboxedTools.cmd_dump_colors_and_fonts)
+        OmniGraffleSandboxedTools.add_scope(sp)
+        OmniGraffleSandboxedTools.add_offline(sp)
+        OmniGraffleSandboxedTools.add_backend(sp)
+        OmniGraffleSandboxedTools.add_stats(sp)
         OmniGraffleSandboxedTools.add_verbose(sp)
 
     @staticmethod
@@ -188,9 +190,10 @@ class OmniGraffleSandboxedTools(OmniGraffleSandboxedCommand):
                         help='an OmniGraffle file')
         sp.add_argument('replacements', type=str,
                         help='a yaml file with replacement for fonts and colors')
-        sp.add_argument('--canvas', type=str,
-                        help='select a canvas with given name')
         sp.set_defaults(func=OmniGraffleSandboxedTools.cmd_replace)
+        OmniGraffleSandboxedTools.add_scope(sp)
+        OmniGraffleSandboxedTools.add_backend(sp)
+        OmniGraffleSandboxedTools.add_stats(sp)
         OmniGraffleSandboxedTools.add_verbose(sp)
 
     @staticmethod
@@ -205,9 +208,11 @@ class OmniGraffleSandboxedTools(OmniGraffleSandboxedCommand):
                         help='a yaml file with configuration for the plugin')
         sp.add_argument('--noconfig', action='store_true',
                         help='skip loading config file')
-        sp.add_argument('--canvas', type=str,
-                        help='select a canvas with given name')
         sp.set_defaults(func=OmniGraffleSandboxedTools.cmd_run_plugin)
+        OmniGraffleSandboxedTools.add_scope(sp)
+        OmniGraffleSandboxedTools.add_offline(sp)
+        OmniGraffleSandboxedTools.add_backend(sp)
+        OmniGraffleSandboxedTools.add_stats(sp)
         OmniGraffleSandboxedTools.add_verbose(sp)
 
     @staticmethod
@@ -215,6 +220,7 @@ class OmniGraffleSandboxedTools(OmniGraffleSandboxedCommand):
         sp = subparsers.add_parser('list',
                                    help="List available plugins.")
         sp.set_defaults(func=OmniGraffleSandboxedTools.cmd_list_plugins)
+        OmniGraffleSandboxedTools.add_backend(sp)
         OmniGraffleSandboxedTools.add_verbose(sp)
 
 
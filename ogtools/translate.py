@@ -1,18 +1,29 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+from __future__ import print_function
+
 import argparse
 from collections import defaultdict
 from datetime import datetime
 from functools import partial
+import glob
+import hashlib
+import io
+import json
 import logging
+import multiprocessing
 import os
+import shutil
+import tempfile
 from textwrap import dedent
-import polib
 
-import appscript
 from omnigraffle.command import OmniGraffleSandboxedCommand
-from omnigraffle.data_model import Canvas
+from omnigraffle.data_model import Document
+from omnigraffle import fingerprint
+from omnigraffle import graffle_file
+from omnigraffle.po import MOFile, POTWriter, iter_translations, string_types, write_mo
+from omnigraffle.rtf import RichText
 
 """
 Translation of Omnigrafle files
@@ -37,74 +48,140 @@ Do we need keys and template files?
     - create a key (hash) for each text
     - create a omnigraffle template file where texts are replaced by hashes
     - copy templates and fill in translations template files
+
+Offline translation (translate --offline):
+
+    The attribute runs are replaced in the RTF stored in the .graffle file (formatting of
+    the runs is kept), and the translated copy is written directly, without OmniGraffle.
+    Documents are translated in a pool of processes. With several languages (de=text/de/
+    fr=text/fr/), the texts of each document are located once and then written in every language.
+
+Project-wide extraction (extract src/ -o project.pot):
+
+    The documents are extracted in parallel (offline) and merged into one POT file. The texts
+    of each document are cached by the hash of its contents (see MessageCache), so unchanged
+    documents are not read again.
+
+Compiled translation memories:
+
+    Each po-file is compiled once to a MO file with a hash table (see TranslationMemoryCache),
+    which is memory mapped by all processes instead of parsing the po-file again.
 """
 
+# change when the extracted messages change, to invalidate the MessageCache
+EXTRACT_VERSION = '1'
+
+
 class OmniGraffleSandboxedTranslator(OmniGraffleSandboxedCommand):
     """Translator for OmniGraffle6"""
 
     def cmd_extract_translations(self):
         """
-        Extract translations from an OmniGraffle document to a POT file.
+        Extract translations from OmniGraffle documents to a POT file.
 
         Translation memory is compiled in defaultdict (of sets) that has the messages as keys
         so duplicates are automatically eliminated, and locations are collected as a set, again
-        to eliminate duplicates.
+        to eliminate duplicates. The messages of documents are merged, so a text used in several
+        documents is listed once, with all its locations.
         """
-        self.open_document()
-
-        def extract_translations_legacy(file_name, canvas_name, translation_memory, element):
-            if element.text:
-                # add text to memory
-                location = "%s/%s" % (file_name, canvas_name)
-                translation_memory[element.text].add(location)
-
-        def extract_translations(file_name, canvas_name, translation_memory, element):
-            if element.text:  # element has more than zero length accessible text
-                for text in element.item.text.attribute_runs():
-                    if text.strip():  # add only text with non-whitespace memory
-                        location = "%s/%s" % (file_name, canvas_name)
-                        translation_memory[text].add(location)
+        documents = self.source_documents(self.args.source)
+        if not documents:
+            logging.error("no OmniGraffle documents found in %s", ', '.join(self.args.source))
+            return
+        output = self.args.output
+        if not output:
+            if len(documents) > 1:
+                logging.error("extracting several documents requires --output")
+                return
+            output = os.path.splitext(documents[0])[0] + '.pot'
+
+        cache = None if self.args.no_cache else MessageCache(self.args.cache_dir)
+        messages, missing = {}, []
+        for path in documents:
+            cached = cache.get(path) if cache else None
+            if cached is None:
+                missing.append(path)
+            else:
+                messages[path] = cached
+
+        if self.offline:
+            results = self.extract_offline(missing)
+        else:
+            results = []
+            for path in missing:
+                self.open_document(path)
+                results.append((path, extract_messages(self.doc)))
+                self.close_document()
+        for path, document_messages in results:
+            messages[path] = document_messages
+            if cache:
+                cache.put(path, document_messages)
 
-        file_name = os.path.basename(self.args.source)
         translation_memory = defaultdict(set)
-        for canvas in self.doc.canvases():
-            c = Canvas(canvas)
-            c.walk(partial(extract_translations, file_name, canvas.name(), translation_memory))
+        for path in documents:
+            file_name = os.path.basename(path)
+            for text, canvases in messages[path].items():
+                if self.args.canvas:
+                    canvases = [canvas for canvas in canvases if canvas == self.args.canvas]
+                if canvases:
+                    translation_memory[text].update("%s/%s" % (file_name, canvas) for canvas in canvases)
+        self.dump_translation_memory(translation_memory, output)
+        print("extracted %d texts from %d documents (%d from cache) to %s" % (
+            len(translation_memory), len(documents), len(documents) - len(missing), output))
 
-        self.og.windows.first().close()
-        self.dump_translation_memory(translation_memory)
-
-    def dump_translation_memory(self, tm):
+    @staticmethod
+    def source_documents(sources):
+        """Return the OmniGraffle documents in sources (documents, folders or glob patterns) in sorted order."""
+        documents = []
+        for source in sources:
+            paths = glob.glob(source) if glob.has_magic(source) else [source]
+            for path in sorted(paths):
+                if os.path.isdir(path) and not os.path.isfile(os.path.join(path, 'data.plist')):
+                    documents.extend(os.path.join(path, filename) for filename in sorted(os.listdir(path))
+                                     if filename.endswith(".graffle"))
+                else:
+                    documents.append(path)
+        # each document once, e.g. if it matches several patterns
+        return sorted(set(documents), key=documents.index)
+
+    def extract_offline(self, documents):
+        """Return a list of (document, messages) extracted without OmniGraffle in a pool of processes."""
+        processes = min(len(documents), getattr(self.args, 'processes', None) or multiprocessing.cpu_count())
+        if processes < 2:
+            return [_extract_task(path) for path in documents]
+        pool = multiprocessing.Pool(processes)
+        try:
+            return pool.map(_extract_task, documents)
+        finally:
+            pool.close()
+            pool.join()
+
+    def dump_translation_memory(self, tm, filename):
         """
         Dump translation memory to a pot-file.
 
         Sort messages in pot-file by location (if there's more locations, sort locations
         alphabetiaclly first) so that translators can process canvases alphabetially and
-        easily review exported images in a folder one by one.
+        easily review exported images in a folder one by one. Entries are written one by one.
         """
         container = []
         for text, locations in tm.items():
             container.append((sorted([l for l in locations]), text))
         container.sort(key=lambda x: x[0][0])
 
-        pot = polib.POFile()
-        for locations, text in container:
-            entry = polib.POEntry(
-                msgid=text,
-                msgstr=text,
-                occurrences=[(location, '0') for location in locations]
-            )
-            pot.append(entry)
-        pot.save(os.path.splitext(self.args.source)[0] + '.pot')
+        with io.open(filename, 'w', encoding='utf-8') as fp:
+            writer = POTWriter(fp)
+            for locations, text in container:
+                writer.write(text, occurrences=locations)
 
     def cmd_list(self):
         """List all canvases in file."""
 
         self.open_document(self.args.source)
         for canvas in self.doc.canvases():
-            print "%s (in %s) " % (canvas.name(),
-                                   os.path.splitext(self.args.source)[0])
-        self.og.windows.first().close()
+            print("%s (in %s) " % (canvas.name(),
+                                   os.path.splitext(self.args.source)[0]))
+        self.close_document()
 
     def cmd_translate(self):
         """
@@ -120,22 +197,96 @@ class OmniGraffleSandboxedTranslator(OmniGraffleSandboxedCommand):
             return
 
         if os.path.isdir(self.args.source):
-            for filename in sorted(os.listdir(self.args.source)):
-                if filename.endswith(".graffle"):
-                    self.translate_document(os.path.join(self.args.source, filename),
-                                            self.args.target,
-                                            self.args.translations)
+            documents = [os.path.join(self.args.source, filename)
+                         for filename in sorted(os.listdir(self.args.source)) if filename.endswith(".graffle")]
+        else:
+            documents = [self.args.source]
+
+        try:
+            languages = self.translation_sources(self.args.translations)
+        except ValueError as e:
+            logging.error(e)
+            return
+
+        if self.offline:
+            self.translate_offline(documents, self.args.target, languages)
         else:
-            self.translate_document(self.args.source, self.args.target, self.args.translations)
+            for source in documents:
+                for language, translations in languages:
+                    self.translate_document(source, self.target_for_language(source, self.args.target, language),
+                                            translations)
+
+    @staticmethod
+    def translation_sources(specs):
+        """
+        Return a list of (language, po-file or folder) for the translations given on the commandline:
+        either one po-file or folder (language None), or any number of language=po-file or folder.
+        """
+        languages = [tuple(spec.split('=', 1)) if '=' in spec else (None, spec) for spec in specs]
+        if len(languages) > 1 and None in [language for language, dummy in languages]:
+            raise ValueError("several translation sources need a language each (e.g. de=text/de/)")
+        if len(set(language for language, dummy in languages)) < len(languages):
+            raise ValueError("a language is given more than once")
+        return languages
+
+    def target_for_language(self, source, target, language):
+        """
+        The translated copy of source in language: in the folder language in target, if target is
+        a folder, or target extended with language as suffix.
+        """
+        if language is None:
+            return self.target_filename(source, target=target)
+        if os.path.isdir(target):
+            folder = os.path.join(target, language)
+            if not os.path.isdir(folder):
+                os.makedirs(folder)
+            return os.path.join(folder, os.path.basename(source))
+        return self.target_filename(target, suffix=language)
+
+    @staticmethod
+    def translation_file(source, translations):
+        """The po-file for source: translations, or a file named like source in the folder translations."""
+        if os.path.isdir(translations):
+            return os.path.join(translations, os.path.splitext(os.path.basename(source))[0] + '.po')
+        return translations
+
+    def translate_offline(self, documents, target, languages):
+        """
+        Write translated copies of documents in all languages (see translation_sources) without
+        OmniGraffle, in a pool of processes. Each po-file is read once, each document is parsed once.
+        """
+        memories = {}
+        tasks = []
+        for source in documents:
+            outputs = []
+            for language, translations in languages:
+                tm_file = self.translation_file(source, translations)
+                if tm_file not in memories:
+                    # workers open compiled memories themselves, the pages are shared
+                    memories[tm_file] = self.tm_cache.compile(tm_file) if self.tm_cache else \
+                        self.translation_memory(tm_file)
+                outputs.append((self.target_for_language(source, target, language), tm_file))
+            tasks.append((source, outputs))
+
+        processes = min(len(tasks), getattr(self.args, 'processes', None) or multiprocessing.cpu_count())
+        if processes < 2:
+            _init_worker(memories)
+            results = [_translate_task(task) for task in tasks]
+        else:
+            pool = multiprocessing.Pool(processes, initializer=_init_worker, initargs=(memories,))
+            try:
+                results = pool.map(_translate_task, tasks)
+            finally:
+                pool.close()
+                pool.join()
+        for (source, dummy), counts in zip(tasks, results):
+            for output, count in counts:
+                print("translated:", source, output, "(%d texts)" % count)
 
     def translate_document(self, source, target, translations):
         """Create a copy of and then translate one OmniGraffle document."""
         self.open_copy_of_document(source, target=target)
-        if os.path.isdir(translations):
-            tm_file = os.path.join(translations, os.path.splitext(os.path.basename(source))[0] + '.po')
-        else:
-            tm_file = translations
-        tm = self.read_translation_memory(tm_file)
+        tm = self.translation_memory(self.translation_file(source, translations))
 
         def inject_translations_legacy(tm, element):
             """
@@ -177,21 +328,37 @@ class OmniGraffleSandboxedTranslator(OmniGraffleSandboxedCommand):
             if not self.doc.modified():
                 logging.error("document is not marked as modified")
 
-        for canvas in self.doc.canvases():
-            c = Canvas(canvas)
-            c.walk(partial(inject_translations, tm))
-
-        self.og.windows.first().save()
-        self.og.windows.first().close()
+        # walk the whole document, so shared layers are translated only once
+        Document(self.doc).walk(partial(inject_translations, tm))
+
+        self.close_document(save=True)
+
+    @property
+    def tm_cache(self):
+        """The TranslationMemoryCache, None if disabled with --no-cache."""
+        if getattr(self.args, 'no_cache', False):
+            return None
+        if not hasattr(self, '_tm_cache'):
+            self._tm_cache = TranslationMemoryCache(getattr(self.args, 'cache_dir', None) or
+                                                    TranslationMemoryCache.DEFAULT_DIRECTORY,
+                                                    read=self.read_translation_memory)
+        return self._tm_cache
+
+    def translation_memory(self, filename):
+        """The translation memory of a po-file, loaded once (compiled, unless --no-cache)."""
+        if not hasattr(self, '_memories'):
+            self._memories = {}
+        if filename not in self._memories:
+            if self.tm_cache:
+                self._memories[filename] = MOFile(self.tm_cache.compile(filename))
+            else:
+                self._memories[filename] = self.read_translation_memory(filename)
+        return self._memories[filename]
 
-    def read_translation_memory(self, filename):
-        """Read translation memory from a po-file."""
-        tm = {}
-        po = polib.pofile(filename)
-        for entry in po.translated_entries():
-            if not entry.obsolete:
-                tm[entry.msgid] = entry.msgstr
-        return tm
+    @staticmethod
+    def read_translation_memory(filename):
+        """Read translation memory from a po-file (the translated, non-obsolete entries)."""
+        return dict((msgid, msgstr) for msgid, msgstr, dummy in iter_translations(filename))
 
     @staticmethod
     def get_parser():
@@ -209,10 +376,21 @@ class OmniGraffleSandboxedTranslator(OmniGraffleSandboxedCommand):
     def add_parser_extract(subparsers):
         sp = subparsers.add_parser('extract',
                                    help="Extract a POT file from an Omnigraffle document.")
-        sp.add_argument('source', type=str,
-                        help='an OmniGraffle file')
+        sp.add_argument('source', type=str, nargs='+',
+                        help='OmniGraffle files, folders or glob patterns')
+        sp.add_argument('--output', '-o', type=str,
+                        help='the POT file (default: the name of the document with extension .pot)')
         sp.add_argument('--canvas', type=str,
-                        help='translate canvas with given name')
+                        help='extract only the texts of the canvases with given name')
+        sp.add_argument('--processes', type=int, metavar='N',
+                        help='number of documents extracted in parallel with --offline (default: number of CPUs)')
+        sp.add_argument('--cache-dir', default=MessageCache.DEFAULT_DIRECTORY,
+                        help='cache of the texts of each document (default: %(default)s)')
+        sp.add_argument('--no-cache', action='store_true',
+                        help='read all documents, even if they are unchanged')
+        OmniGraffleSandboxedTranslator.add_offline(sp)
+        OmniGraffleSandboxedTranslator.add_backend(sp)
+        OmniGraffleSandboxedTranslator.add_stats(sp)
         OmniGraffleSandboxedTranslator.add_verbose(sp)
         sp.set_defaults(func=OmniGraffleSandboxedTranslator.cmd_extract_translations)
 
@@ -222,6 +400,8 @@ class OmniGraffleSandboxedTranslator(OmniGraffleSandboxedCommand):
                                    help="List canvases in a file.")
         sp.add_argument('source', type=str,
                         help='an OmniGraffle file')
+        OmniGraffleSandboxedTranslator.add_offline(sp)
+        OmniGraffleSandboxedTranslator.add_backend(sp)
         OmniGraffleSandboxedTranslator.add_verbose(sp)
         sp.set_defaults(func=OmniGraffleSandboxedTranslator.cmd_list)
 
@@ -244,19 +424,242 @@ class OmniGraffleSandboxedTranslator(OmniGraffleSandboxedCommand):
                                             ogtranslate translate graffle/src/ graffle/de/ text/de/all.po
 
                                         will create translated copies from each document found in graffle/src
-                                        in graffle/de, using text/de/all.po for translating each document."""))
+                                        in graffle/de, using text/de/all.po for translating each document.
+
+                                            ogtranslate translate graffle/src/ graffle/ de=text/de/ fr=text/fr/
+
+                                        will create translated copies in graffle/de and graffle/fr, if target
+                                        is a file, the language is added as suffix (foobar-de.graffle)."""))
         sp.add_argument('source', type=str,
                         help='an OmniGraffle document or a folder')
         sp.add_argument('target', type=str,
                         help='target filename or folder')
-        sp.add_argument('translations', type=str,
-                        help='a po-file or a folder')
+        sp.add_argument('translations', type=str, nargs='+',
+                        help='a po-file or a folder, or several as language=po-file or folder')
         # sp.add_argument('language', type=str,
         #                 help='two-digit language identifier')
+        OmniGraffleSandboxedTranslator.add_offline(sp)
+        sp.add_argument('--processes', type=int, metavar='N',
+                        help='number of documents translated in parallel with --offline (default: number of CPUs)')
+        sp.add_argument('--cache-dir', default=TranslationMemoryCache.DEFAULT_DIRECTORY,
+                        help='compiled translation memories (default: %(default)s)')
+        sp.add_argument('--no-cache', action='store_true',
+                        help='read the po-files without compiling them')
+        OmniGraffleSandboxedTranslator.add_backend(sp)
+        OmniGraffleSandboxedTranslator.add_stats(sp)
         OmniGraffleSandboxedTranslator.add_verbose(sp)
         sp.set_defaults(func=OmniGraffleSandboxedTranslator.cmd_translate)
 
 
+def extract_messages(doc):
+    """
+    Return a dict text -> sorted list of canvas names for all non-whitespace attribute runs
+    in the opened document doc. Texts on shared layers belong to all canvases they are shown on.
+    """
+    messages = defaultdict(set)
+
+    def extract_translations(element):
+        if element.text:  # element has more than zero length accessible text
+            for text in element.item.text.attribute_runs():
+                if text.strip():  # add only text with non-whitespace memory
+                    # texts on shared layers are visited once, but belong to several canvases
+                    for canvas in element.context.canvases:
+                        messages[text].add(canvas.name)
+
+    Document(doc).walk(extract_translations)
+    return dict((text, sorted(canvases)) for text, canvases in messages.items())
+
+
+def _extract_task(path):
+    return path, extract_messages(graffle_file.load(os.path.abspath(path)))
+
+
+def _write_file(path, data):
+    """Write data (bytes) to path atomically, like omnigraffle.po.write_mo."""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            fp.write(data)
+        os.rename(tmp, path)
+    except Exception:
+        os.unlink(tmp)
+        raise
+
+
+def _file_digest(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class MessageCache(object):
+    """
+    The texts extracted from documents, stored by the hash of the contents of the document
+    (data.plist for packages), so unchanged documents (also renamed or copied ones) are not read again.
+    """
+
+    DEFAULT_DIRECTORY = os.path.expanduser('~/.ogtool/messages')
+
+    def __init__(self, directory=DEFAULT_DIRECTORY):
+        self.directory = os.path.abspath(directory)
+
+    @staticmethod
+    def key(path):
+        if os.path.isdir(path):
+            path = os.path.join(path, 'data.plist')
+        return fingerprint.combine('ogtranslate-extract', EXTRACT_VERSION, _file_digest(path))
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.json')
+
+    def get(self, document):
+        """Return the messages of document (see extract_messages), None if they are not cached."""
+        try:
+            with io.open(self.path(self.key(document)), encoding='utf-8') as fp:
+                return json.load(fp)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def put(self, document, messages):
+        path = self.path(self.key(document))
+        directory = os.path.dirname(path)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        _write_file(path, json.dumps(messages, sort_keys=True).encode('ascii'))
+
+
+class TranslationMemoryCache(object):
+    """
+    Translation memories compiled to MO files (see omnigraffle.po.MOFile), one for each po-file.
+    A compiled memory is used while its po-file has the same mtime and size (or, if only the mtime
+    changed, the same hash), and compiled again otherwise.
+    """
+
+    DEFAULT_DIRECTORY = os.path.expanduser('~/.ogtool/tm')
+
+    def __init__(self, directory=DEFAULT_DIRECTORY, read=None):
+        self.directory = os.path.abspath(directory)
+        self.read = read  # reads a po-file into a dict msgid -> msgstr
+        self.compiled = 0
+
+    def path(self, po_file):
+        name = hashlib.sha1(os.path.abspath(po_file).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, name + '.mo')
+
+    def compile(self, po_file):
+        """Return the path of the MO file of po_file, compile it first if it is outdated."""
+        mo_file = self.path(po_file)
+        stamp_file = os.path.splitext(mo_file)[0] + '.json'
+        st = os.stat(po_file)
+        stamp = dict(mtime=st.st_mtime, size=st.st_size)
+        try:
+            with open(stamp_file) as fp:
+                old_stamp = json.load(fp)
+        except (IOError, OSError, ValueError):
+            old_stamp = {}
+        if os.path.isfile(mo_file):
+            if (old_stamp.get('mtime'), old_stamp.get('size')) == (stamp['mtime'], stamp['size']):
+                return mo_file
+            stamp['sha1'] = _file_digest(po_file)
+            if old_stamp.get('sha1') == stamp['sha1']:
+                self._write_stamp(stamp_file, stamp)  # touched, but not changed
+                return mo_file
+        else:
+            stamp['sha1'] = _file_digest(po_file)
+            if not os.path.exists(self.directory):
+                os.makedirs(self.directory)
+        logging.info("compiling translation memory %s", po_file)
+        write_mo(mo_file, self.read(po_file))
+        self._write_stamp(stamp_file, stamp)
+        self.compiled += 1
+        return mo_file
+
+    @staticmethod
+    def _write_stamp(path, stamp):
+        _write_file(path, json.dumps(stamp).encode('ascii'))
+
+
+# translation memories of the worker processes of translate --offline, by po-file
+_memories = {}
+
+
+def _init_worker(memories):
+    """Open the translation memories, compiled ones are given by the path of the MO file."""
+    global _memories
+    _memories = dict((tm_file, MOFile(tm) if isinstance(tm, string_types) else tm) for tm_file, tm in memories.items())
+
+
+def _translate_task(task):
+    source, outputs = task
+    return translate_file(source, [(target, _memories[tm_file]) for target, tm_file in outputs])
+
+
+class TranslatableTexts(object):
+    """
+    All texts in the plist of a document (canvases and shared layers) with their attribute runs,
+    located and parsed once, so that the document can be translated into several languages.
+    """
+
+    def __init__(self, data):
+        self.texts = []  # list of (text dict, parsed RTF, original RTF and RTFD)
+        sheets = list(data.get('Sheets', [data])) + list(data.get('MasterSheets') or [])
+        graphics = [g for sheet in sheets for g in sheet.get('GraphicsList') or []]
+        while graphics:
+            graphic = graphics.pop()
+            graphics.extend(graphic.get('Graphics') or [])
+            text = graphic.get('Text')
+            if isinstance(text, dict) and text.get('Text'):
+                self.texts.append((text, RichText(text['Text']), (text['Text'], text.get('RTFD'))))
+
+    def translate(self, tm):
+        """
+        Replace the attribute runs that are in the translation memory tm, keeping their formatting.
+        Translations of a previous call are replaced. Return the number of translated runs.
+        """
+        count = 0
+        for text, rich_text, original in self.texts:
+            replacements = dict((idx, tm[run.text]) for idx, run in enumerate(rich_text.runs) if run.text in tm)
+            self._restore(text, original)
+            if replacements:
+                text['Text'] = rich_text.replace_runs(replacements)
+                text.pop('RTFD', None)  # outdated now, OmniGraffle recreates it from the RTF
+                count += len(replacements)
+        return count
+
+    @staticmethod
+    def _restore(text, original):
+        text['Text'], rtfd = original
+        if rtfd is not None:
+            text['RTFD'] = rtfd
+
+
+def translate_plist(data, tm):
+    """Translate all texts in the plist of a document with tm, return the number of translated runs."""
+    return TranslatableTexts(data).translate(tm)
+
+
+def translate_file(source, outputs):
+    """
+    Write copies of the OmniGraffle document source translated without OmniGraffle, for each (target,
+    translation memory) in outputs. Return a list of (target, number of translated runs).
+    """
+    data, compressed = graffle_file.read_plist(source)
+    texts = TranslatableTexts(data)
+    results = []
+    for target, tm in outputs:
+        count = texts.translate(tm)
+        if os.path.isdir(source):
+            # a package: copy images etc., data.plist is written below
+            if os.path.exists(target):
+                shutil.rmtree(target)
+            shutil.copytree(source, target)
+        graffle_file.write_plist(target, data, compressed)
+        results.append((target, count))
+    return results
+
+
 def main():
     translator = OmniGraffleSandboxedTranslator()
     translator.args.func(translator)
@@ -0,0 +1,470 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Application backends: how ogtools talks to OmniGraffle.
+
+A backend opens documents and provides the application reference (backend.app),
+which has the same interface as appscript's reference to OmniGraffle: documents,
+canvases, windows.first(), current_export_settings, doc.save(as_=.., in_=..) and
+so on. Two backends are available:
+
+- 'appscript' controls the OmniGraffle app on a Mac via AppleEvents.
+- 'simulated' is a pure-Python stand-in for OmniGraffle that reads .graffle files
+  with omnigraffle.graffle_file and writes placeholder files on export. Every
+  AppleEvent the real app would receive can be delayed by a configurable latency
+  and is counted, so pipelines can be tested and benchmarked on any platform.
+
+The backend is selected with --backend or the environment variable OGTOOL_BACKEND.
+"""
+
+import hashlib
+import logging
+import os
+import subprocess
+import time
+
+try:
+    import appscript
+except ImportError:
+    appscript = None
+
+from omnigraffle import graffle_file
+from omnigraffle import pdf
+from omnigraffle.data_model import ElementError
+
+BACKEND_VARIABLE = 'OGTOOL_BACKEND'
+DEFAULT_BACKEND = 'appscript'
+
+MULTIPAGE_FORMATS = ('pdf', 'vdx')
+
+
+class Backend(object):
+    """Interface of all backends."""
+
+    def __init__(self):
+        self.app = None
+        self._version = None
+
+    def open(self, fname):
+        """Open the document fname and return a reference to it."""
+        raise NotImplementedError
+
+    def keyword(self, name):
+        """Return the constant name (e.g. 'current_canvas') as used by the application."""
+        raise NotImplementedError
+
+    def raise_window(self, doc):
+        """Make the window of the open document doc the front window."""
+        # match the file, documents in different folders can have the same name
+        path = doc.path()
+        for idx, window in enumerate(self.app.windows()):
+            document = window.document()
+            if document is not None and document.path() == path:
+                if idx > 0:
+                    window.index.set(1)
+                return
+        raise RuntimeError('document %s is not open' % path)
+
+    def close(self, doc):
+        """Close the document doc without saving."""
+        doc.close(saving=self.keyword('no'))
+
+    def version(self):
+        """The version of the application (asked only once per session)."""
+        if self._version is None:
+            self._version = self.app.version()
+        return self._version
+
+    def sandboxed(self):
+        """True if the application can only write to its sandbox path."""
+        return False
+
+    def sandbox_path(self):
+        raise RuntimeError('%s is not sandboxed' % self.__class__.__name__)
+
+    @property
+    def export_settings(self):
+        return self.app.current_export_settings
+
+    def front_window(self):
+        return self.app.windows.first()
+
+
+class AppscriptBackend(Backend):
+    """Control OmniGraffle via appscript."""
+
+    SANDBOXED_DIR = '~/Library/Containers/com.omnigroup.OmniGraffle%s/Data/'
+
+    def __init__(self, names=('OmniGraffle',), **options):
+        super(AppscriptBackend, self).__init__()
+        self._sandbox_path = None
+        if appscript is None:
+            raise RuntimeError('appscript is not installed')
+        for name in names:
+            try:
+                self.app = appscript.app(name)
+                break
+            except (appscript.ApplicationNotFoundError):
+                continue
+        if self.app is None:
+            raise RuntimeError('Unable to connect to OmniGraffle (%s)' % ', '.join(names))
+
+    def open(self, fname):
+        self.app.activate()
+
+        # adhoc fix for https://github.com/fikovnik/omnigraffle-export/issues/23
+        # apparently the process is sandboxed and cannot access the file
+        # 16/03/2015 13:01:54.000 kernel[0]: Sandbox: OmniGraffle(66840) deny file-read-data test.graffle
+        # therefore we first try to open it manually
+        subprocess.call(['open', fname])
+
+        return self.app.open(fname)
+
+    def keyword(self, name):
+        return getattr(appscript.k, name)
+
+    def sandboxed(self):
+        # real check using '/usr/bin/codesign --display --entitlements - /Applications/OmniGraffle.app'
+        return self.version()[0] >= '6'
+
+    def sandbox_path(self):
+        if self._sandbox_path is None:
+            path = os.path.expanduser(self.SANDBOXED_DIR % self.version()[0])
+
+            if not os.path.exists(path):
+                raise RuntimeError('OmniGraffle is sandboxed but missing sandbox path: %s' % path)
+            self._sandbox_path = path
+
+        return self._sandbox_path
+
+
+class SimulatedBackend(Backend):
+    """Pure-Python stand-in for OmniGraffle, see SimulatedOmniGraffle."""
+
+    def __init__(self, latency=0.0, sandbox=None, **options):
+        super(SimulatedBackend, self).__init__()
+        self.application = SimulatedOmniGraffle(latency=latency, sandbox=sandbox)
+        self.app = SimulatedReference(self.application, self.application)
+
+    def open(self, fname):
+        return self.app.open(fname)
+
+    def keyword(self, name):
+        return name
+
+    def sandboxed(self):
+        return self.application.sandbox is not None
+
+    def sandbox_path(self):
+        if self.application.sandbox is None:
+            return super(SimulatedBackend, self).sandbox_path()
+        return self.application.sandbox
+
+    @property
+    def events(self):
+        """Number of AppleEvents the real application would have received."""
+        return self.application.events
+
+
+BACKENDS = {
+    'appscript': AppscriptBackend,
+    'simulated': SimulatedBackend,
+}
+
+
+def connect(name=None, **options):
+    """Create the backend name (defaults to $OGTOOL_BACKEND or 'appscript')."""
+    name = name or os.environ.get(BACKEND_VARIABLE) or DEFAULT_BACKEND
+    try:
+        klass = BACKENDS[name]
+    except KeyError:
+        raise RuntimeError("unknown backend '%s' (available: %s)" % (name, ', '.join(sorted(BACKENDS))))
+    logging.debug('using backend %s', name)
+    return klass(**options)
+
+
+def keyword_name(value):
+    """Name of a constant, for both appscript keywords and plain strings."""
+    return getattr(value, 'name', value)
+
+
+class ExportSettings(object):
+    """
+    The current export settings of the application, cached for the session.
+
+    A setting is read from the application the first time it is needed, set() only
+    sends values that differ from the cached value, and restore() only resets the
+    settings that were changed.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.original = {}  # name -> value read from the application
+        self.current = {}  # name -> value in the application
+
+    def get(self, name):
+        if name not in self.current:
+            self.original[name] = self.current[name] = getattr(self.backend.export_settings, name)()
+        return self.current[name]
+
+    def set(self, name, value):
+        """Set the setting name to value, unless it already has that value."""
+        if keyword_name(self.get(name)) != keyword_name(value):
+            getattr(self.backend.export_settings, name).set(value)
+            self.current[name] = value
+
+    def apply(self, values, keep=()):
+        """
+        Set the settings in the dict values, reset other changed settings to the values
+        they had before (except the settings in keep).
+        """
+        for name, value in self.original.items():
+            if name not in values and name not in keep:
+                self.set(name, value)
+        for name, value in values.items():
+            self.set(name, value)
+
+    def restore(self):
+        """Reset the changed settings to the values they had before."""
+        self.apply({})
+
+
+class SimulatedReference(object):
+    """
+    Wraps objects of the simulated application so that every call and every set()
+    counts as one AppleEvent, like appscript references do.
+    """
+
+    def __init__(self, application, target):
+        self._application = application
+        self._target = target
+
+    def __repr__(self):
+        return 'SimulatedReference(%r)' % (self._target,)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return SimulatedReference(self._application, getattr(self._target, name))
+
+    def __getitem__(self, idx):
+        return SimulatedReference(self._application, self._target[idx])
+
+    def __call__(self, *args, **kwargs):
+        self._application.event()
+        args = [unwrap(a) for a in args]
+        kwargs = dict((k, unwrap(v)) for k, v in kwargs.items())
+        return self._wrap(self._target(*args, **kwargs))
+
+    def set(self, value):
+        self._application.event()
+        self._target.set(unwrap(value))
+
+    def _wrap(self, value):
+        if isinstance(value, list):
+            return [self._wrap(v) for v in value]
+        if isinstance(value, (graffle_file.Element, SimulatedWindow)):
+            return SimulatedReference(self._application, value)
+        return value
+
+
+def unwrap(value):
+    if isinstance(value, SimulatedReference):
+        return value._target
+    return value
+
+
+class SimulatedExportSettings(graffle_file.Element):
+    """The current export settings of the simulated application."""
+
+    class_name = 'export_settings'
+
+    DEFAULTS = dict(
+        area_type='current_canvas',
+        border_amount=0.0,
+        copy_linked_images=True,
+        draws_background=True,
+        export_read_only=False,
+        export_scale=1.0,
+        html_image_type='png',
+        include_border=False,
+        origin=[0.0, 0.0],
+        resolution=1.0,
+        size=[0.0, 0.0],
+    )
+
+    def __init__(self):
+        super(SimulatedExportSettings, self).__init__(None)
+        self.values = dict(self.DEFAULTS)
+
+    def __getattr__(self, name):
+        if name in self.DEFAULTS:
+            return graffle_file.Property(lambda: self.values[name],
+                                         lambda value: self.values.__setitem__(name, keyword_name(value)))
+        return super(SimulatedExportSettings, self).__getattr__(name)
+
+
+class SimulatedWindow(object):
+    """A document window, showing one canvas of the document."""
+
+    def __init__(self, application, document):
+        self._application = application
+        self._document = document
+        self._canvas = document.canvases()[0] if document.canvases() else None
+
+    @property
+    def document(self):
+        return graffle_file.Property(lambda: self._document)
+
+    @property
+    def canvas(self):
+        return graffle_file.Property(lambda: self._canvas, self._set_canvas)
+
+    def _set_canvas(self, canvas):
+        if canvas not in self._document.canvases():
+            raise ElementError("canvas %r is not in %r" % (canvas, self._document))
+        self._canvas = canvas
+
+    @property
+    def index(self):
+        return graffle_file.Property(lambda: self._application.windows_.index(self) + 1, self._set_index)
+
+    def _set_index(self, index):
+        self._application.windows_.remove(self)
+        self._application.windows_.insert(index - 1, self)
+
+    def save(self):
+        self._document.save()
+
+    def close(self, saving=None):
+        self._application.windows_.remove(self)
+
+
+class SimulatedDocument(graffle_file.GraffleDocument):
+    """A document in the simulated application, can be exported."""
+
+    def __init__(self, path, application):
+        super(SimulatedDocument, self).__init__(path)
+        self._application = application
+
+    def save(self, in_=None, as_=None):
+        if as_ is None:
+            return super(SimulatedDocument, self).save(in_=in_)
+        self._application.export(self, keyword_name(as_).lower(), in_)
+
+    def close(self, saving=None):
+        for window in self._application.windows_:
+            if window._document is self:
+                window.close()
+                break
+
+
+class SimulatedOmniGraffle(object):
+    """
+    In-memory stand-in for OmniGraffle.
+
+    Exports write a small placeholder file per canvas that contains the format and
+    a hash of the canvas data, so unchanged canvases produce identical files. PDF
+    exports are real PDFs with one (empty) page per canvas.
+
+    If a sandbox folder is given, the application behaves like the sandboxed OmniGraffle 6+
+    and can only export to that folder.
+    """
+
+    def __init__(self, latency=0.0, version='7.0', sandbox=None):
+        self.latency = latency
+        self.sandbox = sandbox
+        self.events = 0
+        self._version = version
+        self.windows_ = []
+        self.settings = SimulatedExportSettings()
+
+    def event(self):
+        """Account for one AppleEvent."""
+        self.events += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def activate(self):
+        pass
+
+    def version(self):
+        return self._version
+
+    def open(self, fname):
+        fname = os.path.abspath(fname)
+        for w in self.windows_:
+            if w._document.get_path() == fname:
+                break
+        else:
+            w = SimulatedWindow(self, SimulatedDocument(fname, self))
+            self.windows_.append(w)
+        # the window of the opened document is now the front window
+        self.windows_.remove(w)
+        self.windows_.insert(0, w)
+        return w._document
+
+    @property
+    def documents(self):
+        return graffle_file.Collection(lambda: [w._document for w in self.windows_])
+
+    @property
+    def windows(self):
+        return SimulatedWindows(self)
+
+    @property
+    def current_export_settings(self):
+        return self.settings
+
+    def export(self, document, export_format, path):
+        """Export the document (or the canvas in the front window) to path."""
+        if self.sandbox is not None and \
+                not os.path.abspath(path).startswith(os.path.join(os.path.abspath(self.sandbox), '')):
+            raise ElementError('OmniGraffle is sandboxed, cannot export to %s' % path)
+        area_type = self.settings.values['area_type']
+        window = [w for w in self.windows_ if w._document is document][0]
+        if area_type in ('current_canvas', 'all_graphics', 'selected_graphics', 'manual_region'):
+            self._write(path, export_format, [window._canvas])
+        elif export_format in MULTIPAGE_FORMATS or len(document.canvases()) == 1:
+            self._write(path, export_format, document.canvases())
+        else:
+            # OmniGraffle exports one file per canvas into a folder
+            if not os.path.exists(path):
+                os.makedirs(path)
+            for canvas in document.canvases():
+                fname = os.path.join(path, '%s.%s' % (canvas.get_name(), export_format))
+                self._write(fname, export_format, [canvas])
+        logging.debug('simulated export of %s to %s', document.get_name(), path)
+
+    def _write(self, path, export_format, canvases):
+        with open(path, 'wb') as fp:
+            fp.write(render_placeholder(export_format, canvases, self.settings.values))
+
+
+class SimulatedWindows(object):
+
+    def __init__(self, application):
+        self._application = application
+
+    def __call__(self):
+        return list(self._application.windows_)
+
+    def first(self):
+        if not self._application.windows_:
+            raise ElementError("Can't get window 1")
+        return self._application.windows_[0]
+
+
+def render_placeholder(export_format, canvases, settings):
+    """Content of a simulated export: format, export settings and a hash of each canvas."""
+    lines = ['simulated %s export' % export_format,
+             'settings: %s' % ', '.join('%s=%s' % (k, settings[k]) for k in sorted(settings))]
+    canvas_lines = []
+    for canvas in canvases:
+        digest = hashlib.sha1(graffle_file._dumps(canvas.data)).hexdigest()
+        canvas_lines.append('canvas: %s %s' % (canvas.get_name(), digest))
+    if export_format == 'pdf':
+        # the lines are comments in the contents of the pages
+        return pdf.write_document([((0, 0, 612, 792), ''.join('%% %s\n' % l for l in lines + [c]).encode('utf-8'))
+                                   for c in canvas_lines])
+    return ('\n'.join(lines + canvas_lines) + '\n').encode('utf-8')
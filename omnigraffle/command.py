@@ -1,19 +1,27 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+from __future__ import print_function
+
 import logging
 import os
 import shutil
 
-import appscript
+from omnigraffle import backend as app_backend
+from omnigraffle import data_model
+from omnigraffle import graffle_file
 
+# collections of OmniGraffle's element classes learned while walking documents
+SCHEMA_FILE = os.path.expanduser('~/.ogtool/collections.json')
 
-class OmniGraffleSandboxedCommand(object):
 
-    SANDBOXED_DIR = '~/Library/Containers/com.omnigroup.OmniGraffle%s/Data/'
+class OmniGraffleSandboxedCommand(object):
 
-    def __init__(self, args=None):
-        """Read args from commandline if not present, and connect to OmniGraffle app."""
+    def __init__(self, args=None, backend=None):
+        """
+        Read args from commandline if not present. The OmniGraffle app is connected when
+        it is first needed (unless an already connected backend is passed in).
+        """
         if args:
             self.args = args
         else:
@@ -21,29 +29,51 @@ class OmniGraffleSandboxedCommand(object):
 
         self._check_args()
         self.doc = None
+        if getattr(self.args, 'stats', False):
+            data_model.walk_stats = data_model.WalkStats()
         self.settings_backup = {}
-        try:
-            self.og = appscript.app('OmniGraffle')
-        except (appscript.ApplicationNotFoundError):
-            raise RuntimeError('Unable to connect to OmniGraffle 6 ')
+        self._backend = backend
+        self._connected = False
+
+    @property
+    def backend(self):
+        """The connection to OmniGraffle, made on first use (None if documents are read offline)."""
+        if self.offline:
+            return None  # documents are read directly from disk
+        if not self._connected:
+            if self._backend is None:
+                self._backend = app_backend.connect(getattr(self.args, 'backend', None),
+                                                    latency=getattr(self.args, 'latency', None) or 0.0)
+            data_model.collection_schema.load(SCHEMA_FILE)
+            self._connected = True
+        return self._backend
+
+    @property
+    def og(self):
+        backend = self.backend
+        return backend.app if backend is not None else None
+
+    @property
+    def offline(self):
+        """True if documents are read from the .graffle file instead of through OmniGraffle."""
+        return getattr(self.args, 'offline', False)
 
     def _check_args(self):
         """Hook to validate commandline arguments."""
         pass
 
     def sandboxed(self):
-        # real check using '/usr/bin/codesign --display --entitlements - /Applications/OmniGraffle.app'
-        return self.og.version()[0] >= '6'
-        # before: return self.og.version()[0] == '6' and os.path.exists(os.path.expanduser(self.SANDBOXED_DIR))
+        return self.backend.sandboxed()
 
     def get_sandbox_path(self):
-        version = self.og.version()[0]
-        path = os.path.expanduser(self.SANDBOXED_DIR % version)
+        return self.backend.sandbox_path()
 
-        if not os.path.exists(path):
-            raise RuntimeError('OmniGraffle is sandboxed but missing sandbox path: %s' % path)
-
-        return path
+    def scope(self):
+        """The canvases and layers selected on the commandline (see add_scope)."""
+        return data_model.Scope(canvases=getattr(self.args, 'canvas', None),
+                                layers=getattr(self.args, 'layer', None),
+                                exclude_layers=getattr(self.args, 'exclude_layer', None),
+                                skip_invisible_layers=getattr(self.args, 'skip_invisible_layers', False))
 
     def get_canvas_list(self):
         """Return a list of names of all the canvases in the document."""
@@ -58,24 +88,34 @@ class OmniGraffleSandboxedCommand(object):
                 not os.path.isfile(os.path.join(fname, "data.plist")):
             raise ValueError('File: %s does not exists' % fname)
 
-        print 'opening', fname
-
-        self.og.activate()
-
-        # adhoc fix for https://github.com/fikovnik/omnigraffle-export/issues/23
-        # apparently the process is sandboxed and cannot access the file
-        # 16/03/2015 13:01:54.000 kernel[0]: Sandbox: OmniGraffle(66840) deny file-read-data test.graffle
-        # therefore we first try to open it manually
+        print('opening', fname)
 
-        import subprocess
-        subprocess.call(['open', fname])
+        if self.offline:
+            self.doc = graffle_file.load(fname)
+            logging.debug('Loaded OmniGraffle file: ' + fname)
+            return
 
-        # window = self.og.windows.first()
-        # doc = window.document()
-        self.doc = self.og.open(fname)
+        self.doc = self.backend.open(fname)
 
         logging.debug('Opened OmniGraffle file: ' + fname)
 
+    def close_document(self, save=False):
+        """Close the current document, save it first if requested."""
+        if self.offline:
+            if save:
+                self.doc.save()
+        else:
+            if save:
+                self.og.windows.first().save()
+            self.og.windows.first().close()
+            try:
+                data_model.collection_schema.save(SCHEMA_FILE)
+            except (IOError, OSError) as e:
+                logging.warning('cannot save collection schema: %s', e)
+        if data_model.walk_stats:
+            print(data_model.walk_stats.report())
+        self.doc = None
+
     def open_copy_of_document_(self, filename, suffix):
         """create and open a copy of an omnigraffle document."""
         root, ext = os.path.splitext(filename)
@@ -83,9 +123,10 @@ class OmniGraffleSandboxedCommand(object):
         shutil.copyfile(filename, doc_copy)
         self.open_document(doc_copy)
 
-    def open_copy_of_document(self, source, target=None, suffix=None):
+    @staticmethod
+    def target_filename(source, target=None, suffix=None):
         """
-        Create and open a copy of an omnigraffle document.
+        Return the filename of a copy of source.
         Target takes precedence over sufix, if target is given and is a directory, the target
         file name will be created from target and the basename of source. If target is ommited,
         but suffix is given, the target filename will be created by extending source with suffix.
@@ -97,7 +138,12 @@ class OmniGraffleSandboxedCommand(object):
         if suffix and not target:
             root, ext = os.path.splitext(source)
             target = root + '-' + suffix + ext
-        print "copy:", source, target
+        return target
+
+    def open_copy_of_document(self, source, target=None, suffix=None):
+        """Create and open a copy of an omnigraffle document (see target_filename)."""
+        target = self.target_filename(source, target, suffix)
+        print("copy:", source, target)
         shutil.copyfile(source, target)
         self.open_document(target)
 
@@ -110,6 +156,51 @@ class OmniGraffleSandboxedCommand(object):
         logging.basicConfig(level=args.loglevel)
         return args
 
+    @staticmethod
+    def add_backend(parser):
+        parser.add_argument(
+            '--backend', choices=sorted(app_backend.BACKENDS),
+            help="how to control OmniGraffle (default: $%s or %s)" % (app_backend.BACKEND_VARIABLE,
+                                                                    app_backend.DEFAULT_BACKEND)
+        )
+        parser.add_argument(
+            '--latency', type=float,
+            help="seconds to wait per AppleEvent (simulated backend only)"
+        )
+
+    @staticmethod
+    def add_offline(parser):
+        parser.add_argument(
+            '--offline', action='store_true',
+            help="read the .graffle file directly instead of using OmniGraffle (runs without OmniGraffle)"
+        )
+
+    @staticmethod
+    def add_scope(parser):
+        parser.add_argument(
+            '--canvas', action='append', metavar='NAME',
+            help="only process canvases with this name or glob pattern (can be repeated)"
+        )
+        parser.add_argument(
+            '--layer', action='append', metavar='NAME',
+            help="only process layers with this name or glob pattern (can be repeated)"
+        )
+        parser.add_argument(
+            '--exclude-layer', action='append', metavar='NAME',
+            help="skip layers with this name or glob pattern (can be repeated)"
+        )
+        parser.add_argument(
+            '--skip-invisible-layers', action='store_true',
+            help="skip invisible layers"
+        )
+
+    @staticmethod
+    def add_stats(parser):
+        parser.add_argument(
+            '--stats', action='store_true',
+            help="print timing and collection statistics of the document traversal"
+        )
+
     @staticmethod
     def add_verbose(parser):
         parser.add_argument(
@@ -5,14 +5,316 @@ The OmniGraffle document data model, for traversing all elements in the
 document, e,g, to extract or inject text.
 """
 
-from functools import partial
+from collections import defaultdict
+from fnmatch import fnmatchcase
+import json
 import logging
-import appscript
+import os
+import threading
+import time
+
+try:
+    import appscript
+except ImportError:  # offline use, e.g. with omnigraffle.graffle_file on Linux
+    appscript = None
+
+
+class ElementError(Exception):
+    """An element has no such property or collection (raised by offline elements)."""
+
+
+# errors raised when accessing properties or collections an element does not have
+if appscript:
+    CommandError = (appscript.reference.CommandError, ElementError)
+else:
+    CommandError = ElementError
+
+
+def _key_name(key):
+    """Name of a property record key, for both appscript keywords and plain strings."""
+    return getattr(key, 'name', key)
+
+
+def prefetch_collection(collection, size):
+    """
+    Return the property records of all elements of collection with one bulk
+    properties() call, or None if the application can't do that.
+    """
+    if not size:
+        return []
+    try:
+        records = collection.properties()
+    except CommandError:
+        return None
+    if not isinstance(records, list) or len(records) != size:
+        return None
+    return records
+
+
+class CollectionSchema(object):
+    """
+    Which collections (e.g. 'incoming_lines') elements of a class (e.g. 'layer') have.
+
+    Probing a collection an element does not have costs an AppleEvent and an error,
+    so walk() only probes collections that are not known to be missing. The map is
+    seeded from OmniGraffle's scripting dictionary and refined with the results of
+    probes. Only the collections seen to be valid are recorded by walks (see WalkSchema)
+    and saved and loaded to be reused across runs: a failed probe may be transient
+    (e.g. a timeout), so collections learned to be missing are probed again in the
+    next traversal.
+    """
+
+    SEED = {
+        'layer': ['columns', 'incoming_lines', 'labels', 'outgoing_lines', 'rows'],
+        'shared_layer': ['columns', 'incoming_lines', 'labels', 'outgoing_lines', 'rows'],
+        'group': ['columns', 'labels', 'rows'],
+        'subgraph': ['columns', 'labels', 'rows'],
+        'table': ['labels'],
+        'line': ['columns', 'groups', 'rows', 'shapes', 'solids', 'subgraphs'],
+        'shape': ['columns', 'graphics', 'groups', 'labels', 'rows', 'shapes', 'solids', 'subgraphs'],
+        'solid': ['columns', 'graphics', 'groups', 'labels', 'rows', 'shapes', 'solids', 'subgraphs'],
+        'label': ['columns', 'graphics', 'groups', 'labels', 'rows', 'shapes', 'solids', 'subgraphs'],
+        'row': ['columns', 'groups', 'incoming_lines', 'labels', 'lines', 'outgoing_lines', 'rows',
+                'shapes', 'solids', 'subgraphs'],
+        'column': ['columns', 'groups', 'incoming_lines', 'labels', 'lines', 'outgoing_lines', 'rows',
+                   'shapes', 'solids', 'subgraphs'],
+    }
+
+    def __init__(self, seed=True):
+        self.valid = {}
+        self.missing = {}
+        self._lock = threading.Lock()  # the schema is shared by concurrent walks
+        if seed:
+            for class_name, collections in self.SEED.items():
+                self.missing[class_name] = set(collections)
+
+    def probe(self, class_name, collection_name):
+        """True if the collection might exist for elements of class class_name."""
+        if class_name is None:
+            return True
+        with self._lock:
+            return collection_name not in self.missing.get(class_name, ())
+
+    def record(self, class_name, collection_name, exists):
+        """Remember the result of a probe."""
+        if class_name is None:
+            return
+        with self._lock:
+            self._record(class_name, collection_name, exists)
+
+    def _record(self, class_name, collection_name, exists):
+        if exists:
+            self.valid.setdefault(class_name, set()).add(collection_name)
+            self.missing.get(class_name, set()).discard(collection_name)
+        elif collection_name not in self.valid.get(class_name, ()):
+            # only if no element of this class ever had the collection
+            self.missing.setdefault(class_name, set()).add(collection_name)
+
+    def is_valid(self, class_name, collection_name):
+        """True if some element of class class_name had the collection."""
+        with self._lock:
+            return collection_name in self.valid.get(class_name, ())
+
+    def load(self, path):
+        """
+        Merge the valid collections saved with save(), ignore a missing or broken file
+        (and the missing collections of files saved by older versions).
+        """
+        try:
+            with open(path) as fp:
+                data = json.load(fp)
+        except (IOError, OSError, ValueError) as e:
+            logging.debug('no collection schema loaded from %s: %s', path, e)
+            return
+        for class_name, entry in data.items():
+            for collection_name in entry.get('valid', []):
+                self.record(class_name, collection_name, True)
+
+    def save(self, path):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with self._lock:
+            data = dict((class_name, dict(valid=sorted(collections)))
+                        for class_name, collections in self.valid.items())
+        with open(path, 'w') as fp:
+            json.dump(data, fp, indent=2, sort_keys=True)
+
+
+# used by walk() unless another schema is passed in
+collection_schema = CollectionSchema()
+
+
+class WalkSchema(object):
+    """
+    The CollectionSchema as used by one traversal: valid collections are recorded in the
+    schema, collections that failed are skipped for the rest of the traversal only. A
+    schema shared by many traversals (e.g. in the export server) must not skip content
+    forever because of one failed AppleEvent.
+    """
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.missing = {}
+
+    def probe(self, class_name, collection_name):
+        return (collection_name not in self.missing.get(class_name, ()) and
+                self.schema.probe(class_name, collection_name))
+
+    def record(self, class_name, collection_name, exists):
+        if class_name is None:
+            return
+        if exists:
+            self.schema.record(class_name, collection_name, True)
+        elif not self.schema.is_valid(class_name, collection_name):
+            self.missing.setdefault(class_name, set()).add(collection_name)
+
+
+class WalkContext(object):
+    """
+    Where an item is in the document tree: the document, canvas and layer that
+    contain it, its depth and the path of items from the item walk() started with.
+
+    Every item has its own context, so several documents or canvases can be walked
+    concurrently (e.g. in threads) without mixing up canvas names.
+    """
+
+    def __init__(self, document=None, canvas=None, layer=None, path=(), shared=None, schema=None):
+        self.document = document
+        self.canvas = canvas
+        self.layer = layer
+        self.path = path
+        self.schema = schema  # of the traversal, collection_schema if None
+        # per traversal: shared layer name -> canvases that include it
+        self._shared_layer_canvases = shared if shared is not None else {}
+
+    def __repr__(self):
+        return 'WalkContext(%s)' % ' / '.join(type(i).__name__ for i in self.path)
+
+    @property
+    def depth(self):
+        return len(self.path) - 1
+
+    def enter(self, item):
+        """The context of item, a child of the item of this context."""
+        context = WalkContext(self.document, self.canvas, self.layer, self.path + (item,),
+                              self._shared_layer_canvases, self.schema)
+        if isinstance(item, Document):
+            context.document = item
+        elif isinstance(item, Canvas):
+            context.canvas = item
+        elif isinstance(item, Layer):
+            context.layer = item
+        return context
+
+    @property
+    def canvases(self):
+        """
+        All canvases the item is on: shared layers are walked only once, but belong
+        to all canvases that include them.
+        """
+        if self.layer is None or not self.layer.is_shared_layer() or self.document is None:
+            return [self.canvas] if self.canvas is not None else []
+        if not self._shared_layer_canvases:
+            schema = self.schema if self.schema is not None else collection_schema
+            for canvas in self.document._iter_children(schema, ['Canvas']):
+                for layer in canvas._iter_children(schema, ['Layer']):
+                    if layer.is_shared_layer():
+                        self._shared_layer_canvases.setdefault(layer.name, []).append(canvas)
+        return self._shared_layer_canvases.get(self.layer.name, [self.canvas])
+
+
+def _matches(name, patterns):
+    """True if name is one of patterns or matches one of the glob patterns."""
+    return any(name == p or fnmatchcase(name, p) for p in patterns)
+
+
+class Scope(object):
+    """
+    The canvases and layers a traversal visits.
+
+    canvases and layers are lists of names or glob patterns (e.g. 'intro-*') of the
+    canvases and layers to visit (None: all), exclude_layers of layers to skip.
+    Unselected canvases and layers are skipped without fetching anything below them.
+    """
+
+    def __init__(self, canvases=None, layers=None, exclude_layers=None, skip_invisible_layers=False):
+        self.canvases = canvases
+        self.layers = layers
+        self.exclude_layers = exclude_layers
+        self.skip_invisible_layers = skip_invisible_layers
+
+    def __repr__(self):
+        return 'Scope(canvases=%r, layers=%r, exclude_layers=%r, skip_invisible_layers=%r)' % (
+            self.canvases, self.layers, self.exclude_layers, self.skip_invisible_layers)
+
+    def includes_canvas(self, canvas):
+        return not self.canvases or _matches(canvas.name, self.canvases)
+
+    def includes_layer(self, layer):
+        if self.layers and not _matches(layer.name, self.layers):
+            return False
+        if self.exclude_layers and _matches(layer.name, self.exclude_layers):
+            return False
+        if self.skip_invisible_layers:
+            try:
+                return bool(layer._get('visible'))
+            except CommandError:
+                pass
+        return True
+
+
+# trace output of walk(), enable with logging.getLogger('omnigraffle.data_model').setLevel(logging.DEBUG)
+logger = logging.getLogger(__name__)
 
 
 def debug(level, *args):
-    msg = "|   " * level + " ".join(args)
-    logging.debug(msg)
+    """
+    Log args indented by level. Callable args are called to get the value, but only
+    if tracing is enabled, so expensive values (e.g. item.info) cost nothing otherwise.
+    """
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    args = [a() if callable(a) else a for a in args]
+    logger.debug("|   " * level + " ".join(u'%s' % a for a in args))
+
+
+class WalkStats(object):
+    """Per-node timing and per-collection counters of walk(), shared by concurrent walks."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.nodes = defaultdict(int)  # class -> number of nodes visited
+        self.seconds = defaultdict(float)  # class -> time spent on the nodes (without children)
+        self.probes = defaultdict(int)  # (class, collection) -> collections fetched
+        self.failed = defaultdict(int)  # (class, collection) -> fetches that failed
+        self.skipped = defaultdict(int)  # (class, collection) -> fetches avoided by the schema
+        self.items = defaultdict(int)  # (class, collection) -> elements in the collections
+
+    def add(self, counter, key, value=1):
+        """Add value to the counter (e.g. 'probes') of key."""
+        with self._lock:
+            getattr(self, counter)[key] += value
+
+    def report(self):
+        """The statistics as text."""
+        with self._lock:
+            return self._report()
+
+    def _report(self):
+        lines = ['%-14s %8s %10s' % ('class', 'nodes', 'seconds')]
+        for class_name in sorted(self.nodes):
+            lines.append('%-14s %8d %10.4f' % (class_name, self.nodes[class_name], self.seconds[class_name]))
+        lines.append('')
+        lines.append('%-30s %8s %8s %8s %8s' % ('collection', 'fetched', 'failed', 'skipped', 'items'))
+        for key in sorted(set(self.probes) | set(self.skipped)):
+            lines.append('%-30s %8d %8d %8d %8d' % ('%s.%s' % key, self.probes[key], self.failed[key],
+                                                    self.skipped[key], self.items[key]))
+        return '\n'.join(lines)
+
+
+# collect statistics in all walks, e.g. data_model.walk_stats = WalkStats()
+walk_stats = None
 
 
 class Item(object):
@@ -25,69 +327,258 @@ class Item(object):
     # add all possible classes to children so none are missed
     children = ['Column', 'Graphic', 'Group', 'IncomingLine', 'Label', 'Line', 'OutgoingLine',
                 'Row', 'Shape', 'Solid', 'Subgraph']
+    # element classes (as in item.class_) the collection of this class contains
+    element_classes = ()
 
-    _current_canvas_name = ''
-
-    def __init__(self, item):
+    def __init__(self, item, properties=None, context=None):
+        """context is the context of the parent item, if any."""
         self.item = item
+        self.context = (context or WalkContext()).enter(self)
+        self._reference = None  # (collection name, index) in the parent item
+        self._identity = None
+        # snapshot of the item's properties, so each property costs at most one AppleEvent
+        self._snapshot = {}
+        self._prefetched = False
+        if properties is not None:
+            self._set_snapshot(properties)
+
+    def _set_snapshot(self, properties):
+        self._snapshot = dict((_key_name(k), v) for k, v in properties.items())
+        self._prefetched = True
+
+    def prefetch(self):
+        """Fetch all properties of the item with a single properties() call."""
+        if self._prefetched:
+            return
+        try:
+            self._set_snapshot(self.item.properties())
+        except CommandError:
+            pass  # served one by one
 
-    def walk(self, callback, skip_invisible_layers=False, nodes_visited=None, level=0):
+    def _get(self, name):
+        """Return the property name, from the snapshot if possible."""
+        try:
+            return self._snapshot[name]
+        except KeyError:
+            if self._prefetched:
+                raise ElementError("item has no property '%s'" % name)
+        value = self._snapshot[name] = getattr(self.item, name)()
+        return value
+
+    def _get_text_attribute(self, name):
+        """Return an attribute (color, font, size) of the item's text, cached like _get."""
+        key = 'text_' + name
+        if key not in self._snapshot:
+            self._snapshot[key] = getattr(self.item.text, name)()
+        return self._snapshot[key]
+
+    def _invalidate(self, name):
+        self._snapshot.pop(name, None)
+        self._prefetched = False
+
+    def walk(self, callback, skip_invisible_layers=False, nodes_visited=None, level=0, schema=None,
+             stats=None, scope=None):
         """
         Traverse the a document tree and invoke callback on each element.
+        element.context tells where the element is (document, canvas, layer, path).
+        scope (a Scope) restricts the traversal to some canvases and layers.
         # TODO: apparently some items are visited more than once, others are never visited
         """
-        debug = partial(globals()['debug'], level)
-
-        # prevent visited nodes from being visited again:
-        if not nodes_visited:
-            nodes_visited = set()  # init not cache
-        try:
-            if self.item.id() in nodes_visited:
-                return
-            else:
-                nodes_visited.add(self.item.id())
-        except TypeError: 
-            # sometimes this is unhashable, e.g. type: 'list'
-            # TODO: when?
-            pass # import pdb;pdb.set_trace()
-        except appscript.reference.CommandError:
-            pass  # items without id cannot be tracked
+        if schema is None:
+            schema = collection_schema
+        if not isinstance(schema, WalkSchema):
+            schema = WalkSchema(schema)
+        self.context.schema = schema
+        if stats is None:
+            stats = walk_stats
+        tracing = logger.isEnabledFor(logging.DEBUG)
+        if stats:
+            start = time.time()
+
+        # prevent visited nodes (e.g. shared layers on several canvases) from being visited again:
+        if nodes_visited is None:
+            nodes_visited = set()
+        self.prefetch()
+        if self.identity in nodes_visited:
+            return
 
         if isinstance(self, Canvas):
-            debug("\n\n-----------------Canvas: '%s'-----------------\n" % self.item.name())
-            Item._current_canvas_name = self.item.name()
+            if tracing:
+                debug(level, "\n\n-----------------Canvas: '%s'-----------------\n" % self.name)
+            if scope and not scope.includes_canvas(self):
+                if tracing:
+                    debug(level, "\n...skipped canvas ...\n")
+                return
         if isinstance(self, Layer):
-            debug("\n\n---Layer: '%s'---\n" % self.item.name())
-            if skip_invisible_layers and not self.item.visible():
-                debug("\n...skipped invisible layer ...\n")
+            if tracing:
+                debug(level, "\n\n---Layer: '%s'---\n" % self.name)
+            if skip_invisible_layers and not self._get('visible'):
+                if tracing:
+                    debug(level, "\n...skipped invisible layer ...\n")
                 return  # skip invisible layers
+            if scope and not scope.includes_layer(self):
+                if tracing:
+                    debug(level, "\n...skipped layer ...\n")
+                return
+        # only now: a shared layer skipped on one canvas may be in scope on another
+        nodes_visited.add(self.identity)
 
-        debug('::::', self.info)
-
-        # import pdb; pdb.set_trace()
+        if tracing:
+            debug(level, '::::', lambda: self.info)
 
         callback(self)
 
-        for child_class in self.children:
-            debug('child class', child_class)
+        if stats:
+            class_name = self._class_name()
+            stats.add('nodes', class_name)
+            stats.add('seconds', class_name, time.time() - start)
+        for i in self._iter_children(schema, stats=stats, level=level):
+            i.walk(callback, skip_invisible_layers, nodes_visited, level + 1, schema, stats, scope)
+
+    def _class_name(self):
+        """The element class as string (e.g. 'shape'), None if unknown."""
+        return _key_name(self.class_) if self.class_ is not None else None
+
+    def _iter_children(self, schema, child_classes=None, stats=None, level=0):
+        """
+        Generate the items of all child collections (or of the collections of
+        child_classes), fetching one collection at a time.
+        """
+        tracing = logger.isEnabledFor(logging.DEBUG)
+        class_name = self._class_name()
+        for child_class in self.children if child_classes is None else child_classes:
             klass = globals()[child_class]
+            if not schema.probe(class_name, klass.collection_name):
+                if stats:
+                    stats.add('skipped', (class_name, klass.collection_name))
+                continue
+            if stats:
+                stats.add('probes', (class_name, klass.collection_name))
             collection = getattr(self.item, klass.collection_name)
             try:
-                collection()
-            except appscript.reference.CommandError:
-                debug("\n...skipped collection", child_class)
+                items = collection()
+            except CommandError:
+                if tracing:
+                    debug(level, "\n...skipped collection", child_class)
                 # apparently there's a problem with some collections, e.g. 'IncomingLine' in Graphics
+                schema.record(class_name, klass.collection_name, False)
+                if stats:
+                    stats.add('failed', (class_name, klass.collection_name))
                 continue
+            schema.record(class_name, klass.collection_name, True)
             try:
-                size = len(collection())
+                size = len(items)
             except TypeError:  # the size of some collections cannot be determined
-                debug("+--- processing collection", child_class, "size: (not available)")
+                if tracing:
+                    debug(level, "+--- processing collection", child_class, "size: (not available)")
             else:
-                debug("+--- processing collection", child_class, "size: %s" % size)
-                for idx, item in enumerate(collection()):
-                    debug("   ", child_class, "# %s" % idx)
-                    i = klass(item)
-                    i.walk(callback, skip_invisible_layers, nodes_visited, level + 1)
+                if tracing:
+                    debug(level, "+--- processing collection", child_class, "size: %s" % size)
+                if stats:
+                    stats.add('items', (class_name, klass.collection_name), size)
+                records = prefetch_collection(collection, size)
+                for idx, item in enumerate(items):
+                    if tracing:
+                        debug(level, "   ", child_class, "# %s" % idx)
+                    child = klass(item, records[idx] if records else None, self.context)
+                    child._reference = (klass.collection_name, idx)
+                    yield child
+
+    def iter_items(self, classes=None, where=None, canvases=None, layers=None,
+                   skip_invisible_layers=False, schema=None, exclude_layers=None, scope=None):
+        """
+        Generate this item and all items below it, depth first like walk(). Without
+        classes, items come in the same order as walk(); with classes, the collections
+        of the wanted classes are fetched first, so that an item found in several
+        collections is generated as an instance of a wanted class, and the order differs.
+
+        Only items that are instances of classes (e.g. (Shape, Line)) and for which
+        where(item) is true are generated. canvases, layers and exclude_layers (names
+        or glob patterns) or a Scope restrict the traversal to some canvases and layers.
+        Collections that can't contain matching items are not fetched, and since items
+        are fetched while iterating, consumers can stop early, e.g. after the first match.
+        """
+        if schema is None:
+            schema = collection_schema
+        if not isinstance(schema, WalkSchema):
+            schema = WalkSchema(schema)
+        self.context.schema = schema
+        if scope is None:
+            scope = Scope(canvases, layers, exclude_layers, skip_invisible_layers)
+        if classes is not None:
+            classes = tuple(classes)
+        wanted = {}  # element class -> child classes that can yield matches
+        nodes_visited = set()
+        stack = [iter([self])]  # explicit stack: nesting depth is not limited by recursion
+        while stack:
+            try:
+                item = next(stack[-1])
+            except StopIteration:
+                stack.pop()
+                continue
+
+            item.prefetch()
+            if item.identity in nodes_visited:
+                continue
+            if isinstance(item, Canvas) and not scope.includes_canvas(item):
+                continue
+            if isinstance(item, Layer) and not scope.includes_layer(item):
+                continue
+            nodes_visited.add(item.identity)
+
+            if (classes is None or isinstance(item, classes)) and (where is None or where(item)):
+                yield item
+
+            class_name = item._class_name()
+            key = (type(item), class_name)
+            if key not in wanted:
+                children = [c for c in item.children
+                            if _can_yield(globals()[c], classes, schema)]
+                if classes is not None:
+                    # items are returned once, as item of the first collection they are found in,
+                    # so fetch the collections of the wanted classes first
+                    matching = [c for c in children if issubclass(globals()[c], classes)]
+                    children = matching + [c for c in children if c not in matching]
+                wanted[key] = children
+            if wanted[key]:
+                stack.append(item._iter_children(schema, wanted[key]))
+
+    def is_shared_layer(self):
+        return isinstance(self, Layer) and self._class_name() == 'shared_layer'
+
+    @property
+    def identity(self):
+        """
+        A key that identifies the item in the document, used to visit each item once.
+
+        Ids are unique per canvas or shared layer, so the key combines the id and
+        the canvas or shared layer. Items without (accessible) id, e.g. layers and
+        the contents of shared layers when accessed with appscript, are identified
+        by the path of collection indexes that leads to them. Shared layers are
+        identified by name, so their contents are the same on all canvases.
+        """
+        if self._identity is None:
+            self._identity = self._make_identity()
+        return self._identity
+
+    def _make_identity(self):
+        if self.is_shared_layer():
+            return ('shared_layer', self.name)
+        context = self.context
+        parent = context.path[-2] if len(context.path) > 1 else None
+        try:
+            key = self._get('id')
+            hash(key)
+        except (CommandError, TypeError):
+            # no id or unhashable, e.g. type: 'list'
+            return (parent.identity if parent else None, self._reference)
+        if context.layer is not None and context.layer is not self and context.layer.is_shared_layer():
+            anchor = context.layer
+        elif context.canvas is not None and context.canvas is not self:
+            anchor = context.canvas
+        else:
+            anchor = None
+        return (anchor.identity if anchor else None, key)
 
     @property
     def info(self):
@@ -95,53 +586,57 @@ class Item(object):
 
     @property
     def canvas_name(self):
-        # this is not thread-safe!
-        return Item._current_canvas_name
+        return self.context.canvas.name if self.context.canvas else ''
 
     @property
     def properties(self):
-        # this is not thread-safe!
         return self.item.properties()
 
     @properties.setter
     def properties(self, value):
         self.item.properties.set(value)
+        self._snapshot = {}
+        self._prefetched = False
 
     @property
     def class_(self):
         try:
-            return self.item.class_()
-        except appscript.reference.CommandError:
+            return self._get('class_')
+        except CommandError:
             return None
 
     @property
     def id(self):
         try:
-            return self.item.id()
-        except appscript.reference.CommandError:
+            return self._get('id')
+        except CommandError:
             return 'no id'
 
     @property
     def text(self):
         try:
-            return self.item.text()
-        except appscript.reference.CommandError:
+            return self._get('text')
+        except CommandError:
             return ''
 
     @text.setter
     def text(self, value):
         self.item.text.set(value)
+        self._invalidate('text')
+        for attribute in ('text_color', 'text_font', 'text_size'):
+            self._snapshot.pop(attribute, None)
 
     @property
     def name(self):
         try:
-            return self.item.name()
-        except appscript.reference.CommandError:
+            return self._get('name')
+        except CommandError:
             return ''
 
     @name.setter
     def name(self, value):
         self.item.name.set(value)
+        self._invalidate('name')
 
 
 class Named(object):
@@ -152,127 +647,181 @@ class Filled(object):
     @property
     def fill_color(self):
         try:
-            return self.item.fill_color()
-        except appscript.reference.CommandError:
-            logging.debug("Item has not fill color: %s" % self.info)
+            return self._get('fill_color')
+        except CommandError:
+            debug(0, "Item has not fill color:", lambda: self.info)
             return None
 
     @fill_color.setter
     def fill_color(self, value):
         self.item.fill_color.set(value)
+        self._invalidate('fill_color')
 
 
 class HasStroke(object):
     @property
     def stroke_color(self):
         try:
-            return self.item.stroke_color()
-        except appscript.reference.CommandError:
-            logging.debug("Item has not stroke color: %s" % self.info)
+            return self._get('stroke_color')
+        except CommandError:
+            debug(0, "Item has not stroke color:", lambda: self.info)
             return None
 
     @stroke_color.setter
     def stroke_color(self, value):
         self.item.stroke_color.set(value)
+        self._invalidate('stroke_color')
 
 
 class TextContainer(object):
     @property
     def text_color(self):
-        return self.item.text.color()
+        return self._get_text_attribute('color')
 
     @text_color.setter
     def text_color(self, value):
         self.item.text.color.set(value)
+        self._snapshot.pop('text_color', None)
 
     @property
     def text_font(self):
-        return self.item.text.font()
+        return self._get_text_attribute('font')
 
     @text_font.setter
     def text_font(self, value):
         self.item.text.font.set(value)
+        self._snapshot.pop('text_font', None)
 
     @property
     def text_size(self):
-        return self.item.text.size()
+        return self._get_text_attribute('size')
 
     @text_size.setter
     def text_size(self, value):
         self.item.text.size.set(value)
+        self._snapshot.pop('text_size', None)
+
+
+def _can_yield(klass, classes, schema):
+    """
+    True if the collection of items of klass, or the collections below it, can
+    contain instances of classes, as far as is known from the schema.
+    """
+    if classes is None:
+        return True
+    if issubclass(klass, classes):
+        return True
+    seen = set()
+    pending = list(klass.element_classes)
+    while pending:
+        class_name = pending.pop()
+        if class_name in seen:
+            continue
+        seen.add(class_name)
+        for child_class in CHILDREN.get(class_name, Item.children):
+            child = globals()[child_class]
+            if not schema.probe(class_name, child.collection_name):
+                continue
+            if issubclass(child, classes):
+                return True
+            pending.extend(child.element_classes)
+    return False
 
 
 class Document(Item):
+    element_classes = ('document',)
     children = ['Canvas']
 
 
 class Canvas(Item, Named):
     collection_name = 'canvases'
+    element_classes = ('canvas',)
     # children = ['Layer', 'Subgraph', 'Group', 'Line', 'Shape', 'Solid', 'Graphic']
     children = ['Layer']
 
 
 class Layer(Item):
     collection_name = 'layers'
+    element_classes = ('layer', 'shared_layer')
     # children = ['Subgraph', 'Group', 'Line', 'Shape', 'Solid', 'Graphic']
 
 
 class TableSlice(Item):
     """A row or column of a table."""
     collection_name = 'table_slices'
+    element_classes = ('column', 'row')
     # children = ['Group']  # TODO: what else?'?
 
 
 class Column(Item):
     collection_name = 'columns'
+    element_classes = ('column',)
     # children = ['Group']  # TODO: what else?'?
 
 
 class Row(Item):
     collection_name = 'rows'
+    element_classes = ('row',)
     # children = ['Group', 'Graphic']  # TODO: what else?'?
 
 
 class Graphic(Item, HasStroke, TextContainer):  # Group', 'Line', 'Solid
     collection_name = 'graphics'
+    element_classes = ('group', 'label', 'line', 'shape', 'solid', 'subgraph', 'table')
     # children = ['IncomingLine', 'OutgoingLine', 'Line']  # TODO: also contains "user data items', 'what is that?'"
 
 
 class Group(Graphic):
     collection_name = 'groups'
+    element_classes = ('group', 'subgraph', 'table')
     # children = ['Subgraph', 'Group', 'Shape', 'Solid', 'Graphic']
 
 
 class IncomingLine(Graphic):
     collection_name = 'incoming_lines'
+    element_classes = ('line',)
 
 
 class Line(Graphic):
     collection_name = 'lines'
+    element_classes = ('line',)
     # children = ['Label']
 
 
 class OutgoingLine(Graphic):
     collection_name = 'outgoing_lines'
+    element_classes = ('line',)
 
 
 class Solid(Graphic, Filled, TextContainer):  # Polygon', 'Shape
     collection_name = 'solids'
+    element_classes = ('label', 'shape', 'solid')
 
 
 class Shape(Solid, Named):
     collection_name = 'shapes'
+    element_classes = ('label', 'shape')
 
 
 class Label(Shape, Named):
     collection_name = 'labels'
+    element_classes = ('label',)
 
 
 class Subgraph(Group):
     collection_name = 'subgraphs'
+    element_classes = ('subgraph',)
     # children = ['Group', 'Shape', 'Solid', 'Subgraph', 'Graphic']
 
 
 class Table(Group):
     collection_name = 'tables'
+    element_classes = ('table',)
     # children = ['Column', 'Row']
+
+
+# child classes of the items of an element class, see Item.children
+CHILDREN = {
+    'document': Document.children,
+    'canvas': Canvas.children,
+}
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Fingerprints of canvases, computed from the .graffle file without OmniGraffle.
+
+The fingerprint of a canvas changes whenever something changes that affects how
+the canvas is exported: its graphics, layers and styles, the shared layer it
+uses, the images it shows and the page setup of the document. It stays the same
+when only the window, the zoom or the active layer changes.
+
+    >>> canvas_fingerprints('tests/minimal.graffle')
+    OrderedDict([('canvas-1', '3c1f...'), ('canvas-2', '9a0e...')])
+"""
+
+from collections import OrderedDict
+import datetime
+import glob
+import hashlib
+import os
+
+from omnigraffle import graffle_file
+
+# keys of sheets (and documents with a single canvas) that do not change the exported canvas
+VOLATILE_KEYS = frozenset([
+    'ActiveLayerIndex', 'ApplicationVersion', 'BaseZoom', 'CreationDate', 'Creator',
+    'GuidesLocked', 'GuidesVisible', 'ImageCounter', 'LinksVisible', 'MagnetsVisible',
+    'ModificationDate', 'Modifier', 'NotesVisible', 'OriginVisible',
+    'SmartAlignmentGuidesActive', 'SmartDistanceGuidesActive', 'WindowInfo',
+    # stored and fingerprinted separately
+    'Images', 'MasterSheets', 'Sheets',
+])
+
+# keys of the document that affect all canvases
+DOCUMENT_KEYS = ('PrintInfo', 'UseEntirePage')
+
+
+def _update(digest, value):
+    """Feed value (a property list) into digest, with dictionary keys in sorted order."""
+    if isinstance(value, dict):
+        digest.update(b'{')
+        for key in sorted(value):
+            _update(digest, key)
+            _update(digest, value[key])
+        digest.update(b'}')
+    elif isinstance(value, (list, tuple)):
+        digest.update(b'[')
+        for item in value:
+            _update(digest, item)
+        digest.update(b']')
+    elif isinstance(graffle_file.plist_data(value), bytes):
+        value = graffle_file.plist_data(value)
+        digest.update(b'b%d:' % len(value))
+        digest.update(value)
+    elif isinstance(value, datetime.datetime):
+        _update(digest, value.isoformat())
+    else:
+        if not isinstance(value, type(u'')):
+            value = u'%s:%r' % (type(value).__name__, value)  # numbers, booleans, None
+        value = value.encode('utf-8')
+        digest.update(b's%d:' % len(value))
+        digest.update(value)
+
+
+def image_ids(value, ids=None):
+    """Collect the ids of all images referenced in value (a property list) in the set ids, return it."""
+    if ids is None:
+        ids = set()
+    if isinstance(value, dict):
+        if 'ImageID' in value:
+            ids.add(value['ImageID'])
+        for item in value.values():
+            image_ids(item, ids)
+    elif isinstance(value, list):
+        for item in value:
+            image_ids(item, ids)
+    return ids
+
+
+class DocumentFingerprint(object):
+    """Fingerprints of all canvases of one .graffle file (or package)."""
+
+    def __init__(self, path, data=None):
+        self.path = os.path.abspath(path)
+        if data is None:
+            data, dummy = graffle_file.read_plist(self.path)
+        self.data = data
+        self._images = dict((image.get('ID'), image) for image in data.get('Images') or [])
+        self._masters = dict((master.get('SheetTitle'), master) for master in data.get('MasterSheets') or [])
+        self._image_digests = {}
+
+    def sheets(self):
+        if 'Sheets' in self.data:
+            return self.data['Sheets']
+        return [self.data]  # documents with one canvas have no list of sheets
+
+    def _image_digest(self, image_id):
+        """Hash of the image image_id, embedded in the plist or stored in the package."""
+        if image_id not in self._image_digests:
+            digest = hashlib.sha1()
+            image = self._images.get(image_id)
+            if image is not None and 'RawData' in image:
+                digest.update(graffle_file.plist_data(image['RawData']))
+            elif os.path.isdir(self.path):
+                for fname in sorted(glob.glob(os.path.join(self.path, 'image%s.*' % image_id))):
+                    with open(fname, 'rb') as fp:
+                        for block in iter(lambda: fp.read(1 << 16), b''):
+                            digest.update(block)
+            self._image_digests[image_id] = digest.hexdigest()
+        return self._image_digests[image_id]
+
+    def canvas(self, sheet):
+        """The fingerprint of the canvas stored in sheet."""
+        digest = hashlib.sha1()
+        _update(digest, dict((k, v) for k, v in sheet.items() if k not in VOLATILE_KEYS))
+        _update(digest, [self.data.get(key) for key in DOCUMENT_KEYS])
+        master = self._masters.get(sheet.get('MasterSheet'))
+        _update(digest, master)
+        ids = image_ids(sheet.get('GraphicsList'), set())
+        if master is not None:
+            image_ids(master.get('GraphicsList'), ids)
+        for image_id in sorted(ids):
+            _update(digest, self._image_digest(image_id))
+        return digest.hexdigest()
+
+    def canvases(self):
+        """OrderedDict canvas name -> fingerprint, in document order."""
+        result = OrderedDict()
+        for sheet in self.sheets():
+            result.setdefault(sheet.get('SheetTitle', ''), self.canvas(sheet))
+        return result
+
+
+def canvas_fingerprints(path):
+    """Return an OrderedDict canvas name -> fingerprint for the .graffle file path."""
+    return DocumentFingerprint(path).canvases()
+
+
+def combine(*parts):
+    """Fingerprint of several fingerprints (or other strings), e.g. a canvas and export settings."""
+    digest = hashlib.sha1()
+    _update(digest, list(parts))
+    return digest.hexdigest()
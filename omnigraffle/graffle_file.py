@@ -0,0 +1,727 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Offline access to OmniGraffle documents.
+
+Reads the (optionally gzipped) XML property list of a .graffle file, or the
+data.plist inside a .graffle package, and exposes canvases, layers and graphics
+through elements that behave like the appscript references to OmniGraffle's
+scripting dictionary: properties are called to get their value and have a set()
+method, collections are called to get a list of elements.
+
+That way the classes in omnigraffle.data_model, and everything built on them,
+work without OmniGraffle and on any platform:
+
+    >>> doc = open_document('tests/minimal.graffle')
+    >>> doc.walk(callback)
+"""
+
+import gzip
+import io
+import os
+import plistlib
+
+from omnigraffle.data_model import Document, ElementError
+from omnigraffle.rtf import RichText, make_rtf
+
+try:
+    _loads = plistlib.loads
+    _dumps = plistlib.dumps
+except AttributeError:  # Python 2
+    _loads = plistlib.readPlistFromString
+    _dumps = plistlib.writePlistToString
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+def plist_data(value):
+    """The bytes of a <data> value of a plist (plistlib returns a plistlib.Data on Python 2)."""
+    return getattr(value, 'data', value)
+
+# 'Class' in the plist -> class_ of the element
+GRAPHIC_CLASSES = {
+    'ShapedGraphic': 'shape',
+    'LineGraphic': 'line',
+    'Group': 'group',
+    'TableGroup': 'table',
+    'SolidGraphic': 'solid',
+}
+
+# element collections -> element classes they contain
+COLLECTION_CLASSES = {
+    'graphics': None,  # all
+    'shapes': ('shape', 'label'),
+    'solids': ('shape', 'label', 'solid'),
+    'lines': ('line',),
+    'groups': ('group', 'subgraph', 'table'),
+    'subgraphs': ('subgraph',),
+}
+
+DEFAULT_FILL = {'r': 1, 'g': 1, 'b': 1}
+DEFAULT_STROKE = {'r': 0, 'g': 0, 'b': 0}
+
+
+def read_plist(path):
+    """Return the contents of a .graffle file (or package) and whether it was compressed."""
+    if os.path.isdir(path):
+        path = os.path.join(path, 'data.plist')
+    with open(path, 'rb') as fp:
+        raw = fp.read()
+    compressed = raw[:2] == GZIP_MAGIC
+    if compressed:
+        raw = gzip.GzipFile(fileobj=io.BytesIO(raw)).read()
+    return _loads(raw), compressed
+
+
+def write_plist(path, data, compressed=False):
+    """Write the contents of a .graffle file (or package)."""
+    if os.path.isdir(path):
+        path = os.path.join(path, 'data.plist')
+    raw = _dumps(data)
+    if compressed:
+        buf = io.BytesIO()
+        with gzip.GzipFile(fileobj=buf, mode='wb') as gz:
+            gz.write(raw)
+        raw = buf.getvalue()
+    with open(path, 'wb') as fp:
+        fp.write(raw)
+
+
+def load(path):
+    """Load a .graffle file and return the document element."""
+    return GraffleDocument(path)
+
+
+def open_document(path):
+    """Load a .graffle file and return a data_model.Document for it."""
+    return Document(load(path))
+
+
+def color_components(color, default):
+    """Convert a plist color ({'r': .., 'g': .., 'b': ..} or {'w': ..}) to 16 bit components."""
+    color = color or default
+
+    def component(key):
+        return int(round(float(color.get(key, color.get('w', 0))) * 65535))
+    return (component('r'), component('g'), component('b'))
+
+
+def plist_color(color):
+    """Convert 16 bit components to a plist color."""
+    return dict(r=color[0] / 65535.0, g=color[1] / 65535.0, b=color[2] / 65535.0)
+
+
+class Property(object):
+    """A property of an element: call it to get the value, use set() to change it."""
+
+    def __init__(self, get, set_=None):
+        self._get = get
+        self._set = set_
+
+    def __call__(self):
+        return self._get()
+
+    def set(self, value):
+        if self._set is None:
+            raise ElementError('property is read-only')
+        self._set(value)
+
+
+class Missing(object):
+    """A property or collection an element does not have."""
+
+    def __init__(self, element, name):
+        self._element = element
+        self._name = name
+
+    def __call__(self):
+        raise ElementError("Can't get %s of %r" % (self._name, self._element))
+
+    def set(self, value):
+        raise ElementError("Can't set %s of %r" % (self._name, self._element))
+
+    def __getitem__(self, idx):
+        return self
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return Missing(self._element, '%s.%s' % (self._name, name))
+
+
+class Collection(object):
+    """A collection of elements: call it to get the list of elements."""
+
+    def __init__(self, elements):
+        self._elements = elements
+
+    def __call__(self):
+        return list(self._elements())
+
+    def __getitem__(self, idx):
+        return self()[idx]
+
+    def __getattr__(self, name):
+        """Bulk get, e.g. graphics.text() returns the texts of all graphics."""
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return Property(lambda: [getattr(e, name)() for e in self._elements()])
+
+
+class Element(object):
+    """
+    Base class for all elements.
+
+    Properties are implemented as get_<name> / set_<name> methods, collections as
+    elements_<name> methods, everything else is reported as missing.
+    """
+
+    class_name = 'item'
+
+    def __init__(self, document):
+        self._document = document
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        elements = getattr(type(self), 'elements_' + name, None)
+        if elements is not None:
+            return Collection(lambda: elements(self))
+        getter = getattr(type(self), 'get_' + name, None)
+        if getter is not None:
+            setter = getattr(type(self), 'set_' + name, None)
+            return Property(lambda: getter(self),
+                            (lambda value: setter(self, value)) if setter else None)
+        return Missing(self, name)
+
+    def get_class_(self):
+        return self.class_name
+
+    def get_properties(self):
+        """All properties as a dict, like appscript's properties()."""
+        result = {}
+        for attr in dir(type(self)):
+            if attr.startswith('get_') and attr != 'get_properties':
+                try:
+                    result[attr[4:]] = getattr(self, attr)()
+                except ElementError:
+                    pass
+        return result
+
+    def set_properties(self, values):
+        for key, value in values.items():
+            getattr(self, key).set(value)
+
+    def _changed(self):
+        self._document._is_modified = True
+
+
+class GraffleDocument(Element):
+    """The document, i.e. the contents of a .graffle file."""
+
+    class_name = 'document'
+
+    def __init__(self, path):
+        super(GraffleDocument, self).__init__(self)
+        self._path = os.path.abspath(path)
+        self._data, self._compressed = read_plist(self._path)
+        self._is_modified = False
+        if 'Sheets' in self._data:
+            sheets = self._data['Sheets']
+        else:
+            sheets = [self._data]  # documents with one canvas have no list of sheets
+        self._master_layers = {}
+        for master in self._data.get('MasterSheets') or []:
+            layer = SharedLayer(self, master)
+            self._master_layers[master.get('SheetTitle')] = layer
+        self._canvases = [CanvasElement(self, sheet) for sheet in sheets]
+
+    def __repr__(self):
+        return 'GraffleDocument(%r)' % self._path
+
+    @property
+    def data(self):
+        """The property list of the document."""
+        return self._data
+
+    def get_name(self):
+        return os.path.basename(self._path)
+
+    def get_path(self):
+        return self._path
+
+    def get_modified(self):
+        return self._is_modified
+
+    def elements_canvases(self):
+        return self._canvases
+
+    def save(self, in_=None, as_=None):
+        """Write the document to its file, or to in_."""
+        if as_ is not None:
+            raise ElementError('exporting to %s requires OmniGraffle' % as_)
+        path = in_ or self._path
+        write_plist(path, self._data, self._compressed)
+        if path == self._path:
+            self._is_modified = False
+
+    def close(self, saving=None):
+        pass
+
+
+class Sheet(object):
+    """A sheet (canvas or master sheet) in the plist, with an index of its graphics."""
+
+    def __init__(self, data):
+        self.data = data
+        self.elements = {}  # id -> graphic element, registered by the elements
+        self._references = {}
+
+    def find(self, key, value):
+        """Return the elements whose entry key (e.g. 'Head') refers to the graphic with id value."""
+        if key not in self._references:
+            index = self._references[key] = {}
+            for element in self.elements.values():
+                ref = element.data.get(key)
+                if isinstance(ref, dict) and 'ID' in ref:
+                    index.setdefault(ref['ID'], []).append(element)
+        return self._references[key].get(value, [])
+
+
+class Container(Element):
+    """An element that contains graphics (canvas, layer, group)."""
+
+    def _graphics(self):
+        return []
+
+    def _filtered(self, collection):
+        classes = COLLECTION_CLASSES[collection]
+        return [g for g in self._graphics() if classes is None or g.class_name in classes]
+
+    def elements_graphics(self):
+        return self._filtered('graphics')
+
+    def elements_shapes(self):
+        return self._filtered('shapes')
+
+    def elements_solids(self):
+        return self._filtered('solids')
+
+    def elements_groups(self):
+        return self._filtered('groups')
+
+    def elements_subgraphs(self):
+        return self._filtered('subgraphs')
+
+
+class CanvasElement(Container):
+
+    class_name = 'canvas'
+
+    def __init__(self, document, data):
+        super(CanvasElement, self).__init__(document)
+        self._sheet = Sheet(data)
+        self._graphic_elements = [make_graphic(document, self._sheet, g, self)
+                                  for g in data.get('GraphicsList') or []]
+        self._layers = []
+        own_layers = [LayerElement(document, self, idx, layer)
+                      for idx, layer in enumerate(data.get('Layers') or [])]
+        names = data.get('AllLayers')
+        shared = document._master_layers.get(data.get('MasterSheet'))
+        if names:
+            by_name = dict((l.get_name(), l) for l in own_layers)
+            for name in names:
+                if name in by_name:
+                    self._layers.append(by_name.pop(name))
+                elif shared is not None and name == data.get('MasterSheet'):
+                    self._layers.append(shared)
+                    shared = None
+            self._layers.extend(l for l in own_layers if l.get_name() in by_name)
+        else:
+            self._layers.extend(own_layers)
+        if shared is not None:
+            self._layers.append(shared)
+
+    def __repr__(self):
+        return 'CanvasElement(%r)' % self.get_name()
+
+    @property
+    def data(self):
+        return self._sheet.data
+
+    def get_id(self):
+        return self._sheet.data.get('UniqueID')
+
+    def get_name(self):
+        return self._sheet.data.get('SheetTitle', '')
+
+    def set_name(self, value):
+        self._sheet.data['SheetTitle'] = value
+        self._changed()
+
+    def _graphics(self):
+        return self._graphic_elements
+
+    def elements_layers(self):
+        return self._layers
+
+    def elements_lines(self):
+        return self._filtered('lines')
+
+
+class LayerElement(Container):
+
+    class_name = 'layer'
+
+    def __init__(self, document, canvas, index, data):
+        super(LayerElement, self).__init__(document)
+        self._canvas = canvas
+        self._index = index
+        self._data = data
+
+    def __repr__(self):
+        return 'LayerElement(%r)' % self.get_name()
+
+    def get_name(self):
+        return self._data.get('Name', '')
+
+    def set_name(self, value):
+        self._data['Name'] = value
+        self._changed()
+
+    def get_visible(self):
+        return self._data.get('View', 'YES') == 'YES'
+
+    def set_visible(self, value):
+        self._data['View'] = 'YES' if value else 'NO'
+        self._changed()
+
+    def get_prints(self):
+        return self._data.get('Print', 'YES') == 'YES'
+
+    def get_locked(self):
+        return self._data.get('Lock', 'NO') == 'YES'
+
+    def _graphics(self):
+        return [g for g in self._canvas._graphic_elements
+                if g.data.get('Layer', 0) == self._index]
+
+    def elements_lines(self):
+        return self._filtered('lines')
+
+
+class SharedLayer(LayerElement):
+    """A shared layer, stored as master sheet. The same element is used in all canvases."""
+
+    class_name = 'shared_layer'
+
+    def __init__(self, document, data):
+        layers = data.get('Layers') or [{}]
+        super(SharedLayer, self).__init__(document, None, 0, dict(layers[0]))
+        self._sheet = Sheet(data)
+        self._data['Name'] = data.get('SheetTitle', self._data.get('Name', ''))
+        self._graphic_elements = [make_graphic(document, self._sheet, g, self)
+                                  for g in data.get('GraphicsList') or []]
+
+    def __repr__(self):
+        return 'SharedLayer(%r)' % self.get_name()
+
+    def _graphics(self):
+        return self._graphic_elements
+
+
+def make_graphic(document, sheet, data, container):
+    """Create the element for a graphic in a sheet."""
+    class_name = GRAPHIC_CLASSES.get(data.get('Class'), 'graphic')
+    if class_name == 'shape' and isinstance(data.get('Line'), dict):
+        class_name = 'label'
+    if class_name == 'group' and data.get('isSubgraph') == 'YES':
+        class_name = 'subgraph'
+    if class_name in ('group', 'subgraph', 'table'):
+        klass = TableElement if class_name == 'table' else GroupElement
+    elif class_name == 'line':
+        klass = LineElement
+    elif class_name in ('shape', 'label', 'solid'):
+        klass = SolidElement
+    else:
+        klass = GraphicElement
+    return klass(document, sheet, data, container, class_name)
+
+
+class GraphicElement(Element):
+
+    def __init__(self, document, sheet, data, container, class_name):
+        super(GraphicElement, self).__init__(document)
+        self._sheet = sheet
+        self.data = data
+        self._container = container
+        self.class_name = class_name
+        sheet.elements[self.get_id()] = self
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, self.get_id())
+
+    def get_id(self):
+        return self.data.get('ID')
+
+    def get_user_name(self):
+        return self.data.get('Name', '')
+
+    def set_user_name(self, value):
+        self.data['Name'] = value
+        self._changed()
+
+    def get_user_data(self):
+        return self.data.get('UserInfo')
+
+    def set_user_data(self, value):
+        self.data['UserInfo'] = value
+        self._changed()
+
+    def _style(self, kind):
+        return self.data.setdefault('Style', {}).setdefault(kind, {})
+
+    def get_stroke_color(self):
+        return color_components(self.data.get('Style', {}).get('stroke', {}).get('Color'),
+                                DEFAULT_STROKE)
+
+    def set_stroke_color(self, value):
+        self._style('stroke')['Color'] = plist_color(value)
+        self._changed()
+
+    def _lines(self, key):
+        return [g for g in self._sheet.find(key, self.get_id()) if g.class_name == 'line']
+
+    def elements_incoming_lines(self):
+        return self._lines('Head')
+
+    def elements_outgoing_lines(self):
+        return self._lines('Tail')
+
+    def elements_lines(self):
+        return self._lines('Head') + self._lines('Tail')
+
+
+class SolidElement(GraphicElement):
+
+    def get_name(self):
+        """The name of the shape, e.g. 'Rectangle'."""
+        return self.data.get('Shape', 'Rectangle')
+
+    def set_name(self, value):
+        self.data['Shape'] = value
+        self._changed()
+
+    def get_fill_color(self):
+        return color_components(self.data.get('Style', {}).get('fill', {}).get('Color'),
+                                DEFAULT_FILL)
+
+    def set_fill_color(self, value):
+        self._style('fill')['Color'] = plist_color(value)
+        self._changed()
+
+    @property
+    def text(self):
+        return Text(self)
+
+    def get_text(self):
+        return Text(self)()
+
+
+class LineElement(GraphicElement):
+
+    def elements_labels(self):
+        return self._sheet.find('Line', self.get_id())
+
+
+class GroupElement(GraphicElement):
+
+    def __init__(self, document, sheet, data, container, class_name):
+        super(GroupElement, self).__init__(document, sheet, data, container, class_name)
+        self._members = [make_graphic(document, sheet, g, self) for g in data.get('Graphics') or []]
+
+    def _filtered(self, collection):
+        classes = COLLECTION_CLASSES[collection]
+        return [g for g in self._members if classes is None or g.class_name in classes]
+
+    def elements_graphics(self):
+        return self._filtered('graphics')
+
+    def elements_shapes(self):
+        return self._filtered('shapes')
+
+    def elements_solids(self):
+        return self._filtered('solids')
+
+    def elements_groups(self):
+        return self._filtered('groups')
+
+    def elements_subgraphs(self):
+        return self._filtered('subgraphs')
+
+
+class TableElement(GroupElement):
+
+    def _slices(self, key, class_name):
+        by_id = dict((g.get_id(), g) for g in self._members)
+        slices = []
+        for ids in self.data.get(key) or []:
+            if not isinstance(ids, list):
+                ids = [ids]  # tables with a single row or column list cell ids only
+            if ids:
+                slices.append(TableSlice(self._document, class_name, [by_id[i] for i in ids if i in by_id]))
+        return slices
+
+    def elements_rows(self):
+        return self._slices('GridH', 'row')
+
+    def elements_columns(self):
+        return self._slices('GridV', 'column')
+
+
+class TableSlice(Element):
+    """A row or column of a table."""
+
+    def __init__(self, document, class_name, cells):
+        super(TableSlice, self).__init__(document)
+        self.class_name = class_name
+        self._cells = cells
+
+    def elements_graphics(self):
+        return self._cells
+
+
+class Text(object):
+    """The rich text of a solid: call it to get the plain text."""
+
+    def __init__(self, graphic):
+        self._graphic = graphic
+
+    @property
+    def _rtf(self):
+        return self._graphic.data.get('Text', {}).get('Text', '')
+
+    def _rich_text(self):
+        return RichText(self._rtf)
+
+    def _font_info(self, key, default=None):
+        return self._graphic.data.get('FontInfo', {}).get(key, default)
+
+    def _update(self, rtf):
+        text = self._graphic.data.setdefault('Text', {})
+        text['Text'] = rtf
+        text.pop('RTFD', None)  # outdated now, OmniGraffle recreates it from the RTF
+        self._graphic._changed()
+
+    def __call__(self):
+        return self._rich_text().text
+
+    def set(self, value):
+        if self._rtf:
+            self._update(self._rich_text().replace_text(value))
+        else:
+            self._update(make_rtf(value, self._font_info('Font', 'Helvetica'), self._font_info('Size', 12)))
+
+    @property
+    def font(self):
+        return Property(self._get_font, self._set_font)
+
+    @property
+    def size(self):
+        return Property(self._get_size, self._set_size)
+
+    @property
+    def color(self):
+        return Property(self._get_color, self._set_color)
+
+    @property
+    def attribute_runs(self):
+        return AttributeRuns(self)
+
+    def _first_run(self):
+        rich_text = self._rich_text()
+        return rich_text, (rich_text.runs[0] if rich_text.runs else None)
+
+    def _get_font(self):
+        rich_text, run = self._first_run()
+        if run is not None and rich_text.font_name(run):
+            return rich_text.font_name(run)
+        return self._font_info('Font', 'Helvetica')
+
+    def _set_font(self, value):
+        self._graphic.data.setdefault('FontInfo', {})['Font'] = value
+        if self._rtf:
+            self._update(self._rich_text().replace_font(value))
+
+    def _get_size(self):
+        rich_text, run = self._first_run()
+        if run is not None:
+            return run.size / 2.0
+        return self._font_info('Size', 12.0)
+
+    def _set_size(self, value):
+        self._graphic.data.setdefault('FontInfo', {})['Size'] = float(value)
+        if self._rtf:
+            self._update(self._rich_text().replace_control_words('fs', int(round(value * 2))))
+
+    def _get_color(self):
+        rich_text, run = self._first_run()
+        color = rich_text.color(run) if run is not None else None
+        if color is not None:
+            return tuple(c * 257 for c in color)
+        return color_components(self._font_info('Color'), DEFAULT_STROKE)
+
+    def _set_color(self, value):
+        self._graphic.data.setdefault('FontInfo', {})['Color'] = plist_color(value)
+        if self._rtf:
+            self._update(self._rich_text().replace_color([int(round(c / 257.0)) for c in value]))
+
+
+class AttributeRuns(object):
+    """
+    The attribute runs of a text: call it to get the list of texts.
+
+    Indices start at 0, like the indices used by the code in ogtools.
+    """
+
+    def __init__(self, text):
+        self._text = text
+
+    def __call__(self):
+        return [run.text for run in self._text._rich_text().runs]
+
+    def __len__(self):
+        return len(self._text._rich_text().runs)
+
+    def __getitem__(self, idx):
+        return AttributeRun(self._text, idx)
+
+
+class AttributeRun(object):
+
+    def __init__(self, text, idx):
+        self._text = text
+        self._idx = idx
+
+    def _run(self):
+        rich_text = self._text._rich_text()
+        try:
+            return rich_text, rich_text.runs[self._idx]
+        except IndexError:
+            raise ElementError("Can't get attribute run %s" % self._idx)
+
+    @property
+    def text(self):
+        return Property(lambda: self._run()[1].text, self._set_text)
+
+    def _set_text(self, value):
+        rich_text, run = self._run()
+        self._text._update(rich_text.replace_runs({self._idx: value}))
+
+    @property
+    def font(self):
+        return Property(lambda: self._run()[0].font_name(self._run()[1]))
+
+    @property
+    def size(self):
+        return Property(lambda: self._run()[1].size / 2.0)
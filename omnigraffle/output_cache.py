@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+A local, content-addressed cache of exported files, shared by all checkouts.
+
+Exported files are stored under a key that combines the fingerprint of the canvas
+(see omnigraffle.fingerprint), the format and the export settings, so the same
+diagram exported with the same settings is only rendered by OmniGraffle once:
+
+    cache = OutputCache()
+    key = cache.key('ogexport', 'png', settings, canvas_fingerprint)
+    if not cache.get(key, 'out/canvas.png'):
+        export(...)
+        cache.put(key, 'out/canvas.png')
+
+Files are hardlinked from the cache if possible (copied otherwise). Files are
+never changed in place, an output that is exported again must be detached from
+the cache first (see detach()). The cache is bounded in size, the least recently
+used files are removed first. When a file is used is recorded in a separate stamp
+file: touching the cached file would change the time of all outputs linked to it.
+
+The maximum size is kept in the cache directory, the size given last (e.g. with
+'ogexport --cache-size') is used by all later exports and by 'ogexport cache prune'.
+Removing a file from the cache frees no disk space while outputs are still linked
+to it, the space is freed when these outputs are removed or exported again.
+
+    $ ogexport cache stats
+    $ ogexport cache prune --max-size 200
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from omnigraffle import fingerprint
+
+DEFAULT_DIRECTORY = os.path.expanduser('~/.ogtool/cache')
+DEFAULT_MAX_SIZE = 1024  # MB
+MB = 1024 * 1024
+
+
+def detach(path):
+    """Remove path if it is a hardlink (e.g. to a file in the cache), so that it can be written."""
+    if os.path.isfile(path) and os.stat(path).st_nlink > 1:
+        os.unlink(path)
+
+
+class OutputCache(object):
+    """
+    The cache in directory. max_size is in MB, if it is None the size saved in the
+    directory by the last cache with an explicit size is used (DEFAULT_MAX_SIZE if none).
+    The cache can be used from several threads (e.g. the workers of a Pipeline).
+    """
+
+    def __init__(self, directory=DEFAULT_DIRECTORY, max_size=None):
+        self.directory = os.path.abspath(directory)
+        self.objects = os.path.join(self.directory, 'objects')
+        self.used = os.path.join(self.directory, 'used')  # stamp files: mtime is the last use
+        self.max_size = self._max_size(max_size) * MB
+        self._size = None  # total size of all entries, computed when needed
+        self._lock = threading.Lock()  # guards _size, the counters and pruning
+        self.hits = 0
+        self.misses = 0
+
+    def _max_size(self, max_size):
+        """Return max_size and save it, or the saved size if max_size is None."""
+        config = os.path.join(self.directory, 'config.json')
+        try:
+            with open(config) as fp:
+                saved = json.load(fp).get('max_size')
+        except (IOError, OSError, ValueError):
+            saved = None
+        if max_size is None:
+            return saved if saved is not None else DEFAULT_MAX_SIZE
+        if max_size != saved:
+            try:
+                if not os.path.exists(self.directory):
+                    os.makedirs(self.directory)
+                with open(config, 'w') as fp:
+                    json.dump(dict(max_size=max_size), fp)
+            except (IOError, OSError) as e:
+                logging.warning('cannot save the size of the cache: %s', e)
+        return max_size
+
+    @staticmethod
+    def key(*parts):
+        return fingerprint.combine(*parts)
+
+    def path(self, key):
+        return os.path.join(self.objects, key[:2], key)
+
+    def _used_path(self, path):
+        """The stamp file of the cached file path."""
+        return os.path.join(self.used, os.path.relpath(path, self.objects))
+
+    def _touch(self, path):
+        """Mark the cached file path as recently used."""
+        used = self._used_path(path)
+        try:
+            directory = os.path.dirname(used)
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+            with open(used, 'a'):
+                pass
+            os.utime(used, None)
+        except (IOError, OSError) as e:
+            logging.debug('cannot mark %s as used: %s', path, e)
+
+    def __contains__(self, key):
+        return os.path.isfile(self.path(key))
+
+    def get(self, key, target):
+        """Put the file cached for key at target, return False if there is none."""
+        path = self.path(key)
+        if not os.path.isfile(path):
+            with self._lock:
+                self.misses += 1
+            return False
+        directory = os.path.dirname(os.path.abspath(target))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        if os.path.lexists(target):
+            os.unlink(target)
+        try:
+            os.link(path, target)
+        except (OSError, AttributeError):  # other file system, or no hardlinks
+            shutil.copyfile(path, target)
+        self._touch(path)
+        with self._lock:
+            self.hits += 1
+        return True
+
+    def put(self, key, source):
+        """Add a copy of the file source for key, then evict old files if the cache is too big."""
+        path = self.path(key)
+        directory = os.path.dirname(path)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        fd, tmp = tempfile.mkstemp(dir=directory)
+        os.close(fd)
+        try:
+            shutil.copyfile(source, tmp)
+            old_size = os.path.getsize(path) if os.path.isfile(path) else 0
+            os.rename(tmp, path)
+        except Exception:
+            os.unlink(tmp)
+            raise
+        with self._lock:
+            if self._size is not None:
+                self._size += os.path.getsize(path) - old_size
+            if self._get_size() > self.max_size:
+                self._prune(self.max_size)
+
+    def entries(self):
+        """Return a list of (last use, size, number of links, path) of all files in the cache."""
+        result = []
+        for root, dirs, files in os.walk(self.objects):
+            for fname in files:
+                path = os.path.join(root, fname)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue  # removed by another process
+                try:
+                    used = max(st.st_mtime, os.path.getmtime(self._used_path(path)))
+                except OSError:
+                    used = st.st_mtime  # never used since it was added
+                result.append((used, st.st_size, st.st_nlink, path))
+        return result
+
+    def size(self):
+        with self._lock:
+            return self._get_size()
+
+    def _get_size(self):
+        if self._size is None:
+            self._size = sum(size for dummy, size, dummy, dummy in self.entries())
+        return self._size
+
+    def prune(self, max_size=None):
+        """
+        Remove least recently used files until the cache is smaller than max_size (bytes).
+        Return the number of removed files and the disk space freed: files still linked
+        from outputs free no space.
+        """
+        with self._lock:
+            return self._prune(self.max_size if max_size is None else max_size)
+
+    def _prune(self, max_size):
+        entries = sorted(self.entries())
+        size = sum(size for dummy, size, dummy, dummy in entries)
+        removed = freed = 0
+        for dummy, file_size, links, path in entries:
+            if size <= max_size:
+                break
+            try:
+                os.unlink(path)
+            except OSError as e:
+                logging.warning('cannot remove %s from cache: %s', path, e)
+                continue
+            try:
+                os.unlink(self._used_path(path))
+            except OSError:
+                pass  # never used
+            size -= file_size
+            removed += 1
+            if links == 1:
+                freed += file_size
+        self._size = size
+        return removed, freed
+
+    def stats(self):
+        entries = self.entries()
+        stats = dict(directory=self.directory, files=len(entries),
+                     size=sum(size for dummy, size, dummy, dummy in entries), max_size=self.max_size,
+                     linked=sum(size for dummy, size, links, dummy in entries if links > 1))
+        if entries:
+            stats['oldest'] = min(entries)[0]
+            stats['newest'] = max(entries)[0]
+        return stats
+
+
+def _format_time(timestamp):
+    return time.strftime('%Y-%m-%d %H:%M', time.localtime(timestamp))
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(prog='ogexport cache', description='Manage the cache of exported files.')
+    parser.add_argument('command', choices=('stats', 'prune'))
+    parser.add_argument('--cache-dir', default=DEFAULT_DIRECTORY,
+                        help='the cache directory (default: %(default)s)')
+    parser.add_argument('--max-size', type=float,
+                        help='prune: maximum size of the cache in MB, 0 empties the cache '
+                             '(default: the size the exports use, see ogexport --cache-size)')
+    return parser
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+    cache = OutputCache(args.cache_dir)
+    if args.command == 'prune':
+        max_size = cache.max_size if args.max_size is None else int(args.max_size * MB)
+        removed, freed = cache.prune(max_size)
+        print('removed %d files, freed %.1f MB (files still linked from outputs free no space)' % (
+            removed, freed / float(MB)))
+    stats = cache.stats()
+    print('cache:  %s' % stats['directory'])
+    print('files:  %d' % stats['files'])
+    print('size:   %.1f MB (max. %.0f MB), %.1f MB linked from outputs' % (
+        stats['size'] / float(MB), stats['max_size'] / float(MB), stats['linked'] / float(MB)))
+    if stats['files']:
+        print('oldest: %s' % _format_time(stats['oldest']))
+        print('newest: %s' % _format_time(stats['newest']))
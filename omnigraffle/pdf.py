@@ -0,0 +1,628 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+A minimal reader and writer for the PDF files OmniGraffle exports.
+
+Only what ogtool needs is supported: reading the objects of a PDF with classic
+cross-reference tables (including incremental updates), finding the pages and
+writing new PDFs that contain a subset of them. Objects are copied verbatim
+where possible: strings, real numbers and the data of streams are never decoded.
+
+    >>> pages = split_pages(open('foobar.pdf', 'rb').read())
+
+The document information (title, subject etc.) of a file can be read and changed
+without reading the whole file: stamp_info() appends an incremental update with
+a new Info dictionary, read_info() only reads the trailer and that dictionary.
+
+    >>> stamp_info('foobar.pdf', dict(Subject=u'checksum'))
+    >>> read_info('foobar.pdf')['Subject']
+    u'checksum'
+"""
+
+from collections import OrderedDict, namedtuple
+import re
+
+TOKEN = re.compile(br"""
+      (?P<space>(?:[\x00\t\n\x0c\r ]|%[^\r\n]*)+)
+    | (?P<dict_open><<)
+    | (?P<dict_close>>>)
+    | (?P<array_open>\[)
+    | (?P<array_close>\])
+    | (?P<name>/[^\x00\t\n\x0c\r ()<>\[\]{}/%]*)
+    | (?P<number>[+-]?(?:\d+\.?\d*|\.\d+))
+    | (?P<hex><[0-9A-Fa-f\x00\t\n\x0c\r ]*>)
+    | (?P<string>\()
+    | (?P<keyword>[A-Za-z_'"*][^\x00\t\n\x0c\r ()<>\[\]{}/%]*)
+    """, re.VERBOSE)
+
+OBJECT_HEADER = re.compile(br'(\d+)\s+(\d+)\s+obj\b')
+XREF_ENTRY = re.compile(br'(\d{10}) (\d{5}) ([nf])')
+
+# page attributes a page inherits from its parents in the page tree
+INHERITABLE = ('Resources', 'MediaBox', 'CropBox', 'Rotate')
+
+
+class PDFError(Exception):
+    pass
+
+
+class Name(str):
+    """A name, e.g. /Type (without the slash, #xx escapes are kept)."""
+
+
+class Raw(bytes):
+    """A token that is written back unchanged: strings, real numbers, booleans, keywords."""
+
+
+class String(object):
+    """A text string created by ogtool, written as literal string."""
+
+    def __init__(self, text):
+        self.text = text
+
+
+Ref = namedtuple('Ref', 'num gen')
+
+NULL = Raw(b'null')
+
+
+class Stream(object):
+    """A stream object: the stream dictionary and the (still encoded) data."""
+
+    def __init__(self, dictionary, data):
+        self.dict = dictionary
+        self.data = data
+
+
+class Parser(object):
+    """Tokenizer and parser for the objects in data (a whole PDF file, or a part of it)."""
+
+    def __init__(self, data):
+        self.data = data
+
+    def _skip(self, pos):
+        match = TOKEN.match(self.data, pos)
+        if match and match.lastgroup == 'space':
+            return match.end()
+        return pos
+
+    def _string_end(self, pos):
+        """Position after the literal string starting at pos (the opening parenthesis)."""
+        depth = 0
+        data = self.data
+        while pos < len(data):
+            c = data[pos:pos + 1]
+            if c == b'\\':
+                pos += 2
+                continue
+            if c == b'(':
+                depth += 1
+            elif c == b')':
+                depth -= 1
+                if depth == 0:
+                    return pos + 1
+            pos += 1
+        raise PDFError('unterminated string')
+
+    def parse(self, pos):
+        """Parse the object at pos, return (object, position after the object)."""
+        pos = self._skip(pos)
+        match = TOKEN.match(self.data, pos)
+        if not match:
+            raise PDFError('syntax error at %d' % pos)
+        kind = match.lastgroup
+        if kind == 'dict_open':
+            result = OrderedDict()
+            pos = self._skip(match.end())
+            while self.data[pos:pos + 2] != b'>>':
+                key, pos = self.parse(pos)
+                if not isinstance(key, Name):
+                    raise PDFError('dictionary key expected at %d' % pos)
+                result[key], pos = self.parse(pos)
+                pos = self._skip(pos)
+                if pos >= len(self.data):
+                    raise PDFError('unterminated dictionary')
+            return result, pos + 2
+        if kind == 'array_open':
+            result = []
+            pos = self._skip(match.end())
+            while self.data[pos:pos + 1] != b']':
+                item, pos = self.parse(pos)
+                result.append(item)
+                pos = self._skip(pos)
+                if pos >= len(self.data):
+                    raise PDFError('unterminated array')
+            return result, pos + 1
+        if kind == 'name':
+            return Name(match.group()[1:].decode('latin-1')), match.end()
+        if kind == 'number':
+            token = match.group()
+            if b'.' in token:
+                return Raw(token), match.end()
+            number = int(token)
+            # an indirect reference: <num> <gen> R
+            ref = re.compile(br'\s+(\d+)\s+R\b').match(self.data, match.end())
+            if ref:
+                return Ref(number, int(ref.group(1))), ref.end()
+            return number, match.end()
+        if kind == 'hex':
+            return Raw(match.group()), match.end()
+        if kind == 'string':
+            end = self._string_end(pos)
+            return Raw(self.data[pos:end]), end
+        if kind == 'keyword':
+            return Raw(match.group()), match.end()
+        raise PDFError('unexpected %r at %d' % (match.group(), pos))
+
+    def xref_section(self, pos):
+        """
+        Parse the cross-reference section at pos, return (offsets, trailer, position after
+        the trailer), offsets maps object numbers to offsets (None for free objects).
+        """
+        offsets = OrderedDict()
+        pos = self._skip(pos)
+        if self.data[pos:pos + 4] != b'xref':
+            raise PDFError('cross-reference streams are not supported')
+        pos = self._skip(pos + 4)
+        while True:
+            match = re.compile(br'(\d+)\s+(\d+)\s*?[\r\n]+').match(self.data, pos)
+            if not match:
+                break
+            first, count = int(match.group(1)), int(match.group(2))
+            pos = match.end()
+            for num in range(first, first + count):
+                entry = XREF_ENTRY.match(self.data, pos)
+                if not entry:
+                    raise PDFError('invalid cross-reference entry at %d' % pos)
+                offsets[num] = int(entry.group(1)) if entry.group(3) == b'n' else None
+                pos = self._skip(entry.end())
+        if self.data[pos:pos + 7] != b'trailer':
+            raise PDFError('trailer not found')
+        trailer, pos = self.parse(pos + 7)
+        if not isinstance(trailer, dict):
+            raise PDFError('invalid trailer')
+        return offsets, trailer, pos
+
+    def indirect_object(self, pos, num=None):
+        """Parse the indirect object ('<num> <gen> obj ...') at pos, return (object, position after it)."""
+        match = OBJECT_HEADER.match(self.data, pos)
+        if not match or (num is not None and int(match.group(1)) != num):
+            raise PDFError('object %s not found at %d' % (num, pos))
+        return self.parse(match.end())
+
+
+def find_startxref(data):
+    """The offset of the last cross-reference section, data is the PDF file (or its end)."""
+    idx = data.rfind(b'startxref')
+    if idx < 0:
+        raise PDFError('startxref not found')
+    match = re.compile(br'startxref\s+(\d+)').match(data, idx)
+    if not match:
+        raise PDFError('invalid startxref')
+    return int(match.group(1))
+
+
+class PDFReader(Parser):
+    """The objects of a PDF file."""
+
+    def __init__(self, data):
+        super(PDFReader, self).__init__(data)
+        self.offsets = {}  # object number -> offset
+        self.trailer = OrderedDict()
+        self._cache = {}
+        try:
+            self._read_xref(find_startxref(self.data))
+        except PDFError:
+            self._scan()
+        if 'Root' not in self.trailer:
+            raise PDFError('no document catalog')
+
+    # cross-reference tables
+
+    def _read_xref(self, offset):
+        seen = set()
+        while offset is not None:
+            if offset in seen:
+                raise PDFError('loop in cross-reference tables')
+            seen.add(offset)
+            offsets, trailer, dummy = self.xref_section(offset)
+            for num, obj_offset in offsets.items():
+                self.offsets.setdefault(num, obj_offset)
+            for key, value in trailer.items():
+                self.trailer.setdefault(key, value)  # newer updates take precedence
+            offset = trailer.get('Prev')
+
+    def _scan(self):
+        """Find all objects by scanning the file (for damaged cross-reference tables)."""
+        self.offsets = {}
+        for match in OBJECT_HEADER.finditer(self.data):
+            self.offsets[int(match.group(1))] = match.start()
+        idx = self.data.rfind(b'trailer')
+        if idx >= 0:
+            trailer, dummy = self.parse(idx + 7)
+            self.trailer = trailer
+        else:
+            for num in self.offsets:
+                obj = self.get(Ref(num, 0))
+                if isinstance(obj, Stream) and obj.dict.get('Type') == 'XRef':
+                    raise PDFError('cross-reference streams are not supported')
+
+    # objects
+
+    def get(self, ref):
+        """The object ref refers to (None for free or missing objects)."""
+        if ref.num not in self._cache:
+            offset = self.offsets.get(ref.num)
+            if offset is None:
+                return None
+            obj, pos = self.indirect_object(offset, ref.num)
+            pos = self._skip(pos)
+            if isinstance(obj, OrderedDict) and self.data[pos:pos + 6] == b'stream':
+                obj = self._stream(obj, pos + 6)
+            self._cache[ref.num] = obj
+        return self._cache[ref.num]
+
+    def _stream(self, dictionary, pos):
+        if self.data[pos:pos + 2] == b'\r\n':
+            pos += 2
+        elif self.data[pos:pos + 1] == b'\n':
+            pos += 1
+        length = self.resolve(dictionary.get('Length'))
+        if not isinstance(length, int) or \
+                not re.compile(br'\s*endstream').match(self.data, pos + length):
+            # damaged length: the stream ends before 'endstream'
+            end = self.data.find(b'endstream', pos)
+            if end < 0:
+                raise PDFError('unterminated stream')
+            length = len(self.data[pos:end].rstrip(b'\r\n'))
+        return Stream(dictionary, self.data[pos:pos + length])
+
+    def resolve(self, obj):
+        """The object obj, or the object obj refers to."""
+        while isinstance(obj, Ref):
+            obj = self.get(obj)
+        return obj
+
+    @property
+    def catalog(self):
+        return self.resolve(self.trailer['Root'])
+
+    @property
+    def info(self):
+        return self.resolve(self.trailer.get('Info'))
+
+    def pages(self):
+        """Return the pages as list of (reference, page dictionary with inherited attributes)."""
+        result = []
+
+        def collect(ref, inherited, seen):
+            node = self.resolve(ref)
+            if not isinstance(node, dict) or id(node) in seen:
+                return
+            seen.add(id(node))
+            if node.get('Type') == 'Pages' or 'Kids' in node:
+                attributes = dict(inherited)
+                attributes.update((k, node[k]) for k in INHERITABLE if k in node)
+                for kid in self.resolve(node.get('Kids')) or []:
+                    collect(kid, attributes, seen)
+            else:
+                page = OrderedDict(node)
+                for key, value in inherited.items():
+                    page.setdefault(key, value)
+                result.append((ref, page))
+
+        collect(self.catalog.get('Pages'), {}, set())
+        return result
+
+
+class PDFWriter(object):
+    """Write a new PDF from objects (of a PDFReader, or created by ogtool)."""
+
+    def __init__(self, reader=None):
+        self.reader = reader
+        self.objects = []  # index + 1 is the object number
+        self._copied = {}  # object number in reader -> Ref in the written file
+
+    def add(self, obj):
+        """Add obj as indirect object, return a reference to it."""
+        self.objects.append(obj)
+        return Ref(len(self.objects), 0)
+
+    def reserve(self):
+        return self.add(None)
+
+    def set(self, ref, obj):
+        self.objects[ref.num - 1] = obj
+
+    def copy(self, obj, exclude=()):
+        """
+        Copy obj and all objects it refers to from the reader. References to objects
+        in exclude (e.g. other pages) are replaced by null.
+        """
+        if isinstance(obj, Ref):
+            if obj in exclude:
+                return NULL
+            if obj.num not in self._copied:
+                ref = self._copied[obj.num] = self.reserve()
+                self.set(ref, self.copy(self.reader.get(obj), exclude))
+            return self._copied[obj.num]
+        if isinstance(obj, dict):
+            return OrderedDict((k, self.copy(v, exclude)) for k, v in obj.items())
+        if isinstance(obj, list):
+            return [self.copy(v, exclude) for v in obj]
+        if isinstance(obj, Stream):
+            return Stream(self.copy(obj.dict, exclude), obj.data)
+        return obj
+
+    def write(self, root, info=None):
+        """Return the PDF file with the document catalog root."""
+        out = [b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n']
+        size = len(out[0])
+        offsets = []
+        for idx, obj in enumerate(self.objects):
+            chunk = b'%d 0 obj\n' % (idx + 1) + serialize(obj if obj is not None else NULL) + b'\nendobj\n'
+            offsets.append(size)
+            out.append(chunk)
+            size += len(chunk)
+        xref = [b'xref\n0 %d\n' % (len(self.objects) + 1), b'0000000000 65535 f \n']
+        xref.extend(b'%010d 00000 n \n' % offset for offset in offsets)
+        trailer = OrderedDict([(Name('Size'), len(self.objects) + 1), (Name('Root'), root)])
+        if info is not None:
+            trailer[Name('Info')] = info
+        xref.append(b'trailer\n' + serialize(trailer) + b'\nstartxref\n%d\n%%%%EOF\n' % size)
+        return b''.join(out + xref)
+
+
+def escape(raw):
+    """Escape bytes for a literal string."""
+    return raw.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)') \
+        .replace(b'\r', b'\\r').replace(b'\n', b'\\n')
+
+
+def serialize(obj):
+    """The PDF syntax for obj."""
+    if isinstance(obj, Raw):
+        return bytes(obj)
+    if isinstance(obj, bool):
+        return b'true' if obj else b'false'
+    if isinstance(obj, Ref):
+        return b'%d %d R' % (obj.num, obj.gen)
+    if isinstance(obj, int):
+        return b'%d' % obj
+    if isinstance(obj, float):
+        return (b'%.4f' % obj).rstrip(b'0').rstrip(b'.')
+    if isinstance(obj, Name):
+        return b'/' + obj.encode('latin-1')
+    if isinstance(obj, String):
+        try:
+            raw = obj.text.encode('latin-1')
+        except UnicodeEncodeError:
+            raw = b'\xfe\xff' + obj.text.encode('utf-16-be')
+        return b'(' + escape(raw) + b')'
+    if obj is None:
+        return b'null'
+    if isinstance(obj, dict):
+        return b'<<' + b''.join(b'/' + k.encode('latin-1') + b' ' + serialize(v) + b' '
+                                for k, v in obj.items()) + b'>>'
+    if isinstance(obj, (list, tuple)):
+        return b'[' + b' '.join(serialize(v) for v in obj) + b']'
+    if isinstance(obj, Stream):
+        dictionary = OrderedDict(obj.dict)
+        dictionary[Name('Length')] = len(obj.data)
+        return serialize(dictionary) + b'\nstream\n' + obj.data + b'\nendstream'
+    raise PDFError('cannot serialize %r' % (obj,))
+
+
+def extract_page(reader, page_refs, idx):
+    """Return a PDF with only the page idx of reader (page_refs as returned by reader.pages())."""
+    ref, page = page_refs[idx]
+    others = set(r for r, dummy in page_refs if r != ref)
+    writer = PDFWriter(reader)
+    catalog = writer.reserve()
+    pages = writer.reserve()
+    page = OrderedDict((k, v) for k, v in page.items() if k != 'Parent')
+    page_copy = writer.copy(page, others | set([ref]))
+    page_copy[Name('Parent')] = pages
+    page_ref = writer.add(page_copy)
+    writer.set(pages, OrderedDict([(Name('Type'), Name('Pages')), (Name('Kids'), [page_ref]),
+                                   (Name('Count'), 1)]))
+    writer.set(catalog, OrderedDict([(Name('Type'), Name('Catalog')), (Name('Pages'), pages)]))
+    info = reader.info
+    if isinstance(info, dict):
+        info = writer.add(writer.copy(info, others))
+    else:
+        info = None
+    return writer.write(catalog, info)
+
+
+def split_pages(data):
+    """Split the PDF data into one PDF per page, return the list of PDFs."""
+    reader = PDFReader(data)
+    page_refs = reader.pages()
+    return [extract_page(reader, page_refs, idx) for idx in range(len(page_refs))]
+
+
+def page_count(data):
+    return len(PDFReader(data).pages())
+
+
+def write_document(pages, info=None):
+    """
+    Write a PDF from scratch, pages is a list of (media box, content) with the content
+    stream of each page as bytes, info a dict of the document information (text values).
+    """
+    writer = PDFWriter()
+    catalog = writer.reserve()
+    parent = writer.reserve()
+    kids = []
+    for media_box, content in pages:
+        kids.append(writer.add(OrderedDict([
+            (Name('Type'), Name('Page')), (Name('Parent'), parent),
+            (Name('MediaBox'), list(media_box)), (Name('Resources'), OrderedDict()),
+            (Name('Contents'), writer.add(Stream(OrderedDict(), content))),
+        ])))
+    writer.set(parent, OrderedDict([(Name('Type'), Name('Pages')), (Name('Kids'), kids),
+                                    (Name('Count'), len(kids))]))
+    writer.set(catalog, OrderedDict([(Name('Type'), Name('Catalog')), (Name('Pages'), parent)]))
+    if info:
+        info = writer.add(OrderedDict((Name(k), String(v)) for k, v in info.items()))
+    return writer.write(catalog, info or None)
+
+
+# document information of files, without reading the whole file
+
+TAIL_SIZE = 1024  # bytes read from the end of a file to find startxref
+CHUNK_SIZE = 4096  # bytes read to parse a cross-reference section or an object (grows if needed)
+
+STRING_ESCAPE = re.compile(br'\\([0-7]{1,3}|\r\n|[\r\n]|.)', re.DOTALL)
+ESCAPES = {b'n': b'\n', b'r': b'\r', b't': b'\t', b'b': b'\b', b'f': b'\f'}
+
+
+def decode_text(raw):
+    """The text of a literal or hex string as read by the parser (e.g. b'(Caf\\351)')."""
+    if raw.startswith(b'<'):
+        hex_digits = re.sub(br'[^0-9A-Fa-f]', b'', raw)
+        if len(hex_digits) % 2:
+            hex_digits += b'0'
+        value = bytearray(int(hex_digits[i:i + 2], 16) for i in range(0, len(hex_digits), 2))
+        value = bytes(value)
+    elif raw.startswith(b'('):
+        def unescape(match):
+            escaped = match.group(1)
+            if escaped[:1].isdigit():
+                return bytearray([int(escaped, 8) & 0xff])
+            if escaped in (b'\r\n', b'\r', b'\n'):
+                return b''  # line continuation
+            return ESCAPES.get(escaped, escaped)
+        value = STRING_ESCAPE.sub(lambda m: bytes(unescape(m)), raw[1:-1])
+    else:
+        raise PDFError('not a string: %r' % raw)
+    if value.startswith(b'\xfe\xff'):
+        return value[2:].decode('utf-16-be')
+    return value.decode('latin-1')  # close enough to PDFDocEncoding for metadata
+
+
+class PDFTail(object):
+    """
+    The trailer and document information of the PDF file fp (opened in binary mode).
+    Only the end of the file, the cross-reference sections (newest first, as far as
+    needed) and the Info object are read, so the cost does not depend on the size of
+    the document.
+    """
+
+    def __init__(self, fp):
+        self.fp = fp
+        fp.seek(0, 2)
+        self.size = fp.tell()
+        fp.seek(max(0, self.size - TAIL_SIZE))
+        self.startxref = find_startxref(fp.read())
+        self.offsets = {}
+        self.trailer = OrderedDict()
+        self.trailers = []  # trailers of the sections read so far, newest first
+        self._next = self.startxref
+        self._seen = set()
+        self._read_section()
+
+    def _parse_at(self, offset, parse):
+        """Call parse(parser) on the file from offset, reading more until the result is complete."""
+        size = CHUNK_SIZE
+        while True:
+            self.fp.seek(offset)
+            data = self.fp.read(size)
+            at_end = offset + len(data) >= self.size
+            try:
+                result = parse(Parser(data))
+            except PDFError:
+                if at_end:
+                    raise
+            else:
+                # a token at the end of data could have been cut off (e.g. a number)
+                if at_end or result[-1] + 32 < len(data):
+                    return result
+            size *= 4
+
+    def _read_section(self):
+        offset = self._next
+        if offset in self._seen:
+            raise PDFError('loop in cross-reference tables')
+        self._seen.add(offset)
+        offsets, trailer, dummy = self._parse_at(offset, lambda parser: parser.xref_section(0))
+        for num, obj_offset in offsets.items():
+            self.offsets.setdefault(num, obj_offset)
+        for key, value in trailer.items():
+            self.trailer.setdefault(key, value)
+        self.trailers.append(trailer)
+        self._next = trailer.get('Prev')
+
+    def get(self, ref):
+        """The object ref refers to (None for free or missing objects)."""
+        while ref.num not in self.offsets and self._next is not None:
+            self._read_section()
+        offset = self.offsets.get(ref.num)
+        if offset is None:
+            return None
+        obj, dummy = self._parse_at(offset, lambda parser: parser.indirect_object(0, ref.num))
+        return obj
+
+    def resolve(self, obj):
+        while isinstance(obj, Ref):
+            obj = self.get(obj)
+        return obj
+
+    def info_ref(self):
+        """The reference to the Info dictionary (None if there is none)."""
+        while 'Info' not in self.trailer and self._next is not None:
+            self._read_section()
+        return self.trailer.get('Info')
+
+    def info(self):
+        """The Info dictionary, values are not decoded (see decode_text)."""
+        info = self.resolve(self.info_ref())
+        return info if isinstance(info, dict) else OrderedDict()
+
+
+def read_info(path):
+    """The document information of the PDF file path, as dict name -> text (text values only)."""
+    with open(path, 'rb') as fp:
+        tail = PDFTail(fp)
+        result = {}
+        for key, value in tail.info().items():
+            value = tail.resolve(value)
+            if isinstance(value, Raw) and value[:1] in (b'(', b'<'):
+                result[str(key)] = decode_text(value)
+        return result
+
+
+def stamp_info(path, values):
+    """
+    Set entries of the document information of the PDF file path (values maps names to
+    text), by appending an incremental update with the new Info dictionary. The existing
+    content of the file is neither read nor rewritten.
+    """
+    with open(path, 'r+b') as fp:
+        tail = PDFTail(fp)
+        if 'Encrypt' in tail.trailer:
+            raise PDFError('encrypted PDFs are not supported')
+        if 'Root' not in tail.trailer or 'Size' not in tail.trailer:
+            raise PDFError('invalid trailer')
+        info = OrderedDict(tail.info())
+        for key, value in values.items():
+            info[Name(key)] = String(value)
+        ref = tail.info_ref()
+        size = tail.trailer['Size']
+        if not isinstance(ref, Ref):
+            ref = Ref(size, 0)
+            size += 1
+
+        fp.seek(tail.size - 1)
+        separator = b'' if fp.read(1) in (b'\n', b'\r') else b'\n'
+        obj_offset = tail.size + len(separator)
+        obj = b'%d %d obj\n' % ref + serialize(info) + b'\nendobj\n'
+        trailer = OrderedDict([(Name('Size'), size), (Name('Root'), tail.trailer['Root']),
+                               (Name('Info'), ref), (Name('Prev'), tail.startxref)])
+        if 'ID' in tail.trailer:
+            trailer[Name('ID')] = tail.trailer['ID']
+        xref = b'xref\n%d 1\n%010d %05d n \ntrailer\n' % (ref.num, obj_offset, ref.gen)
+        fp.seek(0, 2)
+        fp.write(separator + obj + xref + serialize(trailer) +
+                 b'\nstartxref\n%d\n%%%%EOF\n' % (obj_offset + len(obj)))
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Post-processing of exported files in background threads.
+
+Exports are done by OmniGraffle one at a time, but what happens to an exported
+file afterwards (moving it out of the sandbox, stamping metadata, downsampling)
+does not need the application. A Pipeline runs these tasks in worker threads
+while the next file is exported:
+
+    pipeline = Pipeline()
+    for canvas in canvases:
+        export(canvas, path)  # talks to OmniGraffle
+        pipeline.submit(path, post_process, path)
+    errors = pipeline.close()  # [(path, exception), ...]
+
+The queue of tasks is bounded, so exports wait when post-processing falls
+behind. Errors are collected per output instead of stopping the export.
+"""
+
+import logging
+import threading
+
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+
+DEFAULT_WORKERS = 2
+DEFAULT_QUEUE_SIZE = 8
+
+
+class Pipeline(object):
+
+    def __init__(self, workers=DEFAULT_WORKERS, queue_size=DEFAULT_QUEUE_SIZE):
+        self.tasks = queue.Queue(queue_size)
+        self.errors = []  # (output, exception)
+        self._lock = threading.Lock()
+        self._threads = []
+        for dummy in range(workers):
+            thread = threading.Thread(target=self._work)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def submit(self, output, func, *args):
+        """Run func(*args) in the background, output names the file for error reports."""
+        if not self._threads:
+            raise RuntimeError('pipeline is closed')
+        self.tasks.put((output, func, args))  # blocks while the queue is full
+
+    def _work(self):
+        while True:
+            task = self.tasks.get()
+            try:
+                if task is None:
+                    return
+                output, func, args = task
+                try:
+                    func(*args)
+                except Exception as e:
+                    logging.debug('post-processing %s failed', output, exc_info=True)
+                    with self._lock:
+                        self.errors.append((output, e))
+            finally:
+                self.tasks.task_done()
+
+    def wait(self):
+        """Wait until all submitted tasks are done."""
+        self.tasks.join()
+
+    def close(self):
+        """Finish all tasks, stop the workers and return the errors."""
+        for dummy in self._threads:
+            self.tasks.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        return self.errors
@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Reading and writing gettext catalogs (PO and POT files) without building them in memory.
+
+    for msgid, msgstr, flags in iter_translations('foobar-de.po'):
+        ...
+
+    with io.open('foobar.pot', 'w', encoding='utf-8') as fp:
+        writer = POTWriter(fp)
+        for locations, text in messages:
+            writer.write(text, occurrences=locations)
+
+The output can be read by polib and gettext tools (msgmerge, Poedit etc.).
+
+Compiled catalogs (MO files) with a hash table, for translation memories that are
+opened without parsing and shared by several processes:
+
+    write_mo('de.mo', {u'box': u'Kasten'})
+    tm = MOFile('de.mo')  # memory mapped
+    tm[u'box']
+"""
+
+from __future__ import unicode_literals
+
+import io
+import mmap
+import os
+import re
+import struct
+import tempfile
+
+try:
+    string_types = (basestring,)  # Python 2
+except NameError:
+    string_types = (str,)
+text_type = type('')
+
+MO_MAGIC = 0x950412de
+MO_HEADER = 'Content-Type: text/plain; charset=UTF-8\n'
+
+WIDTH = 78  # maximum width of reference comments, like polib and xgettext
+
+ESCAPES = (('\\', '\\\\'), ('"', '\\"'), ('\t', '\\t'), ('\r', '\\r'), ('\n', '\\n'))
+
+
+def escape(text):
+    for char, escaped in ESCAPES:
+        text = text.replace(char, escaped)
+    return text
+
+
+UNESCAPES = {'n': '\n', 't': '\t', 'r': '\r', '"': '"', '\\': '\\',
+             'a': '\a', 'b': '\b', 'f': '\f', 'v': '\v'}
+UNESCAPE_RE = re.compile(r'\\(.)')
+
+
+def unescape(text):
+    if '\\' not in text:
+        return text
+    return UNESCAPE_RE.sub(lambda m: UNESCAPES.get(m.group(1), m.group(1)), text)
+
+
+def _quoted(line, start):
+    """The contents of the quoted string in line after position start."""
+    first = line.index('"', start)
+    return unescape(line[first + 1:line.rindex('"')])
+
+
+def iter_translations(path):
+    """
+    Yield (msgid, msgstr, flags) for each translated entry of the PO file path: not obsolete,
+    not fuzzy, with a non-empty msgstr (entries with plural forms and the header are skipped).
+    The file is read line by line, only the current entry is kept in memory.
+    """
+    with io.open(path, encoding='utf-8-sig') as fp:
+        entry = None  # dict keyword -> list of string parts
+        flags = []
+        current = None
+        for line in fp:
+            line = line.strip()
+            if line.startswith('"'):
+                if current is not None:
+                    current.append(_quoted(line, 0))
+                continue
+            if entry is not None and (not line or line.startswith('#') or line.startswith('msgctxt') or
+                                      line.startswith('msgid ') and 'msgid' in entry):
+                for result in _translation(entry, flags):
+                    yield result
+                entry, flags, current = None, [], None
+            if not line or line.startswith('#~'):
+                # obsolete entries are comments only, flags before them belong to them
+                flags, current = [], None
+            elif line.startswith('#,'):
+                flags.extend(flag.strip() for flag in line[2:].split(',') if flag.strip())
+            elif line.startswith('#'):
+                continue
+            else:
+                keyword = line.split(None, 1)[0]
+                if entry is None:
+                    entry = {}
+                current = entry.setdefault(keyword, [])
+                current.append(_quoted(line, len(keyword)))
+        if entry is not None:
+            for result in _translation(entry, flags):
+                yield result
+
+
+def _translation(entry, flags):
+    """The translation (msgid, msgstr, flags) of a parsed entry, if it is translated."""
+    if 'fuzzy' in flags or 'msgid_plural' in entry or 'msgid' not in entry:
+        return
+    msgid = ''.join(entry['msgid'])
+    msgstr = ''.join(entry.get('msgstr', ()))
+    if msgid and msgstr:
+        yield msgid, msgstr, flags
+
+
+def quoted_lines(keyword, text):
+    """Return the lines for keyword text, a text with newlines is split after each newline."""
+    if '\n' not in text.rstrip('\n'):
+        return ['%s "%s"' % (keyword, escape(text))]
+    lines = ['%s ""' % keyword]
+    parts = text.split('\n')
+    for idx, part in enumerate(parts):
+        if idx < len(parts) - 1:
+            lines.append('"%s"' % escape(part + '\n'))
+        elif part:
+            lines.append('"%s"' % escape(part))
+    return lines
+
+
+def reference_lines(occurrences):
+    """Return the '#:' lines for a list of (file, line) or locations, wrapped at WIDTH."""
+    references = ['%s:%s' % o if isinstance(o, tuple) else '%s:0' % o for o in occurrences]
+    lines = []
+    line = '#:'
+    for reference in references:
+        if len(line) > 2 and len(line) + 1 + len(reference) > WIDTH:
+            lines.append(line)
+            line = '#:'
+        line += ' ' + reference
+    if len(line) > 2:
+        lines.append(line)
+    return lines
+
+
+class POTWriter(object):
+    """Write the entries of a catalog to the text file fp (opened with encoding utf-8) one by one."""
+
+    def __init__(self, fp, header=True):
+        self.fp = fp
+        self.count = 0
+        if header:
+            self._write_lines(['#', 'msgid ""', 'msgstr ""'])
+
+    def _write_lines(self, lines):
+        self.fp.write('\n'.join(lines) + '\n\n')
+
+    def write(self, msgid, msgstr=None, occurrences=(), flags=()):
+        """Write one entry, msgstr defaults to msgid (like the POT files written by ogtranslate)."""
+        lines = reference_lines(occurrences)
+        if flags:
+            lines.append('#, ' + ', '.join(flags))
+        lines.extend(quoted_lines('msgid', msgid))
+        lines.extend(quoted_lines('msgstr', msgid if msgstr is None else msgstr))
+        self._write_lines(lines)
+        self.count += 1
+
+
+def hashpjw(data):
+    """The hash function of GNU gettext for the hash table in MO files."""
+    value = 0
+    for byte in bytearray(data):
+        value = ((value << 4) + byte) & 0xffffffff
+        high = value & 0xf0000000
+        if high:
+            value ^= high >> 24
+            value ^= high
+    return value
+
+
+def _hash_size(count):
+    """Size of the hash table for count strings: a prime > 4/3 count, like msgfmt."""
+    size = max(3, count * 4 // 3 + 1)
+    while any(size % d == 0 for d in range(2, int(size ** 0.5) + 1)):
+        size += 1
+    return size
+
+
+def _utf8(text):
+    """text as UTF-8 bytes, text that is already encoded (a str on Python 2) is kept."""
+    return text.encode('utf-8') if isinstance(text, text_type) else text
+
+
+def write_mo(path, translations):
+    """Write the dict msgid -> msgstr translations (unicode) to the MO file path, atomically."""
+    entries = sorted((_utf8(msgid), _utf8(msgstr))
+                     for msgid, msgstr in translations.items() if msgid)
+    entries.insert(0, (b'', MO_HEADER.encode('utf-8')))
+    count = len(entries)
+    hash_size = _hash_size(count)
+    originals = 28
+    translated = originals + 8 * count
+    hash_table = translated + 8 * count
+    offset = hash_table + 4 * hash_size
+
+    ids, strs = [], []
+    for msgid, dummy in entries:
+        ids.append((len(msgid), offset))
+        offset += len(msgid) + 1
+    for dummy, msgstr in entries:
+        strs.append((len(msgstr), offset))
+        offset += len(msgstr) + 1
+
+    table = [0] * hash_size
+    for idx, (msgid, dummy) in enumerate(entries):
+        value = hashpjw(msgid)
+        pos = value % hash_size
+        incr = 1 + value % (hash_size - 2)
+        while table[pos]:
+            pos = (pos + incr) % hash_size
+        table[pos] = idx + 1
+
+    parts = [struct.pack('<7I', MO_MAGIC, 0, count, originals, translated, hash_size, hash_table)]
+    parts.extend(struct.pack('<2I', length, pos) for length, pos in ids + strs)
+    parts.append(struct.pack('<%dI' % hash_size, *table))
+    parts.extend(msgid + b'\0' for msgid, dummy in entries)
+    parts.extend(msgstr + b'\0' for dummy, msgstr in entries)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            fp.write(b''.join(parts))
+        os.rename(tmp, path)
+    except Exception:
+        os.unlink(tmp)
+        raise
+
+
+class MOFile(object):
+    """
+    A read-only mapping msgid -> msgstr of a MO file with a hash table (see write_mo), memory
+    mapped, so opening it is cheap and the pages are shared by all processes that open it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as fp:
+            self._data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, = struct.unpack_from('<I', self._data, 0)
+        self._order = '<' if magic == MO_MAGIC else '>'
+        header = struct.unpack_from(self._order + '7I', self._data, 0)
+        if header[0] != MO_MAGIC:
+            raise ValueError('%s is not a MO file' % path)
+        dummy, dummy, self._count, self._originals, self._translations, self._hash_size, self._hash_table = header
+        if self._hash_size < 3:
+            raise ValueError('%s has no hash table' % path)
+
+    def _string(self, table, idx):
+        length, offset = struct.unpack_from(self._order + '2I', self._data, table + 8 * idx)
+        return self._data[offset:offset + length]
+
+    def _index(self, msgid):
+        key = _utf8(msgid)
+        value = hashpjw(key)
+        pos = value % self._hash_size
+        incr = 1 + value % (self._hash_size - 2)
+        for dummy in range(self._hash_size):
+            entry, = struct.unpack_from(self._order + 'I', self._data, self._hash_table + 4 * pos)
+            if not entry:
+                return None
+            if self._string(self._originals, entry - 1) == key:
+                return entry - 1
+            pos = (pos + incr) % self._hash_size
+        return None
+
+    def __contains__(self, msgid):
+        return bool(msgid) and self._index(msgid) is not None
+
+    def __getitem__(self, msgid):
+        idx = self._index(msgid) if msgid else None
+        if idx is None:
+            raise KeyError(msgid)
+        return self._string(self._translations, idx).decode('utf-8')
+
+    def get(self, msgid, default=None):
+        try:
+            return self[msgid]
+        except KeyError:
+            return default
+
+    def __len__(self):
+        return self._count - 1  # without the header
+
+    def close(self):
+        self._data.close()
@@ -0,0 +1,385 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+A minimal reader and writer for the Cocoa flavoured RTF that OmniGraffle stores
+in the 'Text' of a graphic.
+
+Only what ogtool needs is supported: the plain text, the attribute runs (text
+with uniform font, size, color and style) and replacing the text of one or all
+runs while keeping the surrounding formatting intact.
+"""
+
+import re
+
+try:
+    unichr
+except NameError:  # Python 3
+    unichr = chr
+
+
+TOKEN = re.compile(r"""
+      (?P<open>\{)
+    | (?P<close>\})
+    | \\(?P<word>[a-zA-Z]+)(?P<param>-?\d+)?[ ]?
+    | \\'(?P<hex>[0-9a-fA-F]{2})
+    | \\(?P<symbol>[^a-zA-Z])
+    | (?P<newline>[\r\n]+)
+    | (?P<text>[^\\{}\r\n]+)
+    """, re.VERBOSE)
+
+# destinations that never contain visible text
+SKIPPED_DESTINATIONS = ('fonttbl', 'colortbl', 'expandedcolortbl', 'stylesheet', 'info',
+                        'listtable', 'listoverridetable', 'pict', 'NeXTGraphic')
+
+# control words that change character formatting and therefore start a new run
+CHARACTER_FORMATTING = {
+    'f': 'font',
+    'fs': 'size',
+    'cf': 'color',
+    'b': 'bold',
+    'i': 'italic',
+    'ul': 'underline',
+    'ulnone': 'underline',
+}
+SYMBOLS = {'\\': '\\', '{': '{', '}': '}', '~': u'\u00a0', '\n': '\n', '\r': '\n', '-': ''}
+TEXT_WORDS = {'par': '\n', 'line': u'\u2028', 'tab': '\t'}
+
+
+class Token(object):
+    """A token of an RTF string, with its position in the source."""
+
+    __slots__ = ('kind', 'value', 'param', 'start', 'end')
+
+    def __init__(self, kind, value, param, start, end):
+        self.kind = kind
+        self.value = value
+        self.param = param
+        self.start = start
+        self.end = end
+
+
+class Run(object):
+    """A sequence of characters with the same formatting (an 'attribute run')."""
+
+    def __init__(self, font, size, color, bold, italic, underline):
+        self.font = font
+        self.size = size
+        self.color = color
+        self.bold = bold
+        self.italic = italic
+        self.underline = underline
+        self.chunks = []  # list of (token index, text)
+
+    @property
+    def text(self):
+        return u''.join(text for idx, text in self.chunks)
+
+    def __repr__(self):
+        return 'Run(%r, font=%r, size=%r)' % (self.text, self.font, self.size)
+
+
+def tokenize(rtf):
+    tokens = []
+    for m in TOKEN.finditer(rtf):
+        if m.group('open'):
+            tokens.append(Token('open', '{', None, m.start(), m.end()))
+        elif m.group('close'):
+            tokens.append(Token('close', '}', None, m.start(), m.end()))
+        elif m.group('word'):
+            param = m.group('param')
+            tokens.append(Token('word', m.group('word'), int(param) if param is not None else None,
+                                m.start(), m.end()))
+        elif m.group('hex'):
+            tokens.append(Token('hex', int(m.group('hex'), 16), None, m.start(), m.end()))
+        elif m.group('symbol'):
+            tokens.append(Token('symbol', m.group('symbol'), None, m.start(), m.end()))
+        elif m.group('newline'):
+            tokens.append(Token('newline', m.group('newline'), None, m.start(), m.end()))
+        else:
+            tokens.append(Token('text', m.group('text'), None, m.start(), m.end()))
+    return tokens
+
+
+class RichText(object):
+    """
+    Parsed representation of an RTF string.
+
+    fonts maps font index to font name, colors is the color table with (red, green, blue)
+    tuples (0-255), None for the 'automatic' color.
+    """
+
+    def __init__(self, rtf):
+        self.rtf = rtf or ''
+        self.tokens = tokenize(self.rtf)
+        self.fonts = {}
+        self.colors = []
+        self.codepage = 'cp1252'
+        self.runs = []
+        self._table = {}
+        self._font_tokens = {}  # font index -> indices of the tokens with the font name
+        self._color_table_end = None  # index of the token closing the color table
+        self._parse()
+
+    @property
+    def text(self):
+        return u''.join(r.text for r in self.runs)
+
+    def _parse(self):
+        default = dict(font=0, size=24, color=0, bold=False, italic=False, underline=False)
+        state = dict(default)
+        stack = []
+        destination = None  # name of the destination that is currently skipped
+        skip_depth = None  # group depth of the skipped destination
+        depth = 0
+        uc = 1  # number of fallback characters after \uN
+        pending_skip = 0
+        high_surrogate = None
+        current = None
+
+        for idx, t in enumerate(self.tokens):
+            if t.kind == 'open':
+                stack.append((dict(state), uc))
+                depth += 1
+                continue
+            if t.kind == 'close':
+                if stack:
+                    state, uc = stack.pop()
+                if skip_depth is not None and depth == skip_depth:
+                    if destination == 'colortbl':
+                        self._color_table_end = idx
+                    self._table = {}
+                    destination = skip_depth = None
+                depth -= 1
+                continue
+
+            if skip_depth is not None:
+                if destination == 'fonttbl':
+                    self._parse_font_table(t, idx)
+                elif destination == 'colortbl':
+                    self._parse_color_table(t)
+                continue
+
+            if pending_skip and t.kind in ('text', 'hex', 'symbol'):
+                if t.kind == 'text' and len(t.value) > pending_skip:
+                    # only the first characters are the fallback
+                    current = self._add_text(current, state, idx, t.value[pending_skip:])
+                    pending_skip = 0
+                else:
+                    pending_skip = max(pending_skip - (len(t.value) if t.kind == 'text' else 1), 0)
+                continue
+
+            if t.kind == 'word':
+                if t.value in SKIPPED_DESTINATIONS:
+                    destination, skip_depth = t.value, depth
+                    self._table = {}
+                elif t.value == 'ansicpg' and t.param:
+                    self.codepage = 'cp%s' % t.param
+                elif t.value == 'uc':
+                    uc = t.param or 0
+                elif t.value == 'u':
+                    code = t.param if t.param >= 0 else t.param + 65536
+                    pending_skip = uc
+                    if 0xd800 <= code < 0xdc00:
+                        high_surrogate = code
+                        current = self._add_text(current, state, idx, '')
+                        continue
+                    if high_surrogate is not None and 0xdc00 <= code < 0xe000:
+                        char = unichr(high_surrogate) + unichr(code)
+                        try:
+                            char = char.encode('utf-16-le', 'surrogatepass').decode('utf-16-le')
+                        except LookupError:  # Python 2 keeps the surrogate pair
+                            pass
+                    else:
+                        char = unichr(code)
+                    high_surrogate = None
+                    current = self._add_text(current, state, idx, char)
+                elif t.value in TEXT_WORDS:
+                    current = self._add_text(current, state, idx, TEXT_WORDS[t.value])
+                elif t.value == 'plain':
+                    for key in ('size', 'bold', 'italic', 'underline'):
+                        state[key] = default[key]
+                elif t.value in CHARACTER_FORMATTING:
+                    key = CHARACTER_FORMATTING[t.value]
+                    if key in ('bold', 'italic', 'underline'):
+                        state[key] = t.param != 0 and t.value != 'ulnone'
+                    else:
+                        state[key] = t.param if t.param is not None else default[key]
+            elif t.kind == 'symbol':
+                if t.value == '*':
+                    destination, skip_depth = '*', depth
+                elif t.value in SYMBOLS:
+                    current = self._add_text(current, state, idx, SYMBOLS[t.value])
+            elif t.kind == 'hex':
+                current = self._add_text(current, state, idx,
+                                         bytearray([t.value]).decode(self.codepage, 'replace'))
+            elif t.kind == 'text':
+                current = self._add_text(current, state, idx, t.value)
+
+        # remove empty runs (e.g. from optional hyphens)
+        self.runs = [r for r in self.runs if r.text]
+
+    def _add_text(self, current, state, idx, text):
+        attrs = (state['font'], state['size'], state['color'], state['bold'], state['italic'],
+                 state['underline'])
+        if current is None or current[0] != attrs:
+            run = Run(*attrs)
+            self.runs.append(run)
+            current = (attrs, run)
+        current[1].chunks.append((idx, text))
+        return current
+
+    def _parse_font_table(self, t, idx):
+        """Font table entries look like '\\f0\\fnil\\fcharset0 Ubuntu;'."""
+        if t.kind == 'word' and t.value == 'f':
+            self._table = dict(index=t.param, name='')
+        elif t.kind == 'text' and 'index' in self._table:
+            self._table['name'] += t.value
+            self._font_tokens.setdefault(self._table['index'], []).append(idx)
+            if self._table['name'].endswith(';'):
+                self.fonts[self._table['index']] = self._table['name'][:-1].strip()
+                self._table = {}
+
+    def _parse_color_table(self, t):
+        """Color table entries look like '\\red255\\green255\\blue255;', the first entry is empty."""
+        if t.kind == 'word' and t.value in ('red', 'green', 'blue'):
+            self._table[t.value] = t.param or 0
+        elif t.kind == 'text':
+            for dummy in range(t.value.count(';')):
+                if self._table:
+                    self.colors.append((self._table.get('red', 0), self._table.get('green', 0),
+                                        self._table.get('blue', 0)))
+                else:
+                    self.colors.append(None)
+                self._table = {}
+
+    def font_name(self, run):
+        return self.fonts.get(run.font)
+
+    def color(self, run):
+        """Return the color of a run as (red, green, blue) with 8 bit components, None for default."""
+        if 0 < run.color < len(self.colors):
+            return self.colors[run.color]
+        return None
+
+    def replace_runs(self, replacements):
+        """
+        Return a new RTF string where the text of run n is replaced by replacements[n].
+
+        The new text is placed where the first character of the run was, all
+        other characters of the run are removed, so formatting control words
+        inside the run are kept.
+        """
+        edits = {}
+        for n, text in replacements.items():
+            run = self.runs[n]
+            first = True
+            for idx, dummy in run.chunks:
+                edits[idx] = escape(text) if first else ''
+                first = False
+        return self._apply(edits)
+
+    def replace_text(self, text):
+        """Return a new RTF string with all text replaced by text, using the formatting of the first run."""
+        if not self.runs:
+            return self._append_text(text)
+        edits = {}
+        for n, run in enumerate(self.runs):
+            for idx, dummy in run.chunks:
+                edits[idx] = ''
+        edits[self.runs[0].chunks[0][0]] = escape(text)
+        return self._apply(edits)
+
+    def replace_control_words(self, word, param):
+        """Return a new RTF string where every control word word (e.g. 'fs') in the text has param."""
+        edits = {}
+        in_table = 0
+        for idx, t in enumerate(self.tokens):
+            if t.kind == 'word' and t.value in SKIPPED_DESTINATIONS:
+                in_table = 1
+            elif in_table and t.kind == 'open':
+                in_table += 1
+            elif in_table and t.kind == 'close':
+                in_table -= 1
+            elif not in_table and t.kind == 'word' and t.value == word:
+                edits[idx] = '\\%s%s ' % (word, param)
+        return self._apply(edits)
+
+    def replace_font(self, name):
+        """Return a new RTF string where all fonts in the font table are replaced by font name."""
+        edits = {}
+        for indices in self._font_tokens.values():
+            edits[indices[0]] = name + ';'
+            for idx in indices[1:]:
+                edits[idx] = ''
+        return self._apply(edits)
+
+    def replace_color(self, color):
+        """Return a new RTF string where all text has color (red, green, blue) with 8 bit components."""
+        if self._color_table_end is None:
+            return self.rtf
+        index = max(len(self.colors), 1)
+        edits = {self._color_table_end: '%s\\red%d\\green%d\\blue%d;}' % (
+            '' if self.colors else ';', color[0], color[1], color[2])}
+        found = False
+        for idx, t in enumerate(self.tokens):
+            if idx > self._color_table_end and t.kind == 'word' and t.value == 'cf':
+                edits[idx] = '\\cf%d ' % index
+                found = True
+        if not found and self.runs:
+            idx, text = self.runs[0].chunks[0]
+            edits[idx] = '\\cf%d %s' % (index, self.rtf[self.tokens[idx].start:self.tokens[idx].end])
+        return self._apply(edits)
+
+    def _append_text(self, text):
+        rtf = self.rtf.rstrip()
+        if rtf.endswith('}'):
+            return rtf[:-1] + ' ' + escape(text) + '}'
+        return make_rtf(text)
+
+    def _apply(self, edits):
+        out = []
+        pos = 0
+        for idx in sorted(edits):
+            t = self.tokens[idx]
+            out.append(self.rtf[pos:t.start])
+            replacement = edits[idx]
+            previous = self.tokens[idx - 1] if idx else None
+            if previous is not None and previous.kind == 'word' and \
+                    not self.rtf[previous.start:previous.end].endswith(' ') and \
+                    re.match(r'[a-zA-Z0-9 -]', replacement):
+                # keep text from being read as part of the preceding control word
+                replacement = ' ' + replacement
+            out.append(replacement)
+            pos = t.end
+        out.append(self.rtf[pos:])
+        return ''.join(out)
+
+
+def escape(text):
+    """Escape plain text for use in an RTF string."""
+    out = []
+    for c in text:
+        if c in '\\{}':
+            out.append('\\' + c)
+        elif c == '\n':
+            out.append('\\\n')
+        elif c == '\t':
+            out.append('\\tab ')
+        elif ord(c) > 127:
+            code = ord(c)
+            if code > 0xffff:  # use a surrogate pair
+                code -= 0x10000
+                out.append('\\uc0\\u%d \\u%d ' % (0xd800 + (code >> 10), 0xdc00 + (code & 0x3ff)))
+            else:
+                out.append('\\uc0\\u%d ' % code)
+        else:
+            out.append(c)
+    return ''.join(out)
+
+
+def make_rtf(text, font='Helvetica', size=12):
+    """Create a minimal Cocoa RTF string for text."""
+    return ('{\\rtf1\\ansi\\ansicpg1252\\cocoartf1504\n'
+            '{\\fonttbl\\f0\\fnil\\fcharset0 %s;}\n'
+            '{\\colortbl;\\red255\\green255\\blue255;}\n'
+            '\\pard\\qc\n\n\\f0\\fs%d \\cf0 %s}') % (font, int(round(size * 2)), escape(text))
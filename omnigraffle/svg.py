@@ -0,0 +1,575 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Render canvases to SVG from the .graffle file, without OmniGraffle.
+
+The renderer reads the property list of the document (see omnigraffle.graffle_file)
+and draws shapes (rectangles, rounded rectangles, circles, diamonds, triangles),
+lines with arrow heads, groups and tables, images, fills, strokes and text, layer
+by layer (including the shared layer). It is meant for previews and web
+documentation, not as a replacement of OmniGraffle's export: there are no font
+metrics, so text is wrapped by an estimate of its width, gradients are drawn in
+their first color, and shapes that are not known (e.g. from stencils) are drawn as
+rectangles.
+
+    >>> render_canvases('foobar.graffle', {'canvas-1': 'out/canvas-1.svg'})
+
+Canvases are rendered in parallel, in a pool of processes.
+"""
+
+from __future__ import division
+
+from collections import OrderedDict
+import base64
+import glob
+import io
+import math
+import multiprocessing
+import os
+import re
+
+from xml.sax.saxutils import escape, quoteattr
+
+from omnigraffle import fingerprint
+from omnigraffle import graffle_file
+from omnigraffle.rtf import RichText
+
+# changes whenever the output of the renderer changes (part of fingerprints of exported files)
+VERSION = '1'
+
+DEFAULT_FILL = {'r': 1, 'g': 1, 'b': 1}
+DEFAULT_STROKE = {'r': 0, 'g': 0, 'b': 0}
+DEFAULT_PAD = 5.0
+LINE_HEIGHT = 1.2  # of the font size
+CHAR_WIDTH = 0.55  # average width of a character in a proportional font, of the font size
+MONOSPACE_CHAR_WIDTH = 0.6
+
+NUMBERS = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+ALIGNMENT = re.compile(r'\\q([lcrj])\b')
+ALIGN_KEYWORDS = {'l': 'start', 'c': 'middle', 'r': 'end', 'j': 'start'}
+ALIGN_VALUES = {0: 'start', 1: 'middle', 2: 'end', 3: 'start'}  # 'Align' in the plist
+
+IMAGE_TYPES = [
+    (b'\x89PNG', 'image/png'),
+    (b'\xff\xd8', 'image/jpeg'),
+    (b'GIF8', 'image/gif'),
+    (b'II*\x00', 'image/tiff'),
+    (b'MM\x00*', 'image/tiff'),
+]
+
+
+def numbers(value):
+    """The numbers in a plist geometry string like '{{10, 20}, {30, 40}}'."""
+    return [float(n) for n in NUMBERS.findall(value or '')]
+
+
+def fmt(value):
+    """A number for SVG attributes."""
+    text = '%.3f' % value
+    text = text.rstrip('0').rstrip('.')
+    return '0' if text in ('', '-0') else text
+
+
+def svg_color(color, default=None):
+    """Return ('#rrggbb', opacity) for a plist color, or default if there is none."""
+    if not color:
+        return default
+    try:
+        if 'r' in color:
+            components = [float(color.get(k, 0)) for k in ('r', 'g', 'b')]
+        else:
+            components = [float(color.get('w', 0))] * 3
+        alpha = float(color.get('a', 1))
+    except (TypeError, ValueError):
+        return default
+    return ('#%02x%02x%02x' % tuple(int(round(max(0.0, min(1.0, c)) * 255)) for c in components), alpha)
+
+
+def image_type(data):
+    for magic, mime in IMAGE_TYPES:
+        if data.startswith(magic):
+            return mime
+    return None
+
+
+def yes(value, default=True):
+    """The value of a 'YES'/'NO' entry."""
+    if value is None:
+        return default
+    return value not in ('NO', 0, False, '0')
+
+
+class Bounds(object):
+    """A bounding box that grows with the areas that are added."""
+
+    def __init__(self):
+        self.box = None
+
+    def add(self, x0, y0, x1, y1):
+        if self.box is None:
+            self.box = [x0, y0, x1, y1]
+        else:
+            self.box = [min(self.box[0], x0), min(self.box[1], y0),
+                        max(self.box[2], x1), max(self.box[3], y1)]
+
+
+class CanvasRenderer(object):
+    """
+    Render one canvas: sheet is the sheet of the canvas in the plist, master the sheet of its
+    shared layer (or None), images maps image ids to the image data.
+    """
+
+    def __init__(self, sheet, master=None, images=None, scale=1.0, background=True, border=0.0):
+        self.sheet = sheet
+        self.master = master
+        self.images = images or {}
+        self.scale = scale
+        self.background = background
+        self.border = border
+        self.defs = OrderedDict()  # id -> definition (markers, filters)
+        self.bounds = Bounds()
+
+    def layers(self):
+        """The visible layers as list of (name, graphics), bottom layer first."""
+        own = self.sheet.get('Layers') or [{}]
+        by_layer = [[] for dummy in own]
+        for graphic in self.sheet.get('GraphicsList') or []:
+            idx = graphic.get('Layer', 0)
+            if 0 <= idx < len(own):
+                by_layer[idx].append(graphic)
+        layers = []  # top layer first, like in the plist
+        shared = None
+        if self.master is not None:
+            master_layer = (self.master.get('Layers') or [{}])[0]
+            shared = (self.master.get('SheetTitle', ''), master_layer, self.master.get('GraphicsList') or [])
+        names = self.sheet.get('AllLayers')
+        own_layers = [(layer.get('Name', ''), layer, graphics) for layer, graphics in zip(own, by_layer)]
+        if names:
+            by_name = OrderedDict((l[0], l) for l in own_layers)
+            for name in names:
+                if name in by_name:
+                    layers.append(by_name.pop(name))
+                elif shared is not None and name == shared[0]:
+                    layers.append(shared)
+                    shared = None
+            layers.extend(by_name.values())
+        else:
+            layers.extend(own_layers)
+        if shared is not None:
+            layers.append(shared)
+        return [(name, graphics) for name, layer, graphics in reversed(layers)
+                if yes(layer.get('View')) and yes(layer.get('Print'))]
+
+    def render(self):
+        """Return the SVG document (text)."""
+        body = []
+        for name, graphics in self.layers():
+            out = []
+            for graphic in reversed(graphics):  # the first graphic is in front
+                self.graphic(graphic, out)
+            if out:
+                body.append(u'<g id=%s>\n%s</g>\n' % (quoteattr(u'layer-%s' % name), u''.join(out)))
+
+        background = self.sheet.get('BackgroundGraphic')
+        if self.bounds.box is None:
+            if background and 'Bounds' in background:
+                x, y, w, h = numbers(background['Bounds'])
+            else:
+                w, h = (numbers(self.sheet.get('CanvasSize')) or [576, 733])[:2]
+                x = y = 0.0
+            self.bounds.add(x, y, x + w, y + h)
+        x0, y0, x1, y1 = self.bounds.box
+        x0, y0, x1, y1 = x0 - self.border, y0 - self.border, x1 + self.border, y1 + self.border
+        width, height = x1 - x0, y1 - y0
+
+        head = [u'<?xml version="1.0" encoding="UTF-8"?>\n',
+                u'<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" '
+                u'version="1.1" width="%s" height="%s" viewBox="%s %s %s %s">\n' % (
+                    fmt(width * self.scale), fmt(height * self.scale), fmt(x0), fmt(y0), fmt(width), fmt(height))]
+        title = self.sheet.get('SheetTitle')
+        if title:
+            head.append(u'<title>%s</title>\n' % escape(title))
+        if self.defs:
+            head.append(u'<defs>\n%s</defs>\n' % u''.join(self.defs.values()))
+        if self.background and background:
+            fill = self.fill_attributes(background.get('Style', {}).get('fill'))
+            if fill:
+                head.append(u'<rect x="%s" y="%s" width="%s" height="%s"%s/>\n' % (
+                    fmt(x0), fmt(y0), fmt(width), fmt(height), fill))
+        return u''.join(head + body + [u'</svg>\n'])
+
+    # graphics
+
+    def graphic(self, graphic, out):
+        cls = graphic.get('Class')
+        if cls in ('Group', 'TableGroup'):
+            self.group(graphic, out)
+        elif cls == 'LineGraphic':
+            self.line(graphic, out)
+        elif 'Bounds' in graphic:
+            self.shape(graphic, out)
+
+    def group(self, graphic, out):
+        children = []
+        graphics = graphic.get('Graphics') or []
+        if yes(graphic.get('Collapsed'), False) and graphics:
+            graphics = graphics[:1]  # collapsed subgraphs only show their label
+        for child in reversed(graphics):
+            self.graphic(child, children)
+        if children:
+            out.append(u'<g data-id="%s">\n%s</g>\n' % (graphic.get('ID'), u''.join(children)))
+
+    def fill_attributes(self, fill):
+        fill = fill or {}
+        if not yes(fill.get('Draws')):
+            return u''
+        color, opacity = svg_color(fill.get('Color'), svg_color(DEFAULT_FILL))
+        attrs = u' fill="%s"' % color
+        if opacity < 1:
+            attrs += u' fill-opacity="%s"' % fmt(opacity)
+        return attrs
+
+    def stroke_attributes(self, stroke):
+        stroke = stroke or {}
+        if not yes(stroke.get('Draws')):
+            return u' stroke="none"', 0.0
+        color, opacity = svg_color(stroke.get('Color'), svg_color(DEFAULT_STROKE))
+        width = float(stroke.get('Width', 1))
+        attrs = u' stroke="%s" stroke-width="%s"' % (color, fmt(width))
+        if opacity < 1:
+            attrs += u' stroke-opacity="%s"' % fmt(opacity)
+        if stroke.get('Pattern'):
+            attrs += u' stroke-dasharray="%s %s"' % (fmt(4 * width), fmt(3 * width))
+        return attrs, width
+
+    def shadow_attribute(self, shadow):
+        """A filter for the shadow (OmniGraffle draws shadows unless they are switched off)."""
+        shadow = shadow or {}
+        if not yes(shadow.get('Draws')):
+            return u''
+        dx, dy = (numbers(shadow.get('ShadowVector')) or [0, 2])[:2]
+        color, opacity = svg_color(shadow.get('Color'), ('#000000', 0.5))
+        key = 'shadow-%s-%s-%s-%s' % (fmt(dx), fmt(dy), color[1:], fmt(opacity))
+        key = key.replace('.', '_')
+        if key not in self.defs:
+            self.defs[key] = (
+                u'<filter id="%s" x="-20%%" y="-20%%" width="140%%" height="140%%">'
+                u'<feGaussianBlur in="SourceAlpha" stdDeviation="1.5"/>'
+                u'<feOffset dx="%s" dy="%s" result="blur"/>'
+                u'<feFlood flood-color="%s" flood-opacity="%s"/><feComposite in2="blur" operator="in"/>'
+                u'<feMerge><feMergeNode/><feMergeNode in="SourceGraphic"/></feMerge></filter>\n' % (
+                    key, fmt(dx), fmt(dy), color, fmt(opacity)))
+        return u' filter="url(#%s)"' % key
+
+    def shape_element(self, shape, x, y, w, h, style, graphic):
+        """The SVG element for the outline of shape."""
+        if shape == 'Circle':
+            return u'<ellipse cx="%s" cy="%s" rx="%s" ry="%s"%s/>\n' % (
+                fmt(x + w / 2), fmt(y + h / 2), fmt(w / 2), fmt(h / 2), style)
+        points = None
+        if shape == 'Diamond':
+            points = [(x + w / 2, y), (x + w, y + h / 2), (x + w / 2, y + h), (x, y + h / 2)]
+        elif shape == 'HorizontalTriangle':
+            points = [(x, y), (x + w, y + h / 2), (x, y + h)]
+            if yes(graphic.get('HFlip'), False):
+                points = [(x + w, y), (x, y + h / 2), (x + w, y + h)]
+        elif shape == 'VerticalTriangle':
+            points = [(x, y), (x + w, y), (x + w / 2, y + h)]
+            if yes(graphic.get('VFlip'), False):
+                points = [(x, y + h), (x + w, y + h), (x + w / 2, y)]
+        if points is not None:
+            return u'<polygon points="%s"%s/>\n' % (
+                u' '.join(u'%s,%s' % (fmt(px), fmt(py)) for px, py in points), style)
+        radius = float(graphic.get('Style', {}).get('stroke', {}).get('CornerRadius', 0))
+        if shape == 'RoundRect' and not radius:
+            radius = min(w, h) / 4
+        corners = u''
+        if radius:
+            radius = min(radius, w / 2, h / 2)
+            corners = u' rx="%s" ry="%s"' % (fmt(radius), fmt(radius))
+        return u'<rect x="%s" y="%s" width="%s" height="%s"%s%s/>\n' % (
+            fmt(x), fmt(y), fmt(w), fmt(h), corners, style)
+
+    def shape(self, graphic, out):
+        x, y, w, h = (numbers(graphic['Bounds']) + [0, 0, 0, 0])[:4]
+        style = graphic.get('Style', {})
+        stroke, stroke_width = self.stroke_attributes(style.get('stroke'))
+        fill = self.fill_attributes(style.get('fill'))
+        image = self.image_element(graphic, x, y, w, h)
+        parts = []
+        if image:
+            parts.append(image)
+        if fill or stroke_width:
+            parts.append(self.shape_element(graphic.get('Shape', 'Rectangle'), x, y, w, h,
+                                            (fill or u' fill="none"') + stroke, graphic))
+        parts.extend(self.text_elements(graphic, x, y, w, h))
+        if not parts:
+            return
+        attrs = self.shadow_attribute(style.get('shadow')) if (fill or stroke_width or image) else u''
+        rotation = float(graphic.get('Rotation', 0) or 0)
+        if rotation:
+            attrs += u' transform="rotate(%s %s %s)"' % (fmt(rotation), fmt(x + w / 2), fmt(y + h / 2))
+            self.add_rotated_bounds(x, y, w, h, rotation, stroke_width / 2)
+        else:
+            self.bounds.add(x - stroke_width / 2, y - stroke_width / 2,
+                            x + w + stroke_width / 2, y + h + stroke_width / 2)
+        out.append(u'<g data-id="%s"%s>\n%s</g>\n' % (graphic.get('ID'), attrs, u''.join(parts)))
+
+    def add_rotated_bounds(self, x, y, w, h, degrees, margin):
+        angle = math.radians(degrees)
+        cx, cy = x + w / 2, y + h / 2
+        xs, ys = [], []
+        for px, py in ((x, y), (x + w, y), (x + w, y + h), (x, y + h)):
+            xs.append(cx + (px - cx) * math.cos(angle) - (py - cy) * math.sin(angle))
+            ys.append(cy + (px - cx) * math.sin(angle) + (py - cy) * math.cos(angle))
+        self.bounds.add(min(xs) - margin, min(ys) - margin, max(xs) + margin, max(ys) + margin)
+
+    def image_element(self, graphic, x, y, w, h):
+        data = self.images.get(graphic.get('ImageID'))
+        mime = image_type(data) if data else None
+        if mime is None:
+            return u''
+        encoded = base64.b64encode(data).decode('ascii')
+        return u'<image x="%s" y="%s" width="%s" height="%s" preserveAspectRatio="none" ' \
+               u'xlink:href="data:%s;base64,%s"/>\n' % (fmt(x), fmt(y), fmt(w), fmt(h), mime, encoded)
+
+    # lines
+
+    def marker(self, kind, color, end):
+        """The id of the marker for an arrow head of kind (e.g. 'FilledArrow')."""
+        if not kind or kind in ('0', 0, 'None'):
+            return None
+        filled = kind.startswith('Filled')
+        base = kind[len('Filled'):] if kind.startswith('Filled') else kind
+        if base not in ('Arrow', 'Ball', 'Diamond', 'Bar'):
+            base, filled = 'Arrow', True
+        key = 'marker-%s%s-%s-%s' % ('filled-' if filled else '', base.lower(), color[1:], 'end' if end else 'start')
+        if key not in self.defs:
+            paint = (u'fill="%s" stroke="none"' % color if filled
+                     else u'fill="none" stroke="%s" stroke-width="1"' % color)
+            if base == 'Ball':
+                shape = u'<circle cx="5" cy="5" r="4" %s/>' % paint
+            elif base == 'Diamond':
+                shape = u'<polygon points="0,5 5,1 10,5 5,9" %s/>' % paint
+            elif base == 'Bar':
+                shape = u'<line x1="9" y1="0" x2="9" y2="10" stroke="%s" stroke-width="1.5"/>' % color
+            elif filled:
+                shape = u'<polygon points="0,1 10,5 0,9" %s/>' % paint
+            else:
+                shape = u'<polyline points="0,1 10,5 0,9" %s/>' % paint
+            self.defs[key] = (
+                u'<marker id="%s" viewBox="0 0 10 10" refX="%s" refY="5" markerWidth="5" markerHeight="5" '
+                u'markerUnits="strokeWidth" orient="%s">%s</marker>\n' % (
+                    key, '10' if base in ('Arrow', 'Bar') else '5', 'auto' if end else 'auto-start-reverse', shape))
+        return key
+
+    def line(self, graphic, out):
+        points = [numbers(p)[:2] for p in graphic.get('Points') or []]
+        points = [p for p in points if len(p) == 2]
+        if len(points) < 2:
+            return
+        style = graphic.get('Style', {})
+        stroke = style.get('stroke') or {}
+        attrs, width = self.stroke_attributes(stroke)
+        if not width:
+            return
+        if int(stroke.get('LineType', 0) or 0) == 1 and len(points) % 3 == 1 and len(points) > 3:
+            # curved: end points with bezier control points in between
+            path = u'M%s,%s' % (fmt(points[0][0]), fmt(points[0][1]))
+            for idx in range(1, len(points), 3):
+                path += u' C%s' % u' '.join(u'%s,%s' % (fmt(px), fmt(py)) for px, py in points[idx:idx + 3])
+        else:
+            path = u'M' + u' L'.join(u'%s,%s' % (fmt(px), fmt(py)) for px, py in points)
+        color = svg_color(stroke.get('Color'), svg_color(DEFAULT_STROKE))[0]
+        for key, end, attribute in (('HeadArrow', True, 'marker-end'), ('TailArrow', False, 'marker-start')):
+            marker = self.marker(stroke.get(key), color, end)
+            if marker:
+                attrs += u' %s="url(#%s)"' % (attribute, marker)
+        margin = width * 3  # room for arrow heads
+        for px, py in points:
+            self.bounds.add(px - margin, py - margin, px + margin, py + margin)
+        out.append(u'<path data-id="%s" d="%s" fill="none"%s%s/>\n' % (
+            graphic.get('ID'), path, attrs, self.shadow_attribute(style.get('shadow'))))
+
+    # text
+
+    def text_lines(self, graphic):
+        """The lines of the text of graphic as list of [(text, style)], style is a dict."""
+        text = graphic.get('Text')
+        if not isinstance(text, dict) or not text.get('Text'):
+            return []
+        rich = RichText(text['Text'])
+        font_info = graphic.get('FontInfo') or {}
+        default_color = svg_color(font_info.get('Color'), svg_color(DEFAULT_STROKE))
+        lines = [[]]
+        for run in rich.runs:
+            rgb = rich.color(run)
+            style = dict(font=rich.font_name(run) or font_info.get('Font', 'Helvetica'),
+                         size=run.size / 2.0, bold=run.bold, italic=run.italic, underline=run.underline,
+                         color=('#%02x%02x%02x' % rgb, 1.0) if rgb else default_color)
+            for idx, part in enumerate(re.split(u'[\n\u2028]', run.text)):
+                if idx:
+                    lines.append([])
+                if part:
+                    lines[-1].append((part, style))
+        while lines and not lines[-1]:
+            lines.pop()
+        return lines
+
+    @staticmethod
+    def text_width(text, style):
+        font = style['font'].lower()
+        factor = MONOSPACE_CHAR_WIDTH if 'courier' in font or 'mono' in font else CHAR_WIDTH
+        return len(text) * style['size'] * factor
+
+    def wrap(self, lines, width):
+        """Break lines that are wider than width at spaces."""
+        result = []
+        for line in lines:
+            current, current_width = [], 0.0
+            for text, style in line:
+                for word in re.findall(u'\\S+\\s*|\\s+', text):
+                    word_width = self.text_width(word, style)
+                    if current and current_width + self.text_width(word.rstrip(), style) > width:
+                        result.append(current)
+                        current, current_width = [], 0.0
+                        word = word.lstrip()
+                        if not word:
+                            continue
+                        word_width = self.text_width(word, style)
+                    if current and current[-1][1] is style:
+                        current[-1] = (current[-1][0] + word, style)
+                    else:
+                        current.append((word, style))
+                    current_width += word_width
+            result.append(current)
+        return result
+
+    def text_elements(self, graphic, x, y, w, h):
+        lines = self.text_lines(graphic)
+        if not lines:
+            return []
+        text = graphic['Text']
+        pad = float(text.get('Pad', DEFAULT_PAD))
+        vertical_pad = float(text.get('VerticalPad', DEFAULT_PAD))
+        if yes(graphic.get('Wrap')):
+            lines = self.wrap(lines, max(w - 2 * pad, 1))
+        default_size = float((graphic.get('FontInfo') or {}).get('Size', 12))
+        heights = [LINE_HEIGHT * max([style['size'] for t, style in line] or [default_size]) for line in lines]
+
+        match = ALIGNMENT.findall(text['Text'])
+        anchor = ALIGN_KEYWORDS[match[-1]] if match else ALIGN_VALUES.get(text.get('Align', 1), 'middle')
+        tx = {'start': x + pad, 'middle': x + w / 2, 'end': x + w - pad}[anchor]
+        placement = graphic.get('TextPlacement', 1)
+        if placement == 0:
+            top = y + vertical_pad
+        elif placement == 2:
+            top = y + h - vertical_pad - sum(heights)
+        else:
+            top = y + (h - sum(heights)) / 2
+
+        result = []
+        for line, height in zip(lines, heights):
+            baseline = top + height * 0.8
+            top += height
+            if not line:
+                continue
+            spans = []
+            for part, style in line:
+                attrs = u' font-family=%s font-size="%s" fill="%s"' % (
+                    quoteattr(style['font']), fmt(style['size']), style['color'][0])
+                if style['color'][1] < 1:
+                    attrs += u' fill-opacity="%s"' % fmt(style['color'][1])
+                if style['bold'] or 'bold' in style['font'].lower():
+                    attrs += u' font-weight="bold"'
+                if style['italic'] or 'italic' in style['font'].lower() or 'oblique' in style['font'].lower():
+                    attrs += u' font-style="italic"'
+                if style['underline']:
+                    attrs += u' text-decoration="underline"'
+                spans.append(u'<tspan%s>%s</tspan>' % (attrs, escape(part)))
+            result.append(u'<text x="%s" y="%s" text-anchor="%s" xml:space="preserve">%s</text>\n' % (
+                fmt(tx), fmt(baseline), anchor, u''.join(spans)))
+        return result
+
+
+class SVGDocument(object):
+    """The canvases of a .graffle file (or package), ready to be rendered."""
+
+    def __init__(self, path, data=None):
+        self.path = os.path.abspath(path)
+        if data is None:
+            data, dummy = graffle_file.read_plist(self.path)
+        self.data = data
+        self.sheets = OrderedDict()
+        for sheet in data.get('Sheets', [data]):
+            self.sheets.setdefault(sheet.get('SheetTitle', ''), sheet)
+        self.masters = dict((m.get('SheetTitle'), m) for m in data.get('MasterSheets') or [])
+
+    def canvases(self):
+        return list(self.sheets)
+
+    def images(self, ids):
+        """The data of the images with the ids (embedded in the plist or stored in the package)."""
+        embedded = dict((image.get('ID'), image) for image in self.data.get('Images') or [])
+        result = {}
+        for image_id in ids:
+            if 'RawData' in embedded.get(image_id, {}):
+                result[image_id] = graffle_file.plist_data(embedded[image_id]['RawData'])
+            elif os.path.isdir(self.path):
+                for fname in sorted(glob.glob(os.path.join(self.path, 'image%s.*' % image_id))):
+                    with open(fname, 'rb') as fp:
+                        result[image_id] = fp.read()
+                    break
+        return result
+
+    def task(self, canvas, **options):
+        """Everything needed to render canvas (small enough to send it to another process)."""
+        sheet = self.sheets[canvas]
+        master = self.masters.get(sheet.get('MasterSheet'))
+        ids = fingerprint.image_ids(sheet.get('GraphicsList'))
+        if master is not None:
+            fingerprint.image_ids(master.get('GraphicsList'), ids)
+        return dict(sheet=sheet, master=master, images=self.images(ids), options=options)
+
+    def render(self, canvas, **options):
+        """Return the SVG of canvas (text)."""
+        return render_task(self.task(canvas, **options))
+
+
+def render_task(task):
+    task = dict(task)
+    options = task.pop('options', {})
+    return CanvasRenderer(task['sheet'], task['master'], task['images'], **options).render()
+
+
+def _render_to_file(args):
+    task, output = args
+    svg = render_task(task)
+    directory = os.path.dirname(os.path.abspath(output))
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    with io.open(output, 'w', encoding='utf-8') as fp:
+        fp.write(svg)
+    return output
+
+
+def render_canvases(path, outputs, processes=None, **options):
+    """
+    Render canvases of the .graffle file path to SVG files, outputs maps canvas names to
+    file names. The document is read once, the canvases are rendered in a pool of processes
+    if there are several. options are passed to CanvasRenderer (e.g. scale=2.0).
+    """
+    document = SVGDocument(path)
+    missing = [name for name in outputs if name not in document.sheets]
+    if missing:
+        raise KeyError("canvas '%s' not found in %s" % ("', '".join(missing), path))
+    tasks = [(document.task(name, **options), output) for name, output in outputs.items()]
+    processes = min(len(tasks), processes or multiprocessing.cpu_count())
+    if processes < 2:
+        return [_render_to_file(task) for task in tasks]
+    pool = multiprocessing.Pool(processes)
+    try:
+        return pool.map(_render_to_file, tasks)
+    finally:
+        pool.close()
+        pool.join()
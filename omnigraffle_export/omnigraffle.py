@@ -1,7 +1,16 @@
+from __future__ import absolute_import
+
 import logging
 import os
 
-from appscript import *
+from omnigraffle import backend
+from omnigraffle import data_model
+from omnigraffle import fingerprint
+from omnigraffle import output_cache
+from omnigraffle import pdf
+from omnigraffle.output_cache import OutputCache, detach
+from omnigraffle.pipeline import Pipeline
+
 
 class OmniGraffleSchema(object):
     """ A class that encapsulates an OmniGraffle schema file"""
@@ -22,24 +31,20 @@ class OmniGraffleSchema(object):
     # attribute header in PDF document that contains the checksum
     PDF_CHECKSUM_ATTRIBUTE = 'OmnigraffleExportChecksum: '
 
-    def __init__(self, og, doc):
+    def __init__(self, backend, doc):
 
-        self.og = og
+        self.backend = backend
+        self.og = backend.app
         self.doc = doc
         self.path = doc.path()
+        self._fingerprints = None
+        self._settings = None
 
     def sandboxed(self):
-        # real check using '/usr/bin/codesign --display --entitlements - /Applications/OmniGraffle.app'
-        return self.og.version()[0] >= '6'
+        return self.backend.sandboxed()
 
     def get_sandbox_path(self):
-        version = self.og.version()[0]
-        path = os.path.expanduser(OmniGraffle.SANDBOXED_DIR % version)
-
-        if not os.path.exists(path):
-            raise RuntimeError('OmniGraffle is sandboxed but missing sandbox path: %s' % path)
-
-        return path
+        return self.backend.sandbox_path()
 
     def get_canvas_list(self):
         """
@@ -48,6 +53,53 @@ class OmniGraffleSchema(object):
 
         return [c.name() for c in self.doc.canvases()]
 
+    def export_fingerprint(self, canvasname, format='pdf'):
+        """
+        Fingerprint of canvasname exported as format, computed from the saved .graffle file
+        without OmniGraffle (see omnigraffle.fingerprint). None if the canvas is not in the file,
+        or if OmniGraffle would export something else than the file: a document with unsaved
+        changes (e.g. the active document) or a document that was never saved.
+        """
+        if self._fingerprints is None:
+            if self._unsaved():
+                logging.debug('%s has unsaved changes, canvases are always exported' % self.path)
+                self._fingerprints = {}
+            else:
+                try:
+                    self._fingerprints = fingerprint.canvas_fingerprints(self.path)
+                except (IOError, OSError, ValueError) as e:
+                    logging.debug('cannot compute fingerprints of %s: %s' % (self.path, e))
+                    self._fingerprints = {}
+        if canvasname not in self._fingerprints:
+            return None
+        return fingerprint.combine(format, self._fingerprints[canvasname])
+
+    def _unsaved(self):
+        """True if the open document differs from the file at self.path."""
+        if not self.path:
+            return True
+        try:
+            return bool(self.doc.modified())
+        except data_model.CommandError as e:
+            logging.debug('cannot tell if %s is modified: %s' % (self.path, e))
+            return True
+
+    # export settings that change the exported file, read once for the cache key
+    CACHE_SETTINGS = ('border_amount', 'draws_background', 'export_scale', 'include_border', 'resolution')
+
+    def cache_key(self, canvasname, format='pdf'):
+        """
+        Key of canvasname exported as format in an OutputCache: the export fingerprint, the
+        version of OmniGraffle and its export settings. None if there is no fingerprint.
+        """
+        chksum = self.export_fingerprint(canvasname, format)
+        if chksum is None:
+            return None
+        if self._settings is None:
+            settings = backend.ExportSettings(self.backend)
+            self._settings = dict((name, settings.get(name)) for name in self.CACHE_SETTINGS)
+        return OutputCache.key('omnigraffle-export', self.backend.version(), self._settings, chksum)
+
     def export(self, canvasname, fname, format='pdf'):
         """
         Exports one canvas named `canvasname into `fname` using `format` format.
@@ -56,7 +108,7 @@ class OmniGraffleSchema(object):
         # canvas name
         assert canvasname and len(canvasname) > 0, 'canvasname is missing'
 
-        self.og.current_export_settings.area_type.set(k.all_graphics)
+        self.og.current_export_settings.area_type.set(self.backend.keyword('all_graphics'))
 
         # format
         if format not in OmniGraffleSchema.EXPORT_FORMATS:
@@ -108,20 +160,10 @@ class OmniGraffleSchema(object):
 
 class OmniGraffle(object):
 
-    SANDBOXED_DIR = '~/Library/Containers/com.omnigroup.OmniGraffle%s/Data/'
-
-    def __init__(self):
+    def __init__(self, backend_name=None, **options):
         names = ['OmniGraffle 5.app', 'OmniGraffle Professional 5.app', 'OmniGraffle']
-        self.og = None
-        for name in names:
-            try:
-                self.og = app(name)
-                break
-            except (ApplicationNotFoundError):
-                continue
-
-        if self.og == None:
-            raise RuntimeError('Unable to connect to OmniGraffle (%s)' % ', '.join(names))
+        self.backend = backend.connect(backend_name, names=names, **options)
+        self.og = self.backend.app
 
     def active_document(self):
         self.og.activate()
@@ -139,7 +181,7 @@ class OmniGraffle(object):
             fname = "Untitled"
         logging.debug('Active OmniGraffle file: ' + fname)
 
-        return OmniGraffleSchema(self.og, doc)
+        return OmniGraffleSchema(self.backend, doc)
 
     def open(self, fname):
         fname = os.path.abspath(fname)
@@ -147,21 +189,8 @@ class OmniGraffle(object):
                 not os.path.isfile(os.path.join(fname, "data.plist")):
             raise ValueError('File: %s does not exists' % fname)
 
-        fname = os.path.abspath(fname)
-        self.og.activate()
-
-        # adhoc fix for https://github.com/fikovnik/omnigraffle-export/issues/23
-        # apparently the process is sandboxed and cannot access the file
-        # 16/03/2015 13:01:54.000 kernel[0]: Sandbox: OmniGraffle(66840) deny file-read-data test.graffle
-        # therefore we first try to open it manually
-        
-        import subprocess
-        subprocess.call(['open',fname])
-
-        window = self.og.windows.first()
-        # doc = window.document()
-        doc = self.og.open(fname)
+        doc = self.backend.open(fname)
 
         logging.debug('Opened OmniGraffle file: ' + fname)
 
-        return OmniGraffleSchema(self.og, doc)
+        return OmniGraffleSchema(self.backend, doc)
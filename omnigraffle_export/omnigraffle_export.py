@@ -1,17 +1,12 @@
 #!/usr/bin/env python
 
-import hashlib
 import optparse
 import sys
-import tempfile
-
-from Foundation import NSURL, NSMutableDictionary
-from Quartz import PDFKit
 
 from omnigraffle import *
 
 
-def export(source, target, canvasname=None, format='pdf', debug=False, force=False):
+def export(source, target, canvasname=None, format='pdf', debug=False, force=False, cache=None):
     # logging
     if debug:
         logging.basicConfig(level=logging.DEBUG)
@@ -55,6 +50,19 @@ def export(source, target, canvasname=None, format='pdf', debug=False, force=Fal
     og = OmniGraffle()
     schema = og.open(source)
 
+    # exports are serial, stamping fingerprints runs in the background
+    pipeline = Pipeline()
+    try:
+        _export(schema, target, export_all, canvasname, format, force, pipeline, cache)
+    finally:
+        errors = pipeline.close()
+    for output, error in errors:
+        print >> sys.stderr, "%s: %s" % (output, error)
+    if errors:
+        sys.exit(1)
+
+
+def _export(schema, target, export_all, canvasname, format, force, pipeline, cache=None):
     if export_all:
         namemap = lambda c, f: '%s.%s' % (c, f) if f else c
 
@@ -66,91 +74,95 @@ def export(source, target, canvasname=None, format='pdf', debug=False, force=Fal
                                       namemap(canvas_file, format))
             logging.debug("Exporting `%s' into `%s' as %s" %
                           (c, targetfile, format))
-            export_one(schema, targetfile, c, format, force)
+            export_one(schema, targetfile, c, format, force, pipeline, cache)
     else:
-        export_one(schema, target, canvasname, format, force)
-
-
-def export_one(schema, filename, canvasname, format='pdf', force=False):
-    def _checksum(filepath):
-        assert os.path.isfile(filepath), '%s is not a file' % filepath
-
-        c = hashlib.md5()
-        with open(filepath, 'rb') as f:
-            for chunk in iter(lambda: f.read(128), ''):
-                c.update(chunk)
-
-        return c.hexdigest()
-
-    def _checksum_pdf(filepath):
-        assert os.path.isfile(filepath), '%s is not a file' % filepath
-
-        url = NSURL.fileURLWithPath_(filepath)
-        pdfdoc = PDFKit.PDFDocument.alloc().initWithURL_(url)
-
-        assert pdfdoc != None
-
-        chsum = None
-        attrs = pdfdoc.documentAttributes()
-        if PDFKit.PDFDocumentSubjectAttribute in attrs:
-            chksum = pdfdoc.documentAttributes()[PDFKit.PDFDocumentSubjectAttribute]
-        else:
+        export_one(schema, target, canvasname, format, force, pipeline, cache)
+
+
+def export_one(schema, filename, canvasname, format='pdf', force=False, pipeline=None, cache=None):
+    """
+    Export the canvas canvasname to filename, unless it was already exported with the
+    same fingerprint (see OmniGraffleSchema.export_fingerprint). Return True if exported.
+    The fingerprint is stored in the background if a pipeline is given. With a cache
+    (an OutputCache), files are taken from the cache if possible, and added to it.
+    """
+    def _sidecar(filepath):
+        directory, fname = os.path.split(filepath)
+        return os.path.join(directory, '.%s.fingerprint' % fname)
+
+    def _write_sidecar(fingerprint):
+        with open(_sidecar(filename), 'w') as f:
+            f.write(fingerprint + '\n')
+
+    def _stored_fingerprint_pdf(filepath):
+        # only the trailer and the Info dictionary are read
+        try:
+            chksum = pdf.read_info(filepath).get('Subject', '')
+        except (IOError, pdf.PDFError) as e:
+            logging.debug('cannot read fingerprint of %s: %s' % (filepath, e))
             return None
-
         if not chksum.startswith(OmniGraffleSchema.PDF_CHECKSUM_ATTRIBUTE):
             return None
-        else:
-            return chksum[len(OmniGraffleSchema.PDF_CHECKSUM_ATTRIBUTE):]
-
-    def _compute_canvas_checksum(canvasname):
-        tmpfile = tempfile.mkstemp(suffix='.png')[1]
-        os.unlink(tmpfile)
-
-        export_one(schema, tmpfile, canvasname, 'png')
+        return chksum[len(OmniGraffleSchema.PDF_CHECKSUM_ATTRIBUTE):]
 
+    def _read_sidecar(filepath):
         try:
-            chksum = _checksum(tmpfile)
-            return chksum
-        finally:
-            os.unlink(tmpfile)
-
-    # checksum
-    chksum = None
-    if os.path.isfile(filename) and not force:
-        existing_chksum = _checksum(filename) if format != 'pdf' \
-            else _checksum_pdf(filename)
+            with open(_sidecar(filepath)) as f:
+                return f.read().strip()
+        except IOError:
+            return None
 
-        new_chksum = _compute_canvas_checksum(canvasname)
+    def _stored_fingerprint(filepath):
+        if format == 'pdf':
+            # PDFs that cannot be stamped (e.g. with cross-reference streams) have a sidecar file
+            return _stored_fingerprint_pdf(filepath) or _read_sidecar(filepath)
+        return _read_sidecar(filepath)
 
-        if existing_chksum == new_chksum and existing_chksum != None:
+    chksum = schema.export_fingerprint(canvasname, format)
+    if os.path.isfile(filename) and not force and chksum is not None:
+        if _stored_fingerprint(filename) == chksum:
             logging.debug(
                 'Not exporting `%s` into `%s` as `%s` - canvas has not been changed' % (canvasname, filename, format))
             return False
-        else:
-            chksum = new_chksum
 
-    elif format == 'pdf':
-        chksum = _compute_canvas_checksum(canvasname)
+    key = schema.cache_key(canvasname, format) if cache is not None else None
+    if key is not None and not force and cache.get(key, filename):
+        # cached PDFs contain the fingerprint, unless they could not be stamped
+        if format != 'pdf' or _stored_fingerprint_pdf(filename) != chksum:
+            _write_sidecar(chksum)
+        logging.debug('Copied `%s` into `%s` from cache' % (canvasname, filename))
+        return True
 
+    detach(filename)  # never write to a file linked to the cache
     try:
         schema.export(canvasname, filename, format=format)
     except RuntimeError as e:
         print >> sys.stderr, e.message
         return False
 
-    # update checksum
-    if format == 'pdf':
-        # save the checksum
-        url = NSURL.fileURLWithPath_(filename)
-        pdfdoc = PDFKit.PDFDocument.alloc().initWithURL_(url)
-        attrs = NSMutableDictionary.alloc().initWithDictionary_(pdfdoc.documentAttributes())
-
-        attrs[PDFKit.PDFDocumentSubjectAttribute] = \
-            '%s%s' % (OmniGraffleSchema.PDF_CHECKSUM_ATTRIBUTE, chksum)
-
-        pdfdoc.setDocumentAttributes_(attrs)
-        pdfdoc.writeToFile_(filename)
+    if chksum is None:
+        return True
+
+    def _store_fingerprint():
+        if format == 'pdf':
+            # appends an incremental update with the Subject, the PDF is not rewritten
+            try:
+                pdf.stamp_info(filename, dict(Subject=u'%s%s' % (OmniGraffleSchema.PDF_CHECKSUM_ATTRIBUTE, chksum)))
+            except pdf.PDFError as e:
+                logging.info('cannot store fingerprint in %s (%s), using %s' % (filename, e, _sidecar(filename)))
+                _write_sidecar(chksum)
+            else:
+                if os.path.exists(_sidecar(filename)):
+                    os.unlink(_sidecar(filename))  # of an older export
+        else:
+            _write_sidecar(chksum)
+        if key is not None:
+            cache.put(key, filename)
 
+    if pipeline is None:
+        _store_fingerprint()
+    else:
+        pipeline.submit(filename, _store_fingerprint)
     return True
 
 
@@ -169,6 +181,11 @@ def main():
                       metavar='FMT', dest='format')
     parser.add_option('--force', action='store_true', help='force the export',
                       dest='force')
+    parser.add_option('--cache', action='store_true',
+                      help='get exported files from the output cache if possible, '
+                           'and add new files to it', dest='cache')
+    parser.add_option('--cache-dir', help='the output cache directory (default: %default)',
+                      metavar='DIR', dest='cache_dir', default=output_cache.DEFAULT_DIRECTORY)
     parser.add_option('--debug', action='store_true', help='debug',
                       dest='debug')
 
@@ -180,8 +197,9 @@ def main():
 
     (source, target) = args
 
+    cache = OutputCache(options.cache_dir) if options.cache else None
     export(source, target, options.canvasname, options.format,
-           options.debug, options.force)
+           options.debug, options.force, cache)
 
 
 if __name__ == '__main__':
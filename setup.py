@@ -10,7 +10,8 @@ setup(
     name="ogtool",
     version="0.5.2",
     packages=find_packages(exclude='tests'),
-    install_requires=['appscript', 'pyobjc', 'polib', 'pyyaml'],
+    install_requires=['appscript; sys_platform == "darwin"', 'polib', 'pyyaml'],
+    extras_require={'resolutions': ['pillow']},
     author="Bernhard Bockelbrink, Filip Krikava (export code)",
     author_email="bernhard.bockelbrink@gmail.com",
     description="A set of commandline tools for OmniGraffle 6+, for export, translation, replacement of fonts and colors etc. Comes with a plugin API to that allows for simple manipulation of items in OmniGraffle documents.",
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from omnigraffle import backend
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def fixture(name):
+    return os.path.join(TEST_DIR, name)
+
+
+class SimulatedBackendTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.backend = backend.connect('simulated')
+
+    def test_connect(self):
+        self.assertTrue(isinstance(self.backend, backend.SimulatedBackend))
+        self.assertRaises(RuntimeError, backend.connect, 'nonexisting')
+
+    def test_connect_from_environment(self):
+        os.environ[backend.BACKEND_VARIABLE] = 'simulated'
+        self.addCleanup(os.environ.pop, backend.BACKEND_VARIABLE)
+        self.assertTrue(isinstance(backend.connect(), backend.SimulatedBackend))
+
+    def test_open(self):
+        doc = self.backend.open(fixture('minimal.graffle'))
+        self.assertEqual(['canvas-1', 'canvas-2'], [c.name() for c in doc.canvases()])
+        self.assertEqual('minimal.graffle', self.backend.app.windows.first().document().name())
+
+    def test_export_settings(self):
+        settings = self.backend.export_settings
+        settings.resolution.set(2.0)
+        settings.area_type.set(self.backend.keyword('entire_document'))
+        self.assertEqual(2.0, settings.resolution())
+        self.assertEqual('entire_document', settings.area_type())
+
+    def test_export_current_canvas(self):
+        doc = self.backend.open(fixture('minimal.graffle'))
+        window = self.backend.front_window()
+        window.canvas.set(doc.canvases()[1])
+        target = os.path.join(self.tmp_dir, 'canvas.png')
+        doc.save(as_='png', in_=target)
+        with open(target) as fp:
+            content = fp.read()
+        self.assertTrue(content.startswith('simulated png export'))
+        self.assertTrue('canvas: canvas-2 ' in content)
+
+    def test_export_entire_document(self):
+        doc = self.backend.open(fixture('minimal.graffle'))
+        self.backend.export_settings.area_type.set(self.backend.keyword('entire_document'))
+        target = os.path.join(self.tmp_dir, 'minimal')
+        doc.save(as_='png', in_=target)
+        self.assertEqual(['canvas-1.png', 'canvas-2.png'], sorted(os.listdir(target)))
+
+    def test_events(self):
+        doc = self.backend.open(fixture('minimal.graffle'))
+        self.assertEqual(1, self.backend.events)
+        doc.canvases()[0].name()
+        self.assertEqual(3, self.backend.events)
+
+    def test_version_is_cached(self):
+        self.assertEqual('7.0', self.backend.version())
+        self.assertEqual('7.0', self.backend.version())
+        self.assertEqual(1, self.backend.events)
+
+
+class ExportSettingsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = backend.connect('simulated')
+        self.settings = backend.ExportSettings(self.backend)
+
+    def test_only_changes_are_sent(self):
+        self.settings.set('resolution', 1.0)  # read, unchanged
+        self.assertEqual(1, self.backend.events)
+        self.settings.set('resolution', 2.0)
+        self.settings.set('resolution', 2.0)
+        self.assertEqual(2, self.backend.events)
+        self.assertEqual(2.0, self.backend.export_settings.resolution())
+
+    def test_restore_changed_settings(self):
+        self.settings.set('area_type', 'entire_document')
+        self.settings.get('export_scale')
+        events = self.backend.events
+        self.settings.restore()
+        self.assertEqual(events + 1, self.backend.events)
+        self.assertEqual('current_canvas', self.backend.export_settings.area_type())
+
+    def test_apply(self):
+        self.settings.set('resolution', 2.0)
+        self.settings.set('area_type', 'entire_document')
+        self.settings.apply(dict(draws_background=False), keep=('area_type',))
+        values = self.backend.application.settings.values
+        self.assertEqual((1.0, False, 'entire_document'),
+                         (values['resolution'], values['draws_background'], values['area_type']))
+
+
+if __name__ == '__main__':
+    unittest.main()
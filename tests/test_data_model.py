@@ -0,0 +1,354 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from omnigraffle import backend
+from omnigraffle import data_model
+from omnigraffle import graffle_file
+from omnigraffle.data_model import (Canvas, CollectionSchema, Document, Item, Layer, Line, Scope, Shape,
+                                    TextContainer, WalkStats)
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def fixture(name):
+    return os.path.join(TEST_DIR, name)
+
+
+def collect(result, element):
+    if isinstance(element, TextContainer) and element.text:
+        result.append((element.id, element.text, element.text_font, element.text_size))
+
+
+class WalkTests(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = backend.connect('simulated')
+        self.doc = self.backend.open(fixture('minimal.graffle'))
+
+    def test_prefetched_properties(self):
+        result = []
+        Document(self.doc).walk(lambda e: collect(result, e))
+        self.assertTrue((202, 'box', 'OpenSans', 36.0) in result)
+
+    def test_properties_are_fetched_once(self):
+        item = Item(self.doc.canvases()[0])
+        item.prefetch()
+        events = self.backend.events
+        self.assertEqual('canvas-1', item.name)
+        self.assertEqual('canvas', item.class_)
+        self.assertEqual('', item.text)  # canvases have no text
+        self.assertEqual(events, self.backend.events)
+
+    def test_setter_invalidates_snapshot(self):
+        item = Item(self.doc.canvases()[0])
+        item.prefetch()
+        item.name = 'renamed'
+        self.assertEqual('renamed', item.name)
+
+    def test_callbacks_reading_properties_cost_no_events(self):
+        Document(self.doc).walk(lambda e: None, schema=CollectionSchema())
+        events = self.backend.events
+
+        simulated = backend.connect('simulated')
+        doc = simulated.open(fixture('minimal.graffle'))
+        Document(doc).walk(lambda e: (e.id, e.class_, e.name, e.text, e.info), schema=CollectionSchema())
+        self.assertEqual(events, simulated.events)
+
+
+class IterItemsTests(unittest.TestCase):
+
+    def _open(self, name='translation-test.graffle'):
+        self.backend = backend.connect('simulated')
+        return Document(self.backend.open(fixture(name)))
+
+    def test_same_items_as_walk(self):
+        walked = []
+        self._open().walk(lambda e: walked.append((type(e), e.id)), schema=CollectionSchema())
+        iterated = [(type(e), e.id) for e in self._open().iter_items(schema=CollectionSchema())]
+        self.assertEqual(walked, iterated)
+
+    def test_classes_and_where(self):
+        doc = self._open('minimal.graffle')
+        texts = [e.text for e in doc.iter_items(classes=(Shape,), where=lambda e: e.text.startswith('b'))]
+        self.assertEqual(['box', 'bo'], texts)
+        self.assertTrue(all(isinstance(e, Line) for e in self._open('minimal.graffle').iter_items([Line])))
+
+    def test_does_not_descend_below_wanted_classes(self):
+        doc = self._open()
+        names = [c.name for c in doc.iter_items(classes=(Canvas,))]
+        self.assertEqual(3, len(names))
+        canvas_events = self.backend.events
+
+        self._open().walk(lambda e: None)
+        self.assertTrue(canvas_events * 10 < self.backend.events)
+
+    def test_canvases_and_layers(self):
+        doc = self._open('minimal.graffle')
+        layers = [(l.canvas_name, l.name) for l in doc.iter_items([Layer], canvases=['canvas-2'])]
+        self.assertTrue(layers)
+        self.assertEqual(set(['canvas-2']), set(c for c, _ in layers))
+        texts = [e.text for e in self._open('minimal.graffle').iter_items(layers=['shared layer']) if e.text]
+        self.assertEqual(['text on a shared layer'], sorted(set(texts)))
+
+    def test_stop_early(self):
+        doc = self._open()
+        first = next(doc.iter_items(classes=(Shape,)))
+        self.assertTrue(isinstance(first, Shape))
+        first_events = self.backend.events
+
+        list(self._open().iter_items(classes=(Shape,)))
+        self.assertTrue(first_events < self.backend.events)
+
+
+class ScopeTests(unittest.TestCase):
+
+    def _walk(self, scope):
+        self.backend = backend.connect('simulated')
+        doc = Document(self.backend.open(fixture('minimal.graffle')))
+        result = []
+        doc.walk(lambda e: result.append(e), scope=scope)
+        return result
+
+    def test_canvas_glob(self):
+        canvases = set(e.canvas_name for e in self._walk(Scope(canvases=['*-2'])) if e.canvas_name)
+        self.assertEqual(set(['canvas-2']), canvases)
+
+    def test_unselected_canvases_are_not_fetched(self):
+        self._walk(None)
+        all_events = self.backend.events
+        self._walk(Scope(canvases=['canvas-2']))
+        self.assertTrue(self.backend.events < all_events)
+
+    def test_layers(self):
+        def texts(scope):
+            return set(e.text for e in self._walk(scope) if e.text)
+
+        self.assertEqual(set(['text on a shared layer']), texts(Scope(layers=['shared*'])))
+        excluded = texts(Scope(exclude_layers=['shared layer']))
+        self.assertFalse('text on a shared layer' in excluded)
+        self.assertTrue('a hidden label' in excluded)
+        self.assertFalse('a hidden label' in texts(Scope(skip_invisible_layers=True)))
+
+    def test_iter_items(self):
+        doc = Document(backend.connect('simulated').open(fixture('minimal.graffle')))
+        layers = [l.name for l in doc.iter_items([Layer], scope=Scope(canvases=['canvas-1'], exclude_layers=['layer*']))]
+        self.assertEqual(['shared layer'], layers)
+
+
+class WalkContextTests(unittest.TestCase):
+
+    def _walk(self, name, result, latency=0.0):
+        simulated = backend.connect('simulated', latency=latency)
+        doc = Document(simulated.open(fixture(name)))
+        doc.walk(lambda e: result.append((e.canvas_name, e.context.document is doc, e.context.depth)))
+
+    def test_context(self):
+        doc = Document(backend.connect('simulated').open(fixture('minimal.graffle')))
+        layer = next(doc.iter_items([Layer]))
+        self.assertTrue(layer.context.document is doc)
+        self.assertEqual('canvas-1', layer.context.canvas.name)
+        self.assertTrue(layer.context.layer is layer)
+        self.assertEqual(2, layer.context.depth)
+        self.assertEqual([Document, Canvas, Layer], [type(i) for i in layer.context.path])
+
+    def test_concurrent_walks(self):
+        names = ['minimal.graffle', 'translation-test.graffle']
+        expected = {}
+        for name in names:
+            expected[name] = []
+            self._walk(name, expected[name])
+
+        results = dict((name, []) for name in names)
+        threads = [threading.Thread(target=self._walk, args=(name, results[name], 0.0001)) for name in names]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(expected, results)
+
+
+class SharedLayerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.doc = Document(backend.connect('simulated').open(fixture('minimal.graffle')))
+
+    def test_shared_layers_are_walked_once(self):
+        texts = []
+        self.doc.walk(lambda e: texts.append(e.text))
+        self.assertEqual(1, texts.count('text on a shared layer'))
+        # same id as the shared text, but on canvas-1
+        self.assertEqual(1, texts.count('a third hidden box'))
+
+    def test_shared_layer_skipped_on_the_first_canvas(self):
+        class SecondCanvasScope(Scope):
+            def includes_layer(self, layer):
+                return layer.context.canvas.name == 'canvas-2'
+
+        texts = []
+        self.doc.walk(lambda e: texts.append(e.text), scope=SecondCanvasScope())
+        self.assertEqual(1, texts.count('text on a shared layer'))
+        texts = [e.text for e in self.doc.iter_items(scope=SecondCanvasScope())]
+        self.assertEqual(1, texts.count('text on a shared layer'))
+
+    def test_shared_layer_belongs_to_all_canvases(self):
+        shape = next(self.doc.iter_items(where=lambda e: e.text == 'text on a shared layer'))
+        self.assertEqual(['canvas-1', 'canvas-2'], [c.name for c in shape.context.canvases])
+        self.assertEqual(('shared_layer', 'shared layer'), shape.context.layer.identity)
+        box = next(self.doc.iter_items(where=lambda e: e.text == 'box'))
+        self.assertEqual(['canvas-1'], [c.name for c in box.context.canvases])
+
+    def test_canvases_use_the_schema_of_the_walk(self):
+        class RecordingSchema(CollectionSchema):
+            def probe(self, class_name, collection_name):
+                self.probed.append((class_name, collection_name))
+                return super(RecordingSchema, self).probe(class_name, collection_name)
+
+        schema = RecordingSchema()
+        canvases = []
+
+        def callback(e):
+            if e.text == 'text on a shared layer':
+                schema.probed = []
+                canvases.extend(c.name for c in e.context.canvases)
+                canvases.append(schema.probed)
+        schema.probed = []
+        self.doc.walk(callback, schema=schema)
+        self.assertEqual(['canvas-1', 'canvas-2'], canvases[:2])
+        self.assertTrue(('document', 'canvases') in canvases[2])
+
+    def test_identity_without_id(self):
+        layers = list(self.doc.iter_items([Layer]))
+        identities = set(l.identity for l in layers)
+        self.assertEqual(len(layers), len(identities))
+        self.assertEqual(('layers', 0), layers[0].identity[1])
+
+
+class TracingTests(unittest.TestCase):
+
+    def test_arguments_are_evaluated_only_if_enabled(self):
+        calls = []
+        level = data_model.logger.level
+        self.addCleanup(data_model.logger.setLevel, level)
+
+        data_model.logger.setLevel(logging.WARNING)
+        data_model.debug(0, 'info', lambda: calls.append(1))
+        self.assertEqual([], calls)
+
+        data_model.logger.setLevel(logging.DEBUG)
+        data_model.debug(0, 'info', lambda: calls.append(1))
+        self.assertEqual([1], calls)
+
+    def test_missing_colors_are_logged_lazily(self):
+        calls = []
+
+        class Colorless(data_model.Filled, data_model.HasStroke):
+            def _get(self, name):
+                raise data_model.ElementError(name)
+
+            @property
+            def info(self):
+                calls.append(1)
+                return 'colorless'
+
+        level = data_model.logger.level
+        self.addCleanup(data_model.logger.setLevel, level)
+        data_model.logger.setLevel(logging.WARNING)
+        item = Colorless()
+        self.assertEqual((None, None), (item.fill_color, item.stroke_color))
+        self.assertEqual([], calls)
+
+    def test_stats(self):
+        simulated = backend.connect('simulated')
+        doc = simulated.open(fixture('minimal.graffle'))
+        stats = WalkStats()
+        Document(doc).walk(lambda e: None, schema=CollectionSchema(), stats=stats)
+        self.assertEqual(1, stats.nodes['document'])
+        self.assertEqual(2, stats.nodes['canvas'])
+        self.assertEqual(2, stats.items[('document', 'canvases')])
+        self.assertTrue(stats.skipped[('layer', 'rows')] > 0)
+        self.assertTrue('canvas.layers' in stats.report())
+
+
+class CollectionSchemaTests(unittest.TestCase):
+
+    def test_probe_and_record(self):
+        schema = CollectionSchema(seed=False)
+        self.assertTrue(schema.probe('shape', 'rows'))
+        schema.record('shape', 'rows', False)
+        self.assertFalse(schema.probe('shape', 'rows'))
+        # a collection that some element of the class had is never skipped
+        schema.record('line', 'labels', True)
+        schema.record('line', 'labels', False)
+        self.assertTrue(schema.probe('line', 'labels'))
+        self.assertTrue(schema.probe(None, 'rows'))
+
+    def test_save_and_load(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        path = os.path.join(tmp_dir, 'ogtool', 'collections.json')
+        schema = CollectionSchema(seed=False)
+        schema.record('canvas', 'groups', False)
+        schema.record('canvas', 'layers', True)
+        schema.save(path)
+
+        loaded = CollectionSchema(seed=False)
+        loaded.load(path)
+        # a failed probe may have been transient, it is probed again in the next run
+        self.assertTrue(loaded.probe('canvas', 'groups'))
+        self.assertEqual(set(['layers']), loaded.valid['canvas'])
+        CollectionSchema().load(os.path.join(tmp_dir, 'missing.json'))
+
+    def test_load_ignores_saved_misses(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        path = os.path.join(tmp_dir, 'collections.json')
+        with open(path, 'w') as fp:
+            json.dump({'shape': {'valid': ['rows'], 'missing': ['lines']}}, fp)
+        schema = CollectionSchema()
+        schema.load(path)
+        self.assertTrue(schema.probe('shape', 'lines'))
+        self.assertTrue(schema.probe('shape', 'rows'))  # seen valid, although the seed says missing
+        self.assertFalse(schema.probe('shape', 'columns'))
+        CollectionSchema().load(os.path.join(tmp_dir, 'missing.json'))
+
+    def test_failure_is_not_remembered(self):
+        schema = CollectionSchema()
+        graphics = graffle_file.LayerElement.elements_graphics
+
+        def failing(layer):
+            raise data_model.ElementError('timeout')
+        graffle_file.LayerElement.elements_graphics = failing
+        try:
+            Document(graffle_file.load(fixture('minimal.graffle'))).walk(lambda e: None, schema=schema)
+        finally:
+            graffle_file.LayerElement.elements_graphics = graphics
+        # a later walk (e.g. the next job of the export server) probes the collection again
+        self.assertTrue(schema.probe('layer', 'graphics'))
+        texts = []
+        Document(graffle_file.load(fixture('minimal.graffle'))).walk(lambda e: texts.append(e.text), schema=schema)
+        self.assertTrue('box' in texts)
+        self.assertTrue(schema.is_valid('layer', 'graphics'))
+
+    def test_walk_skips_missing_collections(self):
+        def walk(schema):
+            simulated = backend.connect('simulated')
+            doc = simulated.open(fixture('translation-test.graffle'))
+            texts = []
+            Document(doc).walk(lambda e: texts.append(e.text), schema=schema)
+            return simulated.events, sorted(texts)
+
+        events_unseeded, texts_unseeded = walk(CollectionSchema(seed=False))
+        events_seeded, texts_seeded = walk(CollectionSchema())
+        self.assertEqual(texts_unseeded, texts_seeded)
+        self.assertTrue(events_seeded < events_unseeded)
+
+
+if __name__ == '__main__':
+    unittest.main()
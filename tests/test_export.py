@@ -0,0 +1,382 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from omnigraffle import backend, data_model, graffle_file, pdf
+from ogtools import export as ogexport
+from ogtools.export import OmniGraffleSandboxedExporter
+from ogtools.export_manifest import MANIFEST_NAME
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def fixture(name):
+    return os.path.join(TEST_DIR, name)
+
+
+class ExporterTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.backend = backend.connect('simulated')
+
+    def export(self, *argv):
+        args = OmniGraffleSandboxedExporter.get_parser().parse_args(list(argv))
+        exporter = OmniGraffleSandboxedExporter(args, backend=self.backend)
+        exporter.export()
+        return exporter
+
+    def test_formats(self):
+        self.export('png,pdf', fixture('minimal.graffle'), self.tmp_dir)
+        self.assertEqual(['minimal', 'minimal.pdf'], sorted(os.listdir(self.tmp_dir)))
+        self.assertEqual(['canvas-1.png', 'canvas-2.png'], sorted(os.listdir(os.path.join(self.tmp_dir, 'minimal'))))
+
+    def test_canvases(self):
+        self.export('png,jpg', fixture('translation-test.graffle'), self.tmp_dir,
+                    '--canvas', 'socio*', '--canvas', 'test-for-tables')
+        self.assertEqual(['sociocracy-variants.jpg', 'sociocracy-variants.png',
+                          'sociocracy-vs-holacracy.jpg', 'sociocracy-vs-holacracy.png',
+                          'test-for-tables.jpg', 'test-for-tables.png'], sorted(os.listdir(self.tmp_dir)))
+        with open(os.path.join(self.tmp_dir, 'test-for-tables.png')) as fp:
+            self.assertTrue('canvas: test-for-tables ' in fp.read())
+
+    def test_single_canvas_to_file(self):
+        target = os.path.join(self.tmp_dir, 'out.png')
+        self.export('png', fixture('minimal.graffle'), target, '--canvas', 'canvas-2')
+        self.assertEqual(['out.png'], os.listdir(self.tmp_dir))
+
+    def test_single_canvas_to_file_in_several_formats(self):
+        self.export('png,pdf', fixture('minimal.graffle'), os.path.join(self.tmp_dir, 'out.png'),
+                    '--canvas', 'canvas-2')
+        self.assertEqual(['out.pdf', 'out.png'], sorted(os.listdir(self.tmp_dir)))
+
+    def test_missing_canvas(self):
+        self.assertRaises(SystemExit, self.export, 'png', fixture('minimal.graffle'), self.tmp_dir,
+                          '--canvas', 'missing')
+
+    def test_unsupported_format(self):
+        self.assertRaises(SystemExit, self.export, 'png,html', fixture('minimal.graffle'), self.tmp_dir)
+
+    def test_split_pdf(self):
+        self.export('pdf', fixture('translation-test.graffle'), self.tmp_dir, '--split-pdf')
+        directory = os.path.join(self.tmp_dir, 'translation-test')
+        self.assertEqual(['sociocracy-variants.pdf', 'sociocracy-vs-holacracy.pdf', 'test-for-tables.pdf'],
+                         sorted(os.listdir(directory)))
+        with open(os.path.join(directory, 'test-for-tables.pdf'), 'rb') as fp:
+            data = fp.read()
+        self.assertEqual(1, pdf.page_count(data))
+        self.assertTrue(b'canvas: test-for-tables ' in data)
+        self.assertFalse(b'canvas: sociocracy-variants ' in data)
+
+    def test_split_pdf_exports_once(self):
+        def events(*options):
+            self.backend = backend.connect('simulated')
+            self.export('pdf', fixture('translation-test.graffle'), self.tmp_dir, '--canvas', '*', *options)
+            return self.backend.events
+
+        self.assertTrue(events('--split-pdf') < events() - 3)
+
+    def test_resolutions_without_pillow(self):
+        # the simulated backend does not write images, so every resolution is exported
+        image, ogexport.Image = ogexport.Image, None
+        self.addCleanup(setattr, ogexport, 'Image', image)
+        self.export('png', fixture('minimal.graffle'), self.tmp_dir, '--resolutions', '2,1,3')
+        self.assertEqual(['canvas-1.png', 'canvas-1@2x.png', 'canvas-1@3x.png',
+                          'canvas-2.png', 'canvas-2@2x.png', 'canvas-2@3x.png'],
+                         sorted(os.listdir(os.path.join(self.tmp_dir, 'minimal'))))
+        with open(os.path.join(self.tmp_dir, 'minimal', 'canvas-1@2x.png')) as fp:
+            self.assertTrue('resolution=2.0' in fp.read())
+        self.assertEqual(1.0, self.backend.export_settings.resolution())
+
+    def test_invalid_resolutions(self):
+        self.assertRaises(SystemExit, self.export, 'png', fixture('minimal.graffle'), self.tmp_dir,
+                          '--resolutions', '1,x')
+        self.assertRaises(SystemExit, self.export, 'png', fixture('minimal.graffle'), self.tmp_dir,
+                          '--resolutions', '1,2', '--resolution', '2')
+
+    @unittest.skipIf(ogexport.Image is None, 'Pillow is not installed')
+    def test_downsample(self):
+        source = os.path.join(self.tmp_dir, 'canvas@3x.png')
+        ogexport.Image.new('RGBA', (300, 150), (255, 0, 0, 255)).save(source, dpi=(216, 216))
+        tasks = [(source, os.path.join(self.tmp_dir, 'canvas.png'), 1 / 3.0),
+                 (source, os.path.join(self.tmp_dir, 'canvas@2x.png'), 2 / 3.0)]
+        ogexport.downsample_all(tasks)
+        self.assertEqual((100, 50), ogexport.Image.open(tasks[0][1]).size)
+        self.assertEqual((200, 100), ogexport.Image.open(tasks[1][1]).size)
+
+    @unittest.skipIf(ogexport.Image is None, 'Pillow is not installed')
+    def test_downsample_gif(self):
+        Image = ogexport.Image
+        source = os.path.join(self.tmp_dir, 'canvas@2x.gif')
+        image = Image.new('P', (200, 100), 2)
+        image.putpalette([0, 0, 0, 255, 255, 255, 0, 255, 0])
+        for x in range(0, 200):  # black and white stripes, transparent below
+            image.paste(x % 2, (x, 0, x + 1, 50))
+        image.save(source, transparency=2)
+        target = os.path.join(self.tmp_dir, 'canvas.gif')
+        ogexport.downsample((source, target, 0.5))
+        resized = Image.open(target)
+        self.assertEqual(('P', (100, 50)), (resized.mode, resized.size))
+        rgba = resized.convert('RGBA')
+        # resampled, not the nearest stripe
+        self.assertTrue(64 < rgba.getpixel((50, 10))[0] < 192)
+        self.assertEqual(0, rgba.getpixel((50, 40))[3])
+
+    @unittest.skipIf(ogexport.Image is None, 'Pillow is not installed')
+    def test_downsample_errors(self):
+        source = os.path.join(self.tmp_dir, 'canvas@3x.png')
+        with open(source, 'w') as fp:
+            fp.write('not an image')
+        tasks = [(source, os.path.join(self.tmp_dir, 'canvas.png'), 1 / 3.0),
+                 (source, os.path.join(self.tmp_dir, 'canvas@2x.png'), 2 / 3.0)]
+        with self.assertRaises(RuntimeError) as raised:
+            ogexport.downsample_all(tasks)
+        self.assertTrue(source in str(raised.exception))
+
+    def test_application_errors_are_reported(self):
+        def fail(*args, **kwargs):
+            raise data_model.ElementError('OSERROR: -50')
+        self.addCleanup(setattr, OmniGraffleSandboxedExporter, '_og_export', OmniGraffleSandboxedExporter._og_export)
+        OmniGraffleSandboxedExporter._og_export = fail
+        with self.assertRaises(SystemExit):
+            self.export('png', fixture('minimal.graffle'), self.tmp_dir)
+        self.assertEqual(1.0, self.backend.export_settings.resolution())
+
+    def test_sandboxed(self):
+        sandbox = os.path.join(self.tmp_dir, 'sandbox')
+        os.mkdir(sandbox)
+        target = os.path.join(self.tmp_dir, 'out')
+        self.backend = backend.connect('simulated', sandbox=sandbox)
+        self.export('png,pdf', fixture('translation-test.graffle'), target, '--canvas', 'socio*')
+        self.export('png', fixture('minimal.graffle'), target)
+        self.export('pdf', fixture('minimal.graffle'), target, '--split-pdf')
+        self.assertEqual(['minimal', 'sociocracy-variants.pdf', 'sociocracy-variants.png',
+                          'sociocracy-vs-holacracy.pdf', 'sociocracy-vs-holacracy.png'], sorted(os.listdir(target)))
+        self.assertEqual(['canvas-1.pdf', 'canvas-1.png', 'canvas-2.pdf', 'canvas-2.png'],
+                         sorted(os.listdir(os.path.join(target, 'minimal'))))
+        self.assertEqual([], os.listdir(sandbox))
+
+    def test_settings_are_restored(self):
+        self.export('png,jpg', fixture('minimal.graffle'), self.tmp_dir, '--canvas', '*', '--resolution', '2')
+        self.assertEqual(1.0, self.backend.export_settings.resolution())
+        self.assertEqual('current_canvas', self.backend.export_settings.area_type())
+
+    def test_events_per_canvas(self):
+        def events(*patterns):
+            self.backend = backend.connect('simulated')
+            argv = ['png', fixture('translation-test.graffle'), self.tmp_dir]
+            for pattern in patterns:
+                argv.extend(['--canvas', pattern])
+            self.export(*argv)
+            return self.backend.events
+
+        one = events('test-for-tables')
+        two = events('socio*')
+        three = events('*')
+        # the canvases are fetched once, each additional canvas costs the same few events
+        self.assertEqual(two - one, three - two)
+        self.assertTrue(three - two <= 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+class IncrementalExportTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.source = os.path.join(self.tmp_dir, 'minimal.graffle')
+        shutil.copyfile(fixture('minimal.graffle'), self.source)
+        self.target = os.path.join(self.tmp_dir, 'out')
+
+    def export(self, *options):
+        self.backend = backend.connect('simulated')
+        argv = ['png', self.source, self.target, '--incremental'] + list(options)
+        args = OmniGraffleSandboxedExporter.get_parser().parse_args(argv)
+        OmniGraffleSandboxedExporter(args, backend=self.backend).export()
+        return self.backend.events
+
+    def output(self, canvas):
+        return os.path.join(self.target, 'minimal', '%s.png' % canvas)
+
+    def touch_outputs(self):
+        """Backdate the outputs, so that files written later can be recognized."""
+        for canvas in ('canvas-1', 'canvas-2'):
+            os.utime(self.output(canvas), (0, 0))
+
+    def exported(self):
+        return sorted(c for c in ('canvas-1', 'canvas-2')
+                      if os.path.exists(self.output(c)) and os.path.getmtime(self.output(c)) > 0)
+
+    def change_plist(self, change):
+        data, compressed = graffle_file.read_plist(self.source)
+        change(data)
+        graffle_file.write_plist(self.source, data, compressed)
+
+    def test_unchanged_document_is_not_opened(self):
+        self.export()
+        self.assertEqual(['canvas-1', 'canvas-2'], self.exported())
+        self.assertTrue(os.path.exists(os.path.join(self.target, MANIFEST_NAME)))
+        self.touch_outputs()
+        # only the export settings that affect the exported files are read
+        self.assertEqual(4, self.export())
+        self.assertEqual([], self.exported())
+
+    def test_changed_canvas(self):
+        self.export()
+        self.touch_outputs()
+
+        def change(data):
+            data['Sheets'][1]['GraphicsList'][0]['Bounds'] = '{{0, 0}, {10, 10}}'
+        self.change_plist(change)
+        self.export()
+        self.assertEqual(['canvas-2'], self.exported())
+
+    def test_changed_shared_layer(self):
+        self.export()
+        self.touch_outputs()
+
+        def change(data):
+            data['MasterSheets'][0]['GraphicsList'].append({'Class': 'ShapedGraphic', 'ID': 999})
+        self.change_plist(change)
+        self.export()
+        self.assertEqual(['canvas-1', 'canvas-2'], self.exported())
+
+    def test_changes_that_do_not_affect_export(self):
+        self.export()
+        self.touch_outputs()
+
+        def change(data):
+            data['Sheets'][0]['BaseZoom'] = 3
+            data['WindowInfo'] = {}
+        self.change_plist(change)
+        self.export()
+        self.assertEqual([], self.exported())
+
+    def test_selected_canvases(self):
+        self.export()
+        self.touch_outputs()
+        self.export('--canvas', 'canvas-2')
+        self.assertTrue(os.path.exists(os.path.join(self.target, 'canvas-2.png')))
+        # outputs of canvases that were not selected are kept
+        self.assertTrue(os.path.exists(self.output('canvas-1')))
+
+    def test_changed_settings(self):
+        self.export()
+        self.touch_outputs()
+        self.export('--resolution', '2')
+        self.assertEqual(['canvas-1', 'canvas-2'], self.exported())
+
+    def test_deleted_canvas(self):
+        self.export()
+        self.change_plist(lambda data: data['Sheets'].pop(0))
+        self.export()
+        # the document has a single canvas now, which is exported to the target folder
+        self.assertFalse(os.path.exists(self.output('canvas-1')))
+        self.assertFalse(os.path.exists(self.output('canvas-2')))
+        self.assertTrue(os.path.exists(os.path.join(self.target, 'canvas-2.png')))
+
+
+class CachedExportTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.cache_dir = os.path.join(self.tmp_dir, 'cache')
+
+    def export(self, target, *options):
+        self.backend = backend.connect('simulated')
+        argv = ['png', fixture('minimal.graffle'), os.path.join(self.tmp_dir, target),
+                '--cache', '--cache-dir', self.cache_dir] + list(options)
+        args = OmniGraffleSandboxedExporter.get_parser().parse_args(argv)
+        OmniGraffleSandboxedExporter(args, backend=self.backend).export()
+        return self.backend.events
+
+    def test_cache_hit_does_not_open_document(self):
+        first = self.export('one')
+        # same canvases and settings in another folder: files come from the cache
+        self.assertTrue(self.export('two') < first)
+        for canvas in ('canvas-1', 'canvas-2'):
+            with open(os.path.join(self.tmp_dir, 'one', 'minimal', '%s.png' % canvas)) as fp:
+                expected = fp.read()
+            with open(os.path.join(self.tmp_dir, 'two', 'minimal', '%s.png' % canvas)) as fp:
+                self.assertEqual(expected, fp.read())
+        self.assertEqual(['canvas-1.png', 'canvas-2.png'],
+                         sorted(os.listdir(os.path.join(self.tmp_dir, 'two', 'minimal'))))
+
+    def test_cache_hit_does_not_ask_omnigraffle(self):
+        self.export('one')
+        # the version and settings of OmniGraffle recorded by the first export are assumed
+        self.assertEqual(0, self.export('two'))
+        self.assertTrue(os.path.exists(os.path.join(self.tmp_dir, 'two', 'minimal', 'canvas-1.png')))
+
+    def test_changed_settings_miss(self):
+        self.export('one')
+        self.export('two', '--resolution', '2')
+        with open(os.path.join(self.tmp_dir, 'two', 'minimal', 'canvas-1.png')) as fp:
+            self.assertTrue('resolution=2.0' in fp.read())
+
+    def test_export_does_not_write_to_cache(self):
+        self.export('one')
+        # the export replaces the file linked to the cache instead of writing to it
+        self.export('one', '--resolution', '2')
+        self.export('two')
+        with open(os.path.join(self.tmp_dir, 'two', 'minimal', 'canvas-1.png')) as fp:
+            self.assertFalse('resolution=2.0' in fp.read())
+
+
+class OfflineExportTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.backend = backend.connect('simulated')
+
+    def export(self, *argv):
+        args = OmniGraffleSandboxedExporter.get_parser().parse_args(list(argv))
+        OmniGraffleSandboxedExporter(args, backend=self.backend).export()
+
+    def test_svg_does_not_need_omnigraffle(self):
+        self.export('svg', fixture('minimal.graffle'), self.tmp_dir)
+        self.assertEqual(0, self.backend.events)
+        directory = os.path.join(self.tmp_dir, 'minimal')
+        self.assertEqual(['canvas-1.svg', 'canvas-2.svg'], sorted(os.listdir(directory)))
+        with open(os.path.join(directory, 'canvas-1.svg')) as fp:
+            self.assertTrue('<svg ' in fp.read())
+
+    def test_verbose_svg_does_not_need_omnigraffle(self):
+        self.export('svg', fixture('minimal.graffle'), self.tmp_dir, '--verbose')
+        self.assertEqual(0, self.backend.events)
+
+    def test_svg_without_appscript(self):
+        try:
+            import appscript  # noqa: F401
+            self.skipTest('appscript is installed')
+        except ImportError:
+            pass
+        environ = dict(os.environ)
+        self.addCleanup(os.environ.update, environ)
+        os.environ.pop(backend.BACKEND_VARIABLE, None)
+        args = OmniGraffleSandboxedExporter.get_parser().parse_args(['svg', fixture('minimal.graffle'), self.tmp_dir])
+        exporter = OmniGraffleSandboxedExporter(args)  # the default backend (appscript)
+        exporter.export()
+        self.assertIsNone(exporter._backend)  # never connected
+        self.assertEqual(['canvas-1.svg', 'canvas-2.svg'], sorted(os.listdir(os.path.join(self.tmp_dir, 'minimal'))))
+
+    def test_failed_render_is_reported(self):
+        def fail(*args, **kwargs):
+            raise IOError('disk full')
+        self.addCleanup(setattr, ogexport.svg, 'render_canvases', ogexport.svg.render_canvases)
+        ogexport.svg.render_canvases = fail
+        with self.assertRaises(SystemExit):
+            self.export('svg', fixture('minimal.graffle'), self.tmp_dir)
+
+    def test_svg_and_png(self):
+        self.export('svg,png', fixture('minimal.graffle'), self.tmp_dir, '--canvas', 'canvas-2')
+        self.assertEqual(['canvas-2.png', 'canvas-2.svg'], sorted(os.listdir(self.tmp_dir)))
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+
+from omnigraffle import backend
+from ogtools import export_server
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def fixture(name):
+    return os.path.join(TEST_DIR, name)
+
+
+class ExportServerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.backend = backend.connect('simulated')
+        self.server = export_server.ExportServer(self.backend, os.path.join(self.tmp_dir, 'export.sock'),
+                                                 pool_size=1)
+
+    def export(self, *argv):
+        return self.server.handle(dict(command='export', argv=list(argv)))
+
+    def test_export(self):
+        self.assertEqual('ok', self.export('png', fixture('minimal.graffle'), self.tmp_dir)['status'])
+        self.assertEqual(['canvas-1.png', 'canvas-2.png'],
+                         sorted(os.listdir(os.path.join(self.tmp_dir, 'minimal'))))
+        self.assertEqual('ok', self.export('png', fixture('minimal.graffle'), self.tmp_dir,
+                                           '--canvas', 'canvas-2')['status'])
+        self.assertTrue(os.path.exists(os.path.join(self.tmp_dir, 'canvas-2.png')))
+
+    def test_documents_stay_open(self):
+        self.export('pdf', fixture('minimal.graffle'), self.tmp_dir)
+        events = self.backend.events
+        self.export('pdf', fixture('minimal.graffle'), self.tmp_dir)
+        second = self.backend.events - events
+        # neither the document is opened nor the settings are sent again
+        self.assertTrue(second <= events)
+        stats = self.server.handle(dict(command='stats'))
+        self.assertEqual((1, 1, 2), (stats['hits'], stats['misses'], stats['jobs']))
+
+        # pool size is 1: opening another document closes the first one
+        self.export('pdf', fixture('color-test.graffle'), self.tmp_dir)
+        self.assertEqual([fixture('color-test.graffle')], self.server.handle(dict(command='stats'))['documents'])
+        self.assertEqual(1, len(self.backend.app.windows()))
+
+    def test_documents_with_the_same_name(self):
+        paths = []
+        for folder in ('a', 'b'):
+            os.mkdir(os.path.join(self.tmp_dir, folder))
+            paths.append(os.path.join(self.tmp_dir, folder, 'minimal.graffle'))
+            shutil.copyfile(fixture('minimal.graffle'), paths[-1])
+        pool = export_server.DocumentPool(self.backend, size=2)
+        first = pool.get(paths[0])
+        pool.get(paths[1])
+        self.assertTrue(pool.get(paths[0]) is first)
+        self.assertEqual(paths[0], self.backend.app.windows.first().document().path())
+
+    def test_closed_window_is_reopened(self):
+        self.assertEqual('ok', self.export('pdf', fixture('minimal.graffle'), self.tmp_dir)['status'])
+        self.backend.app.windows.first().close()  # closed by the user in OmniGraffle
+        self.assertEqual('ok', self.export('pdf', fixture('minimal.graffle'), self.tmp_dir)['status'])
+        stats = self.server.handle(dict(command='stats'))
+        self.assertEqual((0, 2, 0), (stats['hits'], stats['misses'], stats['errors']))
+        self.assertEqual(1, len(self.backend.app.windows()))
+
+    def test_settings_are_restored(self):
+        self.export('png', fixture('minimal.graffle'), self.tmp_dir, '--resolution', '2.0', '--transparent')
+        settings = self.backend.export_settings
+        self.assertEqual(2.0, settings.resolution())
+        self.server.shutdown()
+        self.assertEqual(1.0, settings.resolution())
+        self.assertEqual(True, settings.draws_background())
+        self.assertEqual([], self.backend.app.windows())
+
+    def test_errors(self):
+        response = self.export('png', fixture('minimal.graffle'), self.tmp_dir, '--canvas', 'missing')
+        self.assertEqual('error', response['status'])
+        self.assertTrue('missing' in response['message'])
+        self.assertEqual('error', self.server.handle(dict(command='unknown'))['status'])
+
+    def test_socket(self):
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.start()
+        try:
+            for i in range(100):  # wait for the server to listen
+                if os.path.exists(self.server.address):
+                    break
+                threading.Event().wait(0.01)
+            response = export_server.request(self.server.address, dict(
+                command='export', argv=['pdf', 'minimal.graffle', self.tmp_dir], cwd=TEST_DIR))
+            self.assertEqual('ok', response['status'])
+            self.assertTrue(os.path.exists(os.path.join(self.tmp_dir, 'minimal.pdf')))
+        finally:
+            export_server.request(self.server.address, dict(command='shutdown'))
+            thread.join()
+        self.assertFalse(os.path.exists(self.server.address))
+
+    def test_client_that_disconnects(self):
+        closed = threading.Event()
+        handle = self.server.handle
+
+        def slow_handle(request):
+            closed.wait(5)  # answer after the client went away
+            return handle(request)
+        self.server.handle = slow_handle
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.start()
+        try:
+            for i in range(100):
+                if os.path.exists(self.server.address):
+                    break
+                threading.Event().wait(0.01)
+            client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            client.connect(self.server.address)
+            client.sendall(b'{"command": "stats"}\n')
+            client.close()
+            closed.set()
+            # the server is still running
+            self.assertEqual('ok', export_server.request(self.server.address, dict(command='stats'))['status'])
+        finally:
+            export_server.request(self.server.address, dict(command='shutdown'))
+            thread.join()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from omnigraffle import fingerprint, graffle_file, pdf
+from omnigraffle_export import omnigraffle_export
+from omnigraffle_export.omnigraffle import OmniGraffle
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def fixture(name):
+    return os.path.join(TEST_DIR, name)
+
+
+class FingerprintTests(unittest.TestCase):
+
+    def fingerprints(self, name, change=None):
+        data, dummy = graffle_file.read_plist(fixture(name))
+        if change:
+            change(data)
+        return fingerprint.DocumentFingerprint(fixture(name), data).canvases()
+
+    def test_canvases(self):
+        self.assertEqual(['canvas-1', 'canvas-2'], list(fingerprint.canvas_fingerprints(fixture('minimal.graffle'))))
+        self.assertEqual(['canvas-3'], list(fingerprint.canvas_fingerprints(fixture('color-test.graffle'))))
+        self.assertEqual(self.fingerprints('minimal.graffle'), self.fingerprints('minimal.graffle'))
+
+    def test_graphics(self):
+        def change(data):
+            data['Sheets'][0]['GraphicsList'][0]['ID'] = 1000
+        before, after = self.fingerprints('minimal.graffle'), self.fingerprints('minimal.graffle', change)
+        self.assertNotEqual(before['canvas-1'], after['canvas-1'])
+        self.assertEqual(before['canvas-2'], after['canvas-2'])
+
+    def test_images(self):
+        def change(data):
+            data['Images'][0]['RawData'] = b'other image'
+        before, after = self.fingerprints('translation-test.graffle'), self.fingerprints('translation-test.graffle', change)
+        self.assertNotEqual(before['sociocracy-vs-holacracy'], after['sociocracy-vs-holacracy'])
+        self.assertEqual(before['test-for-tables'], after['test-for-tables'])
+
+    def test_volatile_keys(self):
+        def change(data):
+            data['ModificationDate'] = 'today'
+            data['ActiveLayerIndex'] = 1
+            data['BaseZoom'] = 2
+        self.assertEqual(self.fingerprints('color-test.graffle'), self.fingerprints('color-test.graffle', change))
+
+    def test_combine(self):
+        self.assertNotEqual(fingerprint.combine('png', 'abc'), fingerprint.combine('pn', 'gabc'))
+
+
+
+class SchemaFingerprintTests(unittest.TestCase):
+
+    def test_export_fingerprint(self):
+        schema = OmniGraffle('simulated').open(fixture('minimal.graffle'))
+        events = schema.backend.events
+        png = schema.export_fingerprint('canvas-1', 'png')
+        self.assertNotEqual(png, schema.export_fingerprint('canvas-1', 'pdf'))
+        self.assertNotEqual(png, schema.export_fingerprint('canvas-2', 'png'))
+        self.assertEqual(None, schema.export_fingerprint('missing', 'png'))
+        # computed from the file, not by exporting (only asking once if the document is modified)
+        self.assertEqual(events + 1, schema.backend.events)
+
+    def test_no_fingerprint_of_unsaved_changes(self):
+        og = OmniGraffle('simulated')
+        schema = og.open(fixture('minimal.graffle'))
+        schema.doc.canvases()[1].name.set('changed in OmniGraffle')
+        active = og.active_document()
+        self.assertEqual(None, active.export_fingerprint('canvas-1', 'png'))
+        self.assertEqual(None, schema.export_fingerprint('canvas-1', 'png'))
+
+    @unittest.skipUnless(hasattr(omnigraffle_export, 'OmniGraffleSchema'), 'omnigraffle-export runs on Python 2')
+    def test_unstampable_pdf(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        target = os.path.join(tmp_dir, 'canvas-1.pdf')
+        schema = OmniGraffle('simulated').open(fixture('minimal.graffle'))
+
+        def stamp_info(path, values):
+            raise pdf.PDFError('cross-reference streams are not supported')
+        original, pdf.stamp_info = pdf.stamp_info, stamp_info
+        try:
+            self.assertTrue(omnigraffle_export.export_one(schema, target, 'canvas-1'))
+            # the fingerprint is kept in a sidecar file instead
+            self.assertFalse(omnigraffle_export.export_one(schema, target, 'canvas-1'))
+        finally:
+            pdf.stamp_info = original
+
+
+if __name__ == '__main__':
+    unittest.main()
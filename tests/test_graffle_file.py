@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from omnigraffle import graffle_file
+from omnigraffle.data_model import Canvas, Document, ElementError
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def fixture(name):
+    return os.path.join(TEST_DIR, name)
+
+
+class GraffleFileTests(unittest.TestCase):
+
+    def test_canvases(self):
+        doc = graffle_file.load(fixture('minimal.graffle'))
+        self.assertEqual(['canvas-1', 'canvas-2'], [c.name() for c in doc.canvases()])
+        self.assertEqual('minimal.graffle', doc.name())
+
+    def test_single_canvas_and_compressed_file(self):
+        doc = graffle_file.load(fixture('color-test.graffle'))
+        self.assertEqual(['canvas-3'], [c.name() for c in doc.canvases()])
+
+    def test_layers(self):
+        canvas = graffle_file.load(fixture('minimal.graffle')).canvases()[0]
+        layers = [(l.name(), l.visible(), l.class_()) for l in canvas.layers()]
+        self.assertEqual([('layer one', True, 'layer'),
+                          ('layer 2 (invisible)', False, 'layer'),
+                          ('shared layer', True, 'shared_layer')], layers)
+
+    def test_graphics(self):
+        layer = graffle_file.load(fixture('minimal.graffle')).canvases()[0].layers()[0]
+        self.assertEqual(['a label', 'box', 'bo', 'a third box'], [g.text() for g in layer.shapes()])
+        self.assertEqual(3, len(layer.lines()))
+        box = layer.shapes()[1]
+        self.assertEqual(202, box.id())
+        self.assertEqual('OpenSans', box.text.font())
+        self.assertEqual(36.0, box.text.size())
+        self.assertEqual((65535, 65535, 65535), box.text.color())
+        self.assertEqual([313, 315], sorted(l.id() for l in box.outgoing_lines()))
+
+    def test_missing_properties(self):
+        layer = graffle_file.load(fixture('minimal.graffle')).canvases()[0].layers()[0]
+        self.assertRaises(ElementError, layer.rows)
+        self.assertRaises(ElementError, layer.lines()[0].text.font)
+
+    def test_tables(self):
+        canvas = graffle_file.load(fixture('translation-test.graffle')).canvases()[1]
+        table = [g for g in canvas.graphics() if g.class_() == 'table'][0]
+        rows = table.rows()
+        self.assertEqual(3, len(rows))
+        self.assertEqual(['table1label1', '21', '31'], [g.text() for g in rows[0].graphics()])
+
+    def test_walk(self):
+        texts = []
+
+        def collect(element):
+            if element.text:
+                texts.append(element.text)
+
+        graffle_file.open_document(fixture('minimal.graffle')).walk(collect)
+        self.assertTrue('a hidden label' in texts)
+        self.assertTrue('text on a shared layer' in texts)
+
+    def test_walk_canvas(self):
+        doc = graffle_file.open_document(fixture('translation-test.graffle'))
+        self.assertTrue(isinstance(doc, Document))
+        texts = []
+        Canvas(doc.item.canvases()[1]).walk(lambda e: texts.append(e.text))
+        self.assertTrue('box in table' in texts)
+
+
+class GraffleFileWriteTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+    def _copy(self, name):
+        target = os.path.join(self.tmp_dir, name)
+        shutil.copyfile(fixture(name), target)
+        return target
+
+    def test_set_attribute_run(self):
+        path = self._copy('minimal.graffle')
+        doc = graffle_file.load(path)
+        box = doc.canvases()[0].layers()[0].shapes()[1]
+        box.text.attribute_runs[0].text.set(u'Kiste')
+        self.assertTrue(doc.modified())
+        doc.save()
+
+        box = graffle_file.load(path).canvases()[0].layers()[0].shapes()[1]
+        self.assertEqual(u'Kiste', box.text())
+        self.assertEqual('OpenSans', box.text.font())
+
+    def test_save_compressed(self):
+        path = self._copy('color-test.graffle')
+        doc = graffle_file.load(path)
+        doc.canvases()[0].name.set('renamed')
+        doc.save()
+        with open(path, 'rb') as fp:
+            self.assertEqual(graffle_file.GZIP_MAGIC, fp.read(2))
+        self.assertEqual('renamed', graffle_file.load(path).canvases()[0].name())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from omnigraffle.output_cache import MB, OutputCache, detach
+
+
+class OutputCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.cache = OutputCache(os.path.join(self.tmp_dir, 'cache'))
+
+    def write(self, name, data):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, 'wb') as fp:
+            fp.write(data)
+        return path
+
+    def read(self, name):
+        with open(os.path.join(self.tmp_dir, name), 'rb') as fp:
+            return fp.read()
+
+    def test_put_and_get(self):
+        key = self.cache.key('ogexport', 'png', 'fingerprint')
+        self.assertFalse(self.cache.get(key, os.path.join(self.tmp_dir, 'out.png')))
+        self.cache.put(key, self.write('exported.png', b'png data'))
+        self.assertTrue(key in self.cache)
+        self.assertTrue(self.cache.get(key, os.path.join(self.tmp_dir, 'sub', 'out.png')))
+        self.assertEqual(b'png data', self.read('sub/out.png'))
+        self.assertEqual((1, 1), (self.cache.hits, self.cache.misses))
+
+    def test_cache_is_a_copy(self):
+        key = self.cache.key('a')
+        source = self.write('exported.png', b'original')
+        self.cache.put(key, source)
+        self.write('exported.png', b'changed')
+        self.cache.get(key, os.path.join(self.tmp_dir, 'out.png'))
+        self.assertEqual(b'original', self.read('out.png'))
+
+    def test_detach(self):
+        key = self.cache.key('a')
+        self.cache.put(key, self.write('exported.png', b'original'))
+        target = os.path.join(self.tmp_dir, 'out.png')
+        self.cache.get(key, target)
+        detach(target)
+        self.write('out.png', b'changed')
+        self.cache.get(key, os.path.join(self.tmp_dir, 'other.png'))
+        self.assertEqual(b'original', self.read('other.png'))
+
+    def test_least_recently_used_are_evicted(self):
+        self.cache.max_size = 25
+        for name in ('a', 'b', 'c'):
+            self.cache.put(self.cache.key(name), self.write(name, b'x' * 10))
+            os.utime(self.cache.path(self.cache.key(name)), (0, {'a': 100, 'b': 200, 'c': 300}[name]))
+        self.cache.prune()
+        self.assertEqual([False, True, True], [self.cache.key(n) in self.cache for n in 'abc'])
+        # using a file makes it recent
+        self.cache.get(self.cache.key('b'), os.path.join(self.tmp_dir, 'out'))
+        self.cache.put(self.cache.key('d'), self.write('d', b'x' * 10))
+        self.assertEqual([False, True, False, True], [self.cache.key(n) in self.cache for n in 'abcd'])
+
+    def test_use_does_not_touch_outputs(self):
+        key = self.cache.key('a')
+        self.cache.put(key, self.write('exported.png', b'x'))
+        first = os.path.join(self.tmp_dir, 'first.png')
+        self.cache.get(key, first)
+        os.utime(first, (100, 100))  # also the cached file, if it is linked
+        self.cache.get(key, os.path.join(self.tmp_dir, 'second.png'))
+        self.assertEqual(100, os.path.getmtime(first))
+
+    def test_stats_and_prune(self):
+        for name in ('a', 'b'):
+            self.cache.put(self.cache.key(name), self.write(name, b'x' * 10))
+        self.cache.get(self.cache.key('a'), os.path.join(self.tmp_dir, 'out'))
+        stats = self.cache.stats()
+        self.assertEqual((2, 20, 1024 * MB), (stats['files'], stats['size'], stats['max_size']))
+        removed, freed = self.cache.prune(0)
+        self.assertEqual(2, removed)
+        if os.stat(os.path.join(self.tmp_dir, 'out')).st_nlink > 1:
+            self.assertEqual(10, freed)  # 'a' is still linked from out
+        self.assertEqual(0, self.cache.stats()['files'])
+
+    def test_max_size_is_kept(self):
+        directory = os.path.join(self.tmp_dir, 'sized')
+        self.assertEqual(5 * MB, OutputCache(directory, 5).max_size)
+        self.assertEqual(5 * MB, OutputCache(directory).max_size)
+        self.assertEqual(1024 * MB, OutputCache(os.path.join(self.tmp_dir, 'other')).max_size)
+
+    def test_put_from_threads(self):
+        self.cache.max_size = 100
+        sources = [self.write(str(i), b'x' * 10) for i in range(20)]
+        threads = [threading.Thread(target=self.cache.put, args=(self.cache.key(str(i)), source))
+                   for i, source in enumerate(sources)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(self.cache.stats()['size'], self.cache.size())
+        self.assertTrue(self.cache.size() <= 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from omnigraffle import pdf
+
+PAGES = [((0, 0, 612, 792), b'% first page\n0 0 m 10 10 l S\n'),
+         ((0, 0, 100, 50), b'% second page (with parentheses)\n')]
+
+# two pages that inherit resources and media box from the page tree, the second page links to the first
+INHERITED = b"""%PDF-1.4
+1 0 obj
+<< /Type /Catalog /Pages 2 0 R >>
+endobj
+2 0 obj
+<< /Type /Pages /Kids [3 0 R 4 0 R] /Count 2 /MediaBox [0 0 200 100] /Resources << /Font << /F1 5 0 R >> >> >>
+endobj
+3 0 obj
+<< /Type /Page /Parent 2 0 R /Contents 6 0 R >>
+endobj
+4 0 obj
+<< /Type /Page /Parent 2 0 R /Rotate 90 /Annots [<< /Type /Annot /Subtype /Link /Dest [3 0 R /Fit] >>] >>
+endobj
+5 0 obj
+<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>
+endobj
+6 0 obj
+<< /Length 7 0 R >>
+stream
+BT /F1 12 Tf (a \\) paren) Tj ET
+endstream
+endobj
+7 0 obj
+31
+endobj
+trailer
+<< /Root 1 0 R /Size 8 >>
+%%EOF
+"""
+
+
+class PDFTests(unittest.TestCase):
+
+    def test_write_and_read(self):
+        data = pdf.write_document(PAGES, dict(Title=u'Tést (1)'))
+        reader = pdf.PDFReader(data)
+        pages = reader.pages()
+        self.assertEqual(2, len(pages))
+        self.assertEqual([0, 0, 100, 50], pages[1][1]['MediaBox'])
+        contents = reader.resolve(pages[0][1]['Contents'])
+        self.assertEqual(PAGES[0][1], contents.data)
+        self.assertEqual(b'(T\xe9st \\(1\\))', reader.info['Title'])
+
+    def test_split_pages(self):
+        first, second = pdf.split_pages(pdf.write_document(PAGES))
+        reader = pdf.PDFReader(second)
+        (ref, page), = reader.pages()
+        self.assertEqual(PAGES[1][1], reader.resolve(page['Contents']).data)
+        self.assertFalse(b'first page' in second)
+        self.assertEqual(1, pdf.page_count(first))
+
+    def test_inherited_attributes_and_links(self):
+        # no cross-reference table: the objects are found by scanning the file
+        first, second = pdf.split_pages(INHERITED)
+        reader = pdf.PDFReader(first)
+        (ref, page), = reader.pages()
+        self.assertEqual([0, 0, 200, 100], page['MediaBox'])
+        font = reader.resolve(reader.resolve(page['Resources'])['Font']['F1'])
+        self.assertEqual('Helvetica', font['BaseFont'])
+        self.assertEqual(b'BT /F1 12 Tf (a \\) paren) Tj ET', reader.resolve(page['Contents']).data)
+
+        reader = pdf.PDFReader(second)
+        (ref, page), = reader.pages()
+        self.assertEqual(90, page['Rotate'])
+        # the link to the other page is dropped, not the other page copied
+        self.assertEqual([pdf.NULL, 'Fit'], page['Annots'][0]['Dest'])
+        self.assertFalse(b'Tj' in second)
+
+    def test_incremental_update(self):
+        data = pdf.write_document(PAGES, dict(Title=u'old'))
+        startxref = int(data.rsplit(b'startxref', 1)[1].split()[0])
+        info_offset = len(data)
+        update = b'7 0 obj\n<< /Title (new) >>\nendobj\n'
+        xref_offset = info_offset + len(update)
+        update += (b'xref\n7 1\n%010d 00000 n \ntrailer\n<< /Size 8 /Root 1 0 R /Info 7 0 R /Prev %d >>\n'
+                   b'startxref\n%d\n%%%%EOF\n' % (info_offset, startxref, xref_offset))
+        reader = pdf.PDFReader(data + update)
+        self.assertEqual(b'(new)', reader.info['Title'])
+        self.assertEqual(2, len(reader.pages()))
+
+
+class CountingFile(io.BytesIO):
+    """A file that counts the bytes read from it."""
+
+    bytes_read = 0
+
+    def read(self, size=-1):
+        data = io.BytesIO.read(self, size)
+        self.bytes_read += len(data)
+        return data
+
+
+class InfoStampTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.path = os.path.join(self.tmp_dir, 'test.pdf')
+
+    def write(self, data):
+        with open(self.path, 'wb') as fp:
+            fp.write(data)
+
+    def read(self):
+        with open(self.path, 'rb') as fp:
+            return fp.read()
+
+    def test_stamp_appends_update(self):
+        original = pdf.write_document(PAGES, dict(Title=u'Tést (1)', Author=u'me'))
+        self.write(original)
+        pdf.stamp_info(self.path, dict(Subject=u'OmnigraffleExportChecksum: 3c1f'))
+        data = self.read()
+        self.assertTrue(data.startswith(original))
+        self.assertEqual(dict(Title=u'Tést (1)', Author=u'me', Subject=u'OmnigraffleExportChecksum: 3c1f'),
+                         pdf.read_info(self.path))
+        reader = pdf.PDFReader(data)
+        self.assertEqual(2, len(reader.pages()))
+        self.assertEqual(b'(me)', reader.info['Author'])
+
+    def test_stamp_twice(self):
+        self.write(pdf.write_document(PAGES))
+        pdf.stamp_info(self.path, dict(Subject=u'one'))
+        pdf.stamp_info(self.path, dict(Subject=u'two', Keywords=u'ä'))
+        self.assertEqual(dict(Subject=u'two', Keywords=u'ä'), pdf.read_info(self.path))
+        self.assertEqual(2, pdf.page_count(self.read()))
+
+    def test_read_only_reads_the_end(self):
+        content = b'0 0 m 10 10 l S\n' * 50000
+        self.write(pdf.write_document([((0, 0, 100, 100), content)], dict(Title=u'big')))
+        pdf.stamp_info(self.path, dict(Subject=u'stamp'))
+        fp = CountingFile(self.read())
+        tail = pdf.PDFTail(fp)
+        self.assertEqual(b'(stamp)', tail.info()['Subject'])
+        self.assertTrue(fp.bytes_read < 4 * pdf.CHUNK_SIZE)
+        self.assertTrue(len(fp.getvalue()) > 100 * pdf.CHUNK_SIZE)
+
+    def test_decode_text(self):
+        self.assertEqual(u'a (b)\n\xe9', pdf.decode_text(b'(a \\(b\\)\\n\\351)'))
+        self.assertEqual(u'ab', pdf.decode_text(b'(a\\\nb)'))
+        self.assertEqual(u'\u2713', pdf.decode_text(b'<FEFF 2713>'))
+        self.assertEqual(u'\u2713', pdf.decode_text(pdf.serialize(pdf.String(u'\u2713'))))
+
+
+if __name__ == '__main__':
+    unittest.main()
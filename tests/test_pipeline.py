@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import unittest
+
+from omnigraffle.pipeline import Pipeline
+
+
+class PipelineTests(unittest.TestCase):
+
+    def test_tasks(self):
+        done = []
+        with Pipeline(workers=3) as pipeline:
+            for i in range(20):
+                pipeline.submit('file-%d' % i, done.append, i)
+        self.assertEqual(list(range(20)), sorted(done))
+        self.assertEqual([], pipeline.errors)
+
+    def test_errors_per_output(self):
+        def fail(i):
+            if i % 2:
+                raise IOError('cannot move %d' % i)
+
+        pipeline = Pipeline()
+        for i in range(4):
+            pipeline.submit('file-%d' % i, fail, i)
+        errors = pipeline.close()
+        self.assertEqual(['file-1', 'file-3'], sorted(output for output, error in errors))
+        self.assertTrue(isinstance(errors[0][1], IOError))
+        self.assertRaises(RuntimeError, pipeline.submit, 'file-5', fail, 5)
+
+    def test_wait(self):
+        done = []
+        pipeline = Pipeline(workers=1)
+        pipeline.submit('file', done.append, 1)
+        pipeline.wait()
+        self.assertEqual([1], done)
+        pipeline.close()
+
+    def test_bounded_queue(self):
+        release = threading.Event()
+        pipeline = Pipeline(workers=1, queue_size=1)
+        pipeline.submit('blocking', release.wait)
+        pipeline.submit('queued', lambda: None)
+        submitted = threading.Event()
+
+        def submit():
+            pipeline.submit('waiting', lambda: None)
+            submitted.set()
+        thread = threading.Thread(target=submit)
+        thread.start()
+        # the worker is busy and the queue is full
+        self.assertFalse(submitted.wait(0.1))
+        release.set()
+        self.assertTrue(submitted.wait(5))
+        thread.join()
+        pipeline.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+import gettext
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import polib
+
+from omnigraffle.po import MOFile, POTWriter, iter_translations, write_mo
+
+
+class POTWriterTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'test.pot')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_written_entries_are_read_by_polib(self):
+        entries = [
+            (u'simple', [u'a.graffle/canvas-1']),
+            (u'with "quotes" and a \\ backslash', [u'a.graffle/canvas-1', u'b.graffle/canvas-2']),
+            (u'two\nlines\n', [u'a.graffle/canvas-2']),
+            (u'tab\tand ümlaut ®', [u'b.graffle/c%d' % i for i in range(20)]),
+        ]
+        with io.open(self.path, 'w', encoding='utf-8') as fp:
+            writer = POTWriter(fp)
+            for text, locations in entries:
+                writer.write(text, occurrences=locations)
+        self.assertEqual(4, writer.count)
+
+        pot = polib.pofile(self.path)
+        self.assertEqual([text for text, dummy in entries], [e.msgid for e in pot])
+        self.assertEqual([text for text, dummy in entries], [e.msgstr for e in pot])
+        self.assertEqual([[(l, '0') for l in locations] for dummy, locations in entries],
+                         [e.occurrences for e in pot])
+
+    def test_msgstr_and_flags(self):
+        with io.open(self.path, 'w', encoding='utf-8') as fp:
+            POTWriter(fp).write(u'box', msgstr=u'Kasten', flags=['fuzzy'])
+        entry = polib.pofile(self.path)[0]
+        self.assertEqual(u'Kasten', entry.msgstr)
+        self.assertEqual(['fuzzy'], entry.flags)
+
+
+CATALOG = u'''# German translations
+msgid ""
+msgstr ""
+"Content-Type: text/plain; charset=UTF-8\\n"
+"Language: de\\n"
+
+#: a.graffle/canvas-1:0
+msgid "box"
+msgstr "Kasten"
+
+#: a.graffle/canvas-1:0 a.graffle/canvas-2:0
+#, c-format
+msgid ""
+"two\\n"
+"lines with \\"quotes\\" and \\\\ \\t"
+msgstr ""
+"zwei\\n"
+"Zeilen mit \\"Anführungszeichen\\""
+
+#, fuzzy
+msgid "fuzzy"
+msgstr "unscharf"
+
+msgid "untranslated"
+msgstr ""
+
+msgctxt "menu"
+msgid "open"
+msgstr "öffnen"
+msgid "one file"
+msgid_plural "%d files"
+msgstr[0] "eine Datei"
+msgstr[1] "%d Dateien"
+
+#, fuzzy
+#~ msgid "obsolete"
+#~ msgstr "veraltet"
+
+msgid "after obsolete"
+msgstr "nach veraltet"
+'''
+
+
+class ReaderTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'de.po')
+        with io.open(self.path, 'w', encoding='utf-8') as fp:
+            fp.write(CATALOG)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_translated_entries(self):
+        self.assertEqual([(u'box', u'Kasten', []),
+                          (u'two\nlines with "quotes" and \\ \t', u'zwei\nZeilen mit "Anführungszeichen"', [u'c-format']),
+                          (u'open', u'öffnen', []),
+                          (u'after obsolete', u'nach veraltet', [])],
+                         list(iter_translations(self.path)))
+
+    def test_same_translations_as_polib(self):
+        expected = dict((e.msgid, e.msgstr) for e in polib.pofile(self.path).translated_entries()
+                        if not e.obsolete and not e.msgid_plural)
+        self.assertEqual(expected, dict((msgid, msgstr) for msgid, msgstr, dummy in iter_translations(self.path)))
+
+    def test_read_what_was_written(self):
+        with io.open(self.path, 'w', encoding='utf-8') as fp:
+            writer = POTWriter(fp)
+            writer.write(u'a\nb\n', msgstr=u'c\r\n', occurrences=[u'x.graffle/c'])
+            writer.write(u'"\\"', msgstr=u'\\', occurrences=[u'x.graffle/c'])
+        self.assertEqual([(u'a\nb\n', u'c\r\n', []), (u'"\\"', u'\\', [])], list(iter_translations(self.path)))
+
+
+class MOFileTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'test.mo')
+        self.translations = dict((u'text %d' % i, u'Text %d' % i) for i in range(1000))
+        self.translations[u'ümlaut ®\nzwei Zeilen'] = u'umlaut'
+        write_mo(self.path, self.translations)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_lookup(self):
+        tm = MOFile(self.path)
+        self.assertEqual(len(self.translations), len(tm))
+        for msgid, msgstr in self.translations.items():
+            self.assertIn(msgid, tm)
+            self.assertEqual(msgstr, tm[msgid])
+        self.assertNotIn(u'missing', tm)
+        self.assertNotIn(u'', tm)
+        self.assertEqual(None, tm.get(u'missing'))
+        self.assertRaises(KeyError, lambda: tm[u'text 1000'])
+        # encoded text, e.g. a str on Python 2
+        self.assertEqual(u'umlaut', tm[u'ümlaut ®\nzwei Zeilen'.encode('utf-8')])
+        tm.close()
+
+    def test_readable_by_gettext(self):
+        with open(self.path, 'rb') as fp:
+            catalog = gettext.GNUTranslations(fp)
+        self.assertEqual(u'Text 7', catalog.ugettext(u'text 7') if hasattr(catalog, 'ugettext')
+                         else catalog.gettext(u'text 7'))
+        self.assertEqual(u'umlaut', catalog._catalog[u'ümlaut ®\nzwei Zeilen'])
+
+
+if __name__ == '__main__':
+    unittest.main()
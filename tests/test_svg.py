@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+from xml.dom import minidom
+
+from omnigraffle import svg
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+
+RTF = (u'{\\rtf1\\ansi\\ansicpg1252\\cocoartf1504\n{\\fonttbl\\f0\\fswiss\\fcharset0 Helvetica;}\n'
+       u'{\\colortbl;\\red255\\green255\\blue255;\\red255\\green0\\blue0;}\n'
+       u'\\pard\\qr\n\\f0\\fs24 \\cf2 first <line>\\\n\\b second}')
+
+
+def parse(text):
+    return minidom.parseString(text.encode('utf-8'))
+
+
+class RendererTests(unittest.TestCase):
+
+    def render(self, graphics, **sheet):
+        sheet.setdefault('GraphicsList', graphics)
+        sheet.setdefault('SheetTitle', 'canvas')
+        return svg.CanvasRenderer(sheet).render()
+
+    def test_shapes(self):
+        text = self.render([
+            {'Class': 'ShapedGraphic', 'ID': 1, 'Bounds': '{{10, 10}, {100, 50}}', 'Shape': 'Circle',
+             'Style': {'fill': {'Color': {'r': 1, 'g': 0, 'b': 0}}, 'shadow': {'Draws': 'NO'}}},
+            {'Class': 'ShapedGraphic', 'ID': 2, 'Bounds': '{{200, 10}, {100, 50}}', 'Shape': 'Diamond',
+             'Style': {'stroke': {'Width': 3, 'Pattern': 1}, 'shadow': {'Draws': 'NO'}}},
+            {'Class': 'ShapedGraphic', 'ID': 3, 'Bounds': '{{10, 100}, {100, 50}}',
+             'Style': {'fill': {'Draws': 'NO'}, 'stroke': {'CornerRadius': 5}}},
+        ])
+        doc = parse(text)
+        ellipse, = doc.getElementsByTagName('ellipse')
+        self.assertEqual('#ff0000', ellipse.getAttribute('fill'))
+        polygon, = doc.getElementsByTagName('polygon')
+        self.assertEqual('250,10 300,35 250,60 200,35', polygon.getAttribute('points'))
+        self.assertTrue(polygon.getAttribute('stroke-dasharray'))
+        rect, = doc.getElementsByTagName('rect')
+        self.assertEqual(('none', '5'), (rect.getAttribute('fill'), rect.getAttribute('rx')))
+        self.assertEqual(1, len(doc.getElementsByTagName('filter')))  # default shadow of the rectangle
+        # the view box covers all graphics
+        self.assertEqual('9.5 8.5 292 142', doc.documentElement.getAttribute('viewBox'))
+
+    def test_text(self):
+        text = self.render([{'Class': 'ShapedGraphic', 'ID': 1, 'Bounds': '{{0, 0}, {200, 100}}',
+                             'Text': {'Text': RTF}}])
+        doc = parse(text)
+        lines = doc.getElementsByTagName('text')
+        self.assertEqual([u'first <line>', u'second'],
+                         [''.join(n.firstChild.data for n in l.getElementsByTagName('tspan')) for l in lines])
+        self.assertEqual(['end', 'end'], [l.getAttribute('text-anchor') for l in lines])
+        first, second = [l.getElementsByTagName('tspan')[0] for l in lines]
+        self.assertEqual(('#ff0000', '12', 'Helvetica'), (first.getAttribute('fill'), first.getAttribute('font-size'),
+                                                          first.getAttribute('font-family')))
+        self.assertEqual('bold', second.getAttribute('font-weight'))
+
+    def test_wrap(self):
+        rtf = u'{\\rtf1\\ansi {\\fonttbl\\f0 Helvetica;}\\f0\\fs24 one two three four five six}'
+        text = self.render([{'Class': 'ShapedGraphic', 'ID': 1, 'Bounds': '{{0, 0}, {60, 100}}',
+                             'Text': {'Text': rtf}}])
+        self.assertTrue(len(parse(text).getElementsByTagName('text')) > 2)
+        text = self.render([{'Class': 'ShapedGraphic', 'ID': 1, 'Bounds': '{{0, 0}, {60, 100}}', 'Wrap': 'NO',
+                             'Text': {'Text': rtf}}])
+        self.assertEqual(1, len(parse(text).getElementsByTagName('text')))
+
+    def test_lines_and_groups(self):
+        text = self.render([
+            {'Class': 'LineGraphic', 'ID': 1, 'Points': ['{0, 0}', '{100, 0}', '{100, 100}'],
+             'Style': {'stroke': {'HeadArrow': 'FilledArrow', 'TailArrow': '0', 'Color': {'w': 0.5}}}},
+            {'Class': 'Group', 'ID': 2, 'Graphics': [
+                {'Class': 'ShapedGraphic', 'ID': 3, 'Bounds': '{{0, 0}, {10, 10}}'},
+                {'Class': 'ShapedGraphic', 'ID': 4, 'Bounds': '{{20, 0}, {10, 10}}'}]},
+        ])
+        doc = parse(text)
+        path, = doc.getElementsByTagName('path')
+        self.assertEqual('M0,0 L100,0 L100,100', path.getAttribute('d'))
+        self.assertEqual('url(#marker-filled-arrow-808080-end)', path.getAttribute('marker-end'))
+        self.assertFalse(path.getAttribute('marker-start'))
+        self.assertEqual(1, len(doc.getElementsByTagName('marker')))
+        group = [g for g in doc.getElementsByTagName('g') if g.getAttribute('data-id') == '2'][0]
+        # the first graphic of a group is in front, i.e. drawn last
+        self.assertEqual(['4', '3'], [g.getAttribute('data-id') for g in group.getElementsByTagName('g')])
+
+    def test_layers(self):
+        graphics = [{'Class': 'ShapedGraphic', 'ID': i, 'Layer': i, 'Bounds': '{{0, 0}, {10, 10}}'}
+                    for i in range(3)]
+        layers = [{'Name': 'top'}, {'Name': 'hidden', 'View': 'NO'}, {'Name': 'bottom'}]
+        master = {'SheetTitle': 'shared', 'Layers': [{'Name': 'x'}],
+                  'GraphicsList': [{'Class': 'ShapedGraphic', 'ID': 1, 'Bounds': '{{0, 0}, {5, 5}}'}]}
+        sheet = {'SheetTitle': 'canvas', 'GraphicsList': graphics, 'Layers': layers,
+                 'AllLayers': ['top', 'shared', 'hidden', 'bottom'], 'MasterSheet': 'shared'}
+        doc = parse(svg.CanvasRenderer(sheet, master).render())
+        self.assertEqual(['layer-bottom', 'layer-shared', 'layer-top'],
+                         [g.getAttribute('id') for g in doc.documentElement.childNodes
+                          if getattr(g, 'tagName', None) == 'g'])
+
+
+class DocumentTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+    def test_render_canvases(self):
+        source = os.path.join(TEST_DIR, 'translation-test.graffle')
+        document = svg.SVGDocument(source)
+        outputs = dict((name, os.path.join(self.tmp_dir, '%s.svg' % name)) for name in document.canvases())
+        self.assertEqual(3, len(outputs))
+        svg.render_canvases(source, outputs, processes=2)
+        for name, output in outputs.items():
+            with open(output, 'rb') as fp:
+                doc = minidom.parse(fp)
+            self.assertEqual(name, doc.getElementsByTagName('title')[0].firstChild.data)
+        self.assertTrue(u'box in table' in document.render('test-for-tables'))
+
+    def test_embedded_images(self):
+        document = svg.SVGDocument(os.path.join(TEST_DIR, 'translation-test.graffle'))
+        self.assertEqual('image/png', svg.image_type(document.images([2])[2]))
+
+    def test_missing_canvas(self):
+        self.assertRaises(KeyError, svg.render_canvases, os.path.join(TEST_DIR, 'minimal.graffle'),
+                          {'missing': os.path.join(self.tmp_dir, 'missing.svg')})
+
+
+if __name__ == '__main__':
+    unittest.main()
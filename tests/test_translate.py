@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import polib
+
+from omnigraffle import graffle_file
+from omnigraffle.data_model import Document
+from omnigraffle.po import MOFile
+from ogtools import translate
+from ogtools.translate import MessageCache, OmniGraffleSandboxedTranslator, TranslationMemoryCache
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+SOURCE = os.path.join(TEST_DIR, 'translation-test.graffle')
+
+
+def attribute_runs(path):
+    """Return a list of (text, font, size) of all attribute runs in a document, read offline."""
+    runs = []
+
+    def collect(element):
+        if element.text:
+            attribute_runs = element.item.text.attribute_runs
+            for idx in range(len(attribute_runs)):
+                run = attribute_runs[idx]
+                runs.append((run.text(), run.font(), run.size()))
+    Document(graffle_file.load(path)).walk(collect)
+    return runs
+
+
+class OfflineTranslationTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.po = os.path.join(self.tmpdir, 'de.po')
+        self.cache_dir = os.path.join(self.tmpdir, 'tm')
+        po = polib.POFile()
+        po.append(polib.POEntry(msgid=u'Holacracy', msgstr=u'Holakratie'))
+        po.append(polib.POEntry(msgid=u'Primary Actors', msgstr=u'Hauptakteure'))
+        po.append(polib.POEntry(msgid=u'(Dynamic Governance,\n Circle Forward)',
+                                msgstr=u'(Dynamische Führung,\n Circle Forward)'))
+        po.append(polib.POEntry(msgid=u'Focus', msgstr=u''))  # untranslated
+        po.save(self.po)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def translate(self, *argv):
+        args = OmniGraffleSandboxedTranslator.get_parser().parse_args(
+            ['translate', '--offline', '--cache-dir', self.cache_dir] + list(argv))
+        translator = OmniGraffleSandboxedTranslator(args=args)
+        args.func(translator)
+
+    def test_translate_keeps_formatting(self):
+        target = os.path.join(self.tmpdir, 'translation-test-de.graffle')
+        self.translate(SOURCE, target, self.po)
+
+        original = attribute_runs(SOURCE)
+        translated = attribute_runs(target)
+        self.assertEqual(len(original), len(translated))
+        tm = {u'Holacracy': u'Holakratie', u'Primary Actors': u'Hauptakteure',
+              u'(Dynamic Governance,\n Circle Forward)': u'(Dynamische Führung,\n Circle Forward)'}
+        for (text, font, size), (new_text, new_font, new_size) in zip(original, translated):
+            self.assertEqual(tm.get(text, text), new_text)
+            self.assertEqual((font, size), (new_font, new_size))
+        self.assertIn(u'Holakratie', [text for text, dummy, dummy in translated])
+        self.assertIn(u'®', [text for text, dummy, dummy in translated])
+        self.assertIn(u'Focus', [text for text, dummy, dummy in translated])
+
+    def test_translate_folder_in_pool(self):
+        sources = os.path.join(self.tmpdir, 'src')
+        targets = os.path.join(self.tmpdir, 'de')
+        translations = os.path.join(self.tmpdir, 'po')
+        for d in (sources, targets, translations):
+            os.mkdir(d)
+        for name in ('one', 'two', 'three'):
+            shutil.copyfile(SOURCE, os.path.join(sources, name + '.graffle'))
+            shutil.copyfile(self.po, os.path.join(translations, name + '.po'))
+        self.translate(sources, targets, translations, '--processes', '2')
+
+        self.assertEqual(['one.graffle', 'three.graffle', 'two.graffle'], sorted(os.listdir(targets)))
+        for name in os.listdir(targets):
+            texts = [text for text, dummy, dummy in attribute_runs(os.path.join(targets, name))]
+            self.assertIn(u'Hauptakteure', texts)
+            self.assertNotIn(u'Primary Actors', texts)
+        # sources are unchanged
+        self.assertIn(u'Primary Actors', [t for t, dummy, dummy in attribute_runs(os.path.join(sources, 'one.graffle'))])
+
+    def test_translate_into_several_languages(self):
+        fr = os.path.join(self.tmpdir, 'fr.po')
+        po = polib.POFile()
+        po.append(polib.POEntry(msgid=u'Primary Actors', msgstr=u'Acteurs principaux'))
+        po.save(fr)
+        targets = os.path.join(self.tmpdir, 'out')
+        os.mkdir(targets)
+        self.translate(SOURCE, targets, 'de=' + self.po, 'fr=' + fr)
+
+        de_texts = [t for t, dummy, dummy in attribute_runs(os.path.join(targets, 'de', 'translation-test.graffle'))]
+        fr_texts = [t for t, dummy, dummy in attribute_runs(os.path.join(targets, 'fr', 'translation-test.graffle'))]
+        self.assertIn(u'Hauptakteure', de_texts)
+        self.assertIn(u'Holakratie', de_texts)
+        self.assertIn(u'Acteurs principaux', fr_texts)
+        # translations of the first language don't leak into the second
+        self.assertIn(u'Holacracy', fr_texts)
+        self.assertNotIn(u'Holakratie', fr_texts)
+
+    def test_translate_without_compiled_memory(self):
+        target = os.path.join(self.tmpdir, 'translation-test-de.graffle')
+        self.translate(SOURCE, target, self.po, '--no-cache')
+        self.assertIn(u'Hauptakteure', [t for t, dummy, dummy in attribute_runs(target)])
+        self.assertFalse(os.path.exists(self.cache_dir))
+
+    def test_translation_sources(self):
+        sources = OmniGraffleSandboxedTranslator.translation_sources
+        self.assertEqual([(None, 'all.po')], sources(['all.po']))
+        self.assertEqual([('de', 'text/de/'), ('fr', 'text/fr/')], sources(['de=text/de/', 'fr=text/fr/']))
+        self.assertRaises(ValueError, sources, ['text/de/', 'fr=text/fr/'])
+        self.assertRaises(ValueError, sources, ['de=text/de/', 'de=text/fr/'])
+
+
+class TranslationMemoryCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.po = os.path.join(self.tmpdir, 'all.po')
+        self.write_po(u'Kasten')
+        self.cache = TranslationMemoryCache(os.path.join(self.tmpdir, 'tm'),
+                                            read=OmniGraffleSandboxedTranslator.read_translation_memory)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write_po(self, msgstr):
+        po = polib.POFile()
+        po.append(polib.POEntry(msgid=u'box', msgstr=msgstr))
+        po.append(polib.POEntry(msgid=u'untranslated', msgstr=u''))
+        po.save(self.po)
+
+    def test_compile_once(self):
+        tm = MOFile(self.cache.compile(self.po))
+        self.assertEqual(u'Kasten', tm[u'box'])
+        self.assertNotIn(u'untranslated', tm)
+        self.cache.compile(self.po)
+        self.assertEqual(1, self.cache.compiled)
+        # stamp and MO file are written atomically, no temporary files are left
+        self.assertEqual(2, len(os.listdir(os.path.join(self.tmpdir, 'tm'))))
+
+    def test_touched_po_file_is_not_compiled_again(self):
+        self.cache.compile(self.po)
+        st = os.stat(self.po)
+        os.utime(self.po, (st.st_atime, st.st_mtime + 10))
+        self.cache.compile(self.po)
+        self.assertEqual(1, self.cache.compiled)
+
+    def test_changed_po_file_is_compiled_again(self):
+        self.cache.compile(self.po)
+        self.write_po(u'Schachtel')
+        st = os.stat(self.po)
+        os.utime(self.po, (st.st_atime, st.st_mtime + 10))
+        self.assertEqual(u'Schachtel', MOFile(self.cache.compile(self.po))[u'box'])
+        self.assertEqual(2, self.cache.compiled)
+
+    def test_worker_opens_compiled_memories(self):
+        path = u'%s' % self.cache.compile(self.po)  # unicode on Python 2
+        translate._init_worker({self.po: path, 'other.po': {u'box': u'Box'}})
+        self.addCleanup(setattr, translate, '_memories', {})
+        self.assertEqual(u'Kasten', translate._memories[self.po][u'box'])
+        self.assertEqual(u'Box', translate._memories['other.po'][u'box'])
+
+
+class ExtractionTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmpdir, 'cache')
+        self.src = os.path.join(self.tmpdir, 'src')
+        os.mkdir(self.src)
+        for name in ('one', 'two', 'three'):
+            shutil.copyfile(SOURCE, os.path.join(self.src, name + '.graffle'))
+        self.pot = os.path.join(self.tmpdir, 'project.pot')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def extract(self, *argv):
+        args = OmniGraffleSandboxedTranslator.get_parser().parse_args(
+            ['extract', '--offline', '--cache-dir', self.cache_dir] + list(argv))
+        translator = OmniGraffleSandboxedTranslator(args=args)
+        args.func(translator)
+        return dict((entry.msgid, entry) for entry in polib.pofile(self.pot))
+
+    def test_extract_single_document(self):
+        source = os.path.join(self.src, 'one.graffle')
+        args = OmniGraffleSandboxedTranslator.get_parser().parse_args(
+            ['extract', '--offline', '--no-cache', source])
+        args.func(OmniGraffleSandboxedTranslator(args=args))
+        pot = polib.pofile(os.path.join(self.src, 'one.pot'))
+        self.assertIn(u'Primary Actors', [entry.msgid for entry in pot])
+        self.assertFalse(os.path.exists(self.cache_dir))
+
+    def test_merge_documents_in_parallel(self):
+        entries = self.extract(self.src, '-o', self.pot, '--processes', '2')
+        self.assertEqual(len(set(entries)), len(entries))  # each text once
+        locations = [location for location, dummy in entries[u'Primary Actors'].occurrences]
+        self.assertEqual(['one.graffle', 'three.graffle', 'two.graffle'],
+                         sorted(set(location.split('/')[0] for location in locations)))
+
+    def test_glob_patterns(self):
+        entries = self.extract(os.path.join(self.src, 't*.graffle'), '-o', self.pot)
+        locations = [location for location, dummy in entries[u'Primary Actors'].occurrences]
+        self.assertEqual(['three.graffle', 'two.graffle'],
+                         sorted(set(location.split('/')[0] for location in locations)))
+
+    def test_canvas(self):
+        everything = self.extract(self.src, '-o', self.pot)
+        locations = set(location for entry in everything.values() for location, dummy in entry.occurrences)
+        canvas = sorted(location.split('/', 1)[1] for location in locations)[0]
+        entries = self.extract(self.src, '-o', self.pot, '--canvas', canvas)
+        self.assertTrue(0 < len(entries) < len(everything))
+        for entry in entries.values():
+            self.assertEqual(set([canvas]), set(location.split('/', 1)[1] for location, dummy in entry.occurrences))
+
+    def test_unchanged_documents_are_read_from_cache(self):
+        self.extract(self.src, '-o', self.pot)
+        # all copies have the same contents, so there is one cache entry
+        cache = MessageCache(self.cache_dir)
+        path = cache.path(cache.key(os.path.join(self.src, 'one.graffle')))
+        self.assertTrue(os.path.isfile(path))
+        messages = cache.get(os.path.join(self.src, 'one.graffle'))
+        messages[u'only in the cache'] = [u'canvas-x']
+        cache.put(os.path.join(self.src, 'one.graffle'), messages)
+
+        entries = self.extract(self.src, '-o', self.pot)
+        self.assertIn(u'only in the cache', entries)
+        entries = self.extract(self.src, '-o', self.pot, '--no-cache')
+        self.assertNotIn(u'only in the cache', entries)
+
+
+if __name__ == '__main__':
+    unittest.main()